@@ -11,6 +11,14 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'proyectoIntegrado.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.PRECOMPILAR_PLANTILLAS:
+    # Que la primera petición de cada worker no pague la compilación.
+    from core.plantillas import precompilar  # noqa: E402
+
+    precompilar()
@@ -44,7 +44,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Opcional (INSTRUMENTACION); desactivado se retira solo de la cadena.
+    'core.instrumentacion.InstrumentacionMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Opcional (SERVIR_ESTATICOS): sirve STATIC_ROOT sin un servidor web delante.
+    'core.estaticos.EstaticosMiddleware',
+    # Solo con réplicas (REPLICAS_LECTURA); antes de SessionMiddleware para ver
+    # también la escritura de la sesión.
+    'core.routers.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -78,22 +85,95 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
+# ENGINE core.bd.mysql es el backend MySQL de Django con un pool de conexiones
+# opcional (core/bd/pool.py, DB_POOL > 0). CONN_MAX_AGE mantiene la conexión
+# de cada hilo entre peticiones y CONN_HEALTH_CHECKS la comprueba al empezar
+# cada petición en vez de fallar con "MySQL server has gone away". Con pool,
+# CONN_MAX_AGE=0 devuelve la conexión al pool al terminar cada petición.
 import pymysql
 pymysql.install_as_MySQLdb()
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'core.bd.mysql',
         'NAME': config('DB_NAME', default='proyectoIntegradoDB'),
         'USER': config('DB_USER', default='root'),
         'PASSWORD': config('DB_PASSWORD', default=''),
         'HOST': config('DB_HOST', default='localhost'),
         'PORT': config('DB_PORT', default='3306'),
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        'POOL': {
+            'tamano': config('DB_POOL', default=0, cast=int),
+            'espera': config('DB_POOL_ESPERA', default=5, cast=float),
+        },
         'OPTIONS': {
             'sql_mode': 'STRICT_TRANS_TABLES',
         }
     }
 }
 
+# Réplicas de solo lectura (core/routers.py): DB_REPLICA_HOSTS=host1,host2:3307.
+# Durante las peticiones las lecturas van a una réplica y las escrituras a
+# `default`; tras escribir, el usuario lee de `default` REPLICAS_FIJAR_SEGUNDOS.
+REPLICAS_LECTURA = []
+for numero, servidor in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), start=1):
+    host, _, puerto = servidor.partition(':')
+    DATABASES[f'replica_{numero}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': puerto or DATABASES['default']['PORT'],
+        'USER': config('DB_REPLICA_USER', default=DATABASES['default']['USER']),
+        'PASSWORD': config('DB_REPLICA_PASSWORD', default=DATABASES['default']['PASSWORD']),
+        'POOL': dict(DATABASES['default']['POOL']),
+        # En los tests las réplicas son la propia base de prueba.
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICAS_LECTURA.append(f'replica_{numero}')
+# 'turno' (round-robin) o 'menor_retraso'.
+REPLICAS_ESTRATEGIA = config('DB_REPLICAS_ESTRATEGIA', default='turno')
+# Segundos de retraso a partir de los que una réplica deja de usarse.
+REPLICAS_RETRASO_MAXIMO = config('DB_REPLICAS_RETRASO_MAXIMO', default=10, cast=float)
+REPLICAS_FIJAR_SEGUNDOS = config('DB_REPLICAS_FIJAR_SEGUNDOS', default=5, cast=int)
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# En producción con varios procesos conviene un backend compartido (por
+# ejemplo FileBasedCache o Memcached) para que las invalidaciones lleguen a
+# todos los workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='marketplace'),
+    }
+}
+
+# Broker del chat en tiempo real (core/chat.py). MemoryBroker solo reparte
+# avisos dentro de un proceso; con varios workers usa core.chat.SondeoBroker.
+# SSE y long-poll solo se usan con ASGI (config/asgi.py). Con WSGI (gunicorn
+# con workers sync) una petición que espera retiene un worker entero, así que
+# el chat sondea cada CHAT_INTERVALO_SONDEO segundos sin esperar en el servidor.
+CHAT_BROKER = config('CHAT_BROKER', default='core.chat.MemoryBroker')
+CHAT_INTERVALO_SONDEO = config('CHAT_INTERVALO_SONDEO', default=3, cast=int)
+
+# Cómo se procesan las notificaciones encoladas (core/notificaciones.py):
+# 'hilo', 'worker' (manage.py procesar_notificaciones) o 'inmediato'.
+NOTIFICACIONES_EJECUTOR = config('NOTIFICACIONES_EJECUTOR', default='hilo')
+NOTIFICACIONES_LOTE = config('NOTIFICACIONES_LOTE', default=1000, cast=int)
+
+# Cómo se generan las derivadas WebP/AVIF de las imágenes (core/imagenes.py):
+# 'hilo', 'worker' (manage.py generar_derivadas_imagenes) o 'inmediato'.
+IMAGENES_EJECUTOR = config('IMAGENES_EJECUTOR', default='hilo')
+
+# Cabecera Server-Timing e histogramas por vista (core/instrumentacion.py).
+INSTRUMENTACION = config('INSTRUMENTACION', default=False, cast=bool)
+
+
+# models.W037: MySQL ignora los índices parciales (con `condition`) de
+# core.models; allí se usan los índices compuestos equivalentes.
+SILENCED_SYSTEM_CHECKS = ['models.W037']
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -136,6 +216,12 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Servir STATIC_ROOT desde el propio proceso (core/estaticos.py) y compilar
+# todas las plantillas al arrancar (core/plantillas.py). Los activa el perfil
+# de producción, config/settings_produccion.py.
+SERVIR_ESTATICOS = config('SERVIR_ESTATICOS', default=False, cast=bool)
+PRECOMPILAR_PLANTILLAS = config('PRECOMPILAR_PLANTILLAS', default=False, cast=bool)
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
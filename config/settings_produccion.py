@@ -0,0 +1,43 @@
+"""
+Perfil de producción: DJANGO_SETTINGS_MODULE=config.settings_produccion.
+
+Lee las mismas variables de entorno que config/settings.py, pero no depende
+de los valores por defecto que cambian con DEBUG (que allí es True):
+
+- Plantillas con el cached loader declarado de forma explícita y
+  precompiladas al arrancar cada proceso (core/plantillas.py).
+- Estáticos con hash en el nombre y variantes .gz/.br generadas por
+  collectstatic (core/estaticos.py). Requiere `manage.py collectstatic`
+  en cada despliegue: sin staticfiles.json, `{% static %}` falla.
+- SERVIR_ESTATICOS=True: el propio proceso sirve STATIC_ROOT con caché de
+  un año para los nombres con hash. Con un servidor web o una CDN delante,
+  puede desactivarse y servir STATIC_ROOT desde allí.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import TEMPLATES, config
+
+DEBUG = config('DEBUG', default=False, cast=bool)
+
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        # Con 'loaders' explícitos APP_DIRS debe ser False; app_directories lo sustituye.
+        'APP_DIRS': False,
+        'OPTIONS': {
+            **TEMPLATES[0]['OPTIONS'],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    },
+]
+PRECOMPILAR_PLANTILLAS = config('PRECOMPILAR_PLANTILLAS', default=True, cast=bool)
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'core.estaticos.EstaticosComprimidosStorage'},
+}
+SERVIR_ESTATICOS = config('SERVIR_ESTATICOS', default=True, cast=bool)
@@ -19,8 +19,10 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings   
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    # core.urls va primero: define /admin/dashboard/, que el admin de Django
+    # capturaría con su propio 404.
     path('', include('core.urls')),
+    path('admin/', admin.site.urls),
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -11,6 +11,14 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'proyectoIntegrado.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.PRECOMPILAR_PLANTILLAS:
+    # Que la primera petición de cada worker no pague la compilación.
+    from core.plantillas import precompilar  # noqa: E402
+
+    precompilar()
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Perfil, Tienda, Producto, Categoria, Pedido, ResenaDeProducto, Favorito, Notificacion
+from .models import (
+    Perfil, Tienda, Producto, Categoria, Pedido, ResenaDeProducto, Favorito, Notificacion, TareaNotificacion,
+    SoporteTicket, ReporteAbuso,
+)
 
 @admin.register(Perfil)
 class PerfilAdmin(admin.ModelAdmin):
@@ -37,9 +40,9 @@ class PedidoAdmin(admin.ModelAdmin):
 
 @admin.register(ResenaDeProducto)
 class ResenaDeProductoAdmin(admin.ModelAdmin):
-    list_display = ('producto', 'autor', 'calificacion', 'activa', 'fecha_creacion')
+    list_display = ('producto', 'autor', 'calificacion', 'activa', 'aprobada', 'fecha_creacion')
     search_fields = ('producto__nombre', 'autor__username')
-    list_filter = ('activa', 'calificacion', 'fecha_creacion')
+    list_filter = ('aprobada', 'activa', 'calificacion', 'fecha_creacion')
 
 
 @admin.register(Favorito)
@@ -53,3 +56,24 @@ class NotificacionAdmin(admin.ModelAdmin):
     list_display = ('usuario', 'mensaje', 'leida', 'fecha_creacion')
     search_fields = ('usuario__username', 'mensaje')
     list_filter = ('leida', 'fecha_creacion')
+
+
+@admin.register(TareaNotificacion)
+class TareaNotificacionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'usuario', 'tienda', 'tipo', 'estado', 'intentos', 'fecha_creacion')
+    list_filter = ('estado', 'tipo')
+    readonly_fields = ('ultimo_id', 'intentos', 'error')
+
+
+@admin.register(SoporteTicket)
+class SoporteTicketAdmin(admin.ModelAdmin):
+    list_display = ('id', 'usuario', 'asunto', 'estado', 'fecha_creacion')
+    search_fields = ('usuario__username', 'asunto')
+    list_filter = ('estado',)
+
+
+@admin.register(ReporteAbuso)
+class ReporteAbusoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'reportante', 'content_type', 'object_id', 'estado', 'fecha_creacion')
+    search_fields = ('reportante__username', 'motivo')
+    list_filter = ('estado', 'content_type')
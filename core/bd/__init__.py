@@ -0,0 +1,5 @@
+"""
+Backends de base de datos del proyecto: los de Django más un pool de
+conexiones opcional (core/bd/pool.py). ENGINE 'core.bd.mysql' o
+'core.bd.sqlite3'.
+"""
@@ -0,0 +1,13 @@
+"""Backend MySQL de Django con el pool opcional de core/bd/pool.py (ENGINE 'core.bd.mysql')."""
+from django.db.backends.mysql import base
+
+from ..pool import PoolMixin
+
+
+class DatabaseWrapper(PoolMixin, base.DatabaseWrapper):
+    def conexion_usable(self, conexion):
+        try:
+            conexion.ping()
+        except base.Database.Error:
+            return False
+        return True
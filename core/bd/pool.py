@@ -0,0 +1,162 @@
+"""
+Pool de conexiones en el proceso para los backends de core.bd.
+
+Django 4.2 no trae pool para MySQL. Con CONN_MAX_AGE cada hilo conserva su
+propia conexión, lo que sirve con un número fijo de hilos (gunicorn con
+workers sync o gthread) pero no con servidores que crean un hilo por
+petición: cada hilo nuevo vuelve a conectar. El pool comparte las conexiones
+abiertas entre todos los hilos del proceso:
+
+- Al conectar, el DatabaseWrapper toma una conexión libre (la última
+  devuelta, que es la que menos probablemente haya cerrado el servidor) o
+  abre una nueva si hay menos de `tamano`. Si no, espera hasta `espera`
+  segundos y luego lanza OperationalError.
+- Al cerrar (fin de petición con CONN_MAX_AGE=0, o conexión caducada), la
+  devuelve al pool tras un ROLLBACK en vez de cerrarla.
+- Una conexión que llevaba más de `verificar_tras` segundos libre se
+  comprueba antes de entregarla; si falla, se descarta y se abre otra.
+
+Se activa con DATABASES[alias]['POOL'] = {'tamano': N, ...}. Sin 'POOL' (o
+con tamano 0) el backend se comporta exactamente como el de Django. Las
+variables de sesión y tablas temporales sobreviven entre peticiones: el
+código de la aplicación no debe depender de ellas.
+"""
+import contextlib
+import functools
+import threading
+import time
+
+from django.db import OperationalError
+from django.utils.functional import cached_property
+
+ESPERA = 5
+VERIFICAR_TRAS = 30
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class Pool:
+    def __init__(self, tamano, espera=ESPERA, verificar_tras=VERIFICAR_TRAS):
+        self.tamano = tamano
+        self.espera = espera
+        self.verificar_tras = verificar_tras
+        self._libres = []  # (conexión, momento en que se devolvió), LIFO
+        self._abiertas = 0
+        self._condicion = threading.Condition()
+
+    def obtener(self, crear, usable):
+        """Una conexión libre (comprobada con `usable` si lleva tiempo sin usarse) o una nueva de `crear()`."""
+        limite = time.monotonic() + self.espera
+        with self._condicion:
+            while not self._libres and self._abiertas >= self.tamano:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise OperationalError(f"No hay conexiones libres en el pool ({self.tamano} en uso).")
+                self._condicion.wait(restante)
+            if self._libres:
+                conexion, devuelta = self._libres.pop()
+            else:
+                conexion, devuelta = None, None
+                self._abiertas += 1
+
+        if conexion is not None:
+            if time.monotonic() - devuelta < self.verificar_tras or usable(conexion):
+                return conexion
+            # Cerrada por el servidor: se reemplaza sin liberar el hueco.
+            _cerrar(conexion)
+        try:
+            return crear()
+        except BaseException:
+            self._liberar_hueco()
+            raise
+
+    def devolver(self, conexion):
+        with self._condicion:
+            self._libres.append((conexion, time.monotonic()))
+            self._condicion.notify()
+
+    def descartar(self, conexion):
+        _cerrar(conexion)
+        self._liberar_hueco()
+
+    def vaciar(self):
+        """Cierra las conexiones libres (las que están en uso se cierran al devolverlas)."""
+        with self._condicion:
+            libres, self._libres = self._libres, []
+            self._abiertas -= len(libres)
+            self._condicion.notify_all()
+        for conexion, _ in libres:
+            _cerrar(conexion)
+
+    def estado(self):
+        with self._condicion:
+            return {'abiertas': self._abiertas, 'libres': len(self._libres), 'tamano': self.tamano}
+
+    def _liberar_hueco(self):
+        with self._condicion:
+            self._abiertas -= 1
+            self._condicion.notify()
+
+
+def _cerrar(conexion):
+    try:
+        conexion.close()
+    except Exception:
+        pass
+
+
+def pool_de(alias, opciones):
+    """El Pool del proceso para `alias` (se crea la primera vez)."""
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = Pool(
+                opciones['tamano'], opciones.get('espera', ESPERA), opciones.get('verificar_tras', VERIFICAR_TRAS),
+            )
+        return _pools[alias]
+
+
+def vaciar_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.vaciar()
+
+
+class PoolMixin:
+    """Para el DatabaseWrapper de un backend: conectar toma del pool y cerrar devuelve a él."""
+
+    @cached_property
+    def pool(self):
+        opciones = self.settings_dict.get('POOL') or {}
+        return pool_de(self.alias, opciones) if opciones.get('tamano') else None
+
+    def conexion_usable(self, conexion):
+        """¿Sigue viva la conexión DB-API `conexion`? Los backends pueden usar algo más barato (MySQL: ping)."""
+        try:
+            with contextlib.closing(conexion.cursor()) as cursor:
+                cursor.execute('SELECT 1')
+        except self.Database.Error:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        crear = functools.partial(super().get_new_connection, conn_params)
+        if self.pool is None:
+            return crear()
+        return self.pool.obtener(crear, self.conexion_usable)
+
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super()._close()
+        conexion = self.connection
+        try:
+            # Nada de una transacción a medias llega a la siguiente petición.
+            conexion.rollback()
+        except Exception:
+            self.pool.descartar(conexion)
+            return
+        if self.errors_occurred and not self.conexion_usable(conexion):
+            self.pool.descartar(conexion)
+        else:
+            self.pool.devolver(conexion)
@@ -0,0 +1,12 @@
+"""
+Backend SQLite de Django con el pool opcional de core/bd/pool.py (ENGINE
+'core.bd.sqlite3'). Sirve para reproducir en local el comportamiento del
+pool de MySQL (tests y `manage.py medir_conexiones`).
+"""
+from django.db.backends.sqlite3 import base
+
+from ..pool import PoolMixin
+
+
+class DatabaseWrapper(PoolMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,10 @@
+"""
+Benchmark del marketplace.
+
+`datos` siembra un marketplace sintético con bulk_create a la escala pedida;
+`carga` lanza peticiones concurrentes contra las vistas (con el cliente de
+pruebas de Django o contra un servidor WSGI local) y resume latencias,
+consultas por petición y throughput. Se usa desde
+`manage.py medir_rendimiento`, que guarda los resultados en JSON para
+compararlos entre commits.
+"""
@@ -0,0 +1,223 @@
+"""
+Generador de carga.
+
+Cada escenario es una lista de URLs que se piden en rueda, con un rol de
+usuario (o anónimo). Las URLs marcadas con Post se piden con un POST vacío. `medir()` reparte las peticiones entre `concurrencia`
+hilos; cada hilo tiene su propio cliente y su propia conexión a la base de
+datos. Los clientes (y sus sesiones) se crean en el hilo principal antes de
+arrancar los demás: con SQLite, varios hilos escribiendo sesiones a la vez
+chocan con el bloqueo de la base. Las consultas se cuentan con `connection.execute_wrapper` alrededor
+de cada petición, en el hilo que la atiende.
+"""
+import math
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import HTTPRedirectHandler, Request, build_opener
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection, connections
+from django.middleware.csrf import get_token
+from django.test import Client, RequestFactory
+
+CABECERA_CONSULTAS = 'X-Benchmark-Consultas'
+
+
+class Post(str):
+    """URL de un escenario que se pide con POST (las vistas que escriben no aceptan GET)."""
+
+
+class ContadorConsultas:
+    def __init__(self):
+        self.consultas = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas += 1
+        return execute(sql, params, many, context)
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not valores:
+        return None
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+def resumir(muestras, duracion):
+    """muestras: lista de (latencia_s, status, consultas) en orden de llegada."""
+    latencias = sorted(latencia * 1000 for latencia, _, _ in muestras)
+    consultas = [n for _, _, n in muestras if n is not None]
+    return {
+        'peticiones': len(muestras),
+        'errores': sum(1 for _, status, _ in muestras if status >= 500),
+        'p50_ms': round(percentil(latencias, 50), 2),
+        'p95_ms': round(percentil(latencias, 95), 2),
+        'p99_ms': round(percentil(latencias, 99), 2),
+        'media_ms': round(sum(latencias) / len(latencias), 2),
+        'consultas_media': round(sum(consultas) / len(consultas), 2) if consultas else None,
+        'consultas_max': max(consultas) if consultas else None,
+        'throughput_rps': round(len(muestras) / duracion, 2) if duracion else None,
+    }
+
+
+class ClienteDjango:
+    """Peticiones en el mismo proceso con el cliente de pruebas, sin red ni servidor."""
+
+    def __init__(self, usuario=None):
+        self.client = Client(raise_request_exception=False)
+        if usuario is not None:
+            self.client.force_login(usuario)
+
+    def pedir(self, url):
+        contador = ContadorConsultas()
+        with connection.execute_wrapper(contador):
+            response = self.client.post(url) if isinstance(url, Post) else self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response.status_code, contador.consultas
+
+    def cerrar(self):
+        connections.close_all()
+
+
+class _AplicacionContada:
+    """Envuelve la aplicación WSGI para devolver el número de consultas en una cabecera."""
+
+    def __init__(self):
+        self.aplicacion = WSGIHandler()
+
+    def __call__(self, environ, start_response):
+        contador = ContadorConsultas()
+        respuesta = {}
+
+        def capturar(status, headers, exc_info=None):
+            respuesta['status'], respuesta['headers'] = status, headers
+
+        with connection.execute_wrapper(contador):
+            cuerpo = b''.join(self.aplicacion(environ, capturar))
+        start_response(respuesta['status'], respuesta['headers'] + [(CABECERA_CONSULTAS, str(contador.consultas))])
+        return [cuerpo]
+
+
+class _ManejadorSilencioso(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class ServidorLocal:
+    """Servidor WSGI con hilos en 127.0.0.1 y un puerto libre, como runserver."""
+
+    def __init__(self):
+        self.servidor = ThreadedWSGIServer(('127.0.0.1', 0), _ManejadorSilencioso)
+        self.servidor.set_app(_AplicacionContada())
+        self.hilo = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+
+    @property
+    def url_base(self):
+        host, puerto = self.servidor.server_address[:2]
+        return f'http://{host}:{puerto}'
+
+    def __enter__(self):
+        self.hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+class _SinRedirecciones(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class ClienteHTTP:
+    """Peticiones reales por HTTP contra un ServidorLocal."""
+
+    def __init__(self, url_base, usuario=None):
+        self.url_base = url_base
+        self.opener = build_opener(_SinRedirecciones)
+        # Token CSRF propio para los POST, como el que recibiría un navegador.
+        request = RequestFactory().get('/')
+        self.csrf = get_token(request)
+        cookies = [f"{settings.CSRF_COOKIE_NAME}={request.META['CSRF_COOKIE']}"]
+        if usuario is not None:
+            client = Client()
+            client.force_login(usuario)
+            cookies.append(f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}')
+        self.cookie = '; '.join(cookies)
+
+    def pedir(self, url):
+        if isinstance(url, Post):
+            peticion = Request(self.url_base + url, data=b'', method='POST')
+            peticion.add_header('X-CSRFToken', self.csrf)
+        else:
+            peticion = Request(self.url_base + url)
+        peticion.add_header('Cookie', self.cookie)
+        try:
+            with self.opener.open(peticion) as response:
+                response.read()
+                status, cabeceras = response.status, response.headers
+        except HTTPError as e:
+            # Las redirecciones y los errores llegan como excepción.
+            e.read()
+            status, cabeceras = e.code, e.headers
+        consultas = cabeceras.get(CABECERA_CONSULTAS)
+        return status, int(consultas) if consultas is not None else None
+
+    def cerrar(self):
+        connections.close_all()
+
+
+def medir(crear_cliente, urls, peticiones, concurrencia=1, calentamiento=0):
+    """
+    Pide `peticiones` URLs (en rueda sobre `urls`) con `concurrencia` hilos.
+    Devuelve el resumen más la latencia de la primera petición, que paga las
+    cachés frías (plantillas, caché de Django, conexión).
+    """
+    primero = crear_cliente()
+    inicio = time.perf_counter()
+    primera_status, _ = primero.pedir(urls[0])
+    primera = (time.perf_counter() - inicio) * 1000
+    for i in range(calentamiento):
+        primero.pedir(urls[i % len(urls)])
+
+    muestras = []
+    errores = []
+    siguiente = iter(range(peticiones))
+    lock = threading.Lock()
+
+    def trabajar(cliente):
+        try:
+            while True:
+                with lock:
+                    i = next(siguiente, None)
+                if i is None:
+                    return
+                t0 = time.perf_counter()
+                status, consultas = cliente.pedir(urls[i % len(urls)])
+                latencia = time.perf_counter() - t0
+                with lock:
+                    muestras.append((latencia, status, consultas))
+        except Exception as e:
+            # Un hilo que muere en silencio dejaría el resumen con menos muestras.
+            with lock:
+                errores.append(e)
+        finally:
+            cliente.cerrar()
+
+    clientes = [crear_cliente() for _ in range(concurrencia)]
+    hilos = [threading.Thread(target=trabajar, args=(cliente,)) for cliente in clientes]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    if errores:
+        raise errores[0]
+    resumen = resumir(muestras, time.perf_counter() - inicio)
+    resumen['primera_ms'] = round(primera, 2)
+    resumen['primera_status'] = primera_status
+    return resumen
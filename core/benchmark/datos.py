@@ -0,0 +1,193 @@
+"""
+Siembra de un marketplace sintético.
+
+Todo se inserta con bulk_create por lotes, así que no se disparan señales:
+los agregados de calificación, el índice de búsqueda y el último mensaje de
+cada conversación se reconstruyen al final con las mismas rutinas que usan
+los comandos de mantenimiento. Los ids se releen de la base de datos en vez
+de confiar en que bulk_create los devuelva (MySQL no lo hace).
+"""
+import random
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from ..models import (
+    Categoria, Conversacion, Favorito, MensajeChat, Notificacion, Pedido, Perfil, Producto,
+    ResenaDeProducto, SeguirTienda, Tienda,
+)
+
+PREFIJO = 'bench'
+CLAVE = 'bench-clave-123'
+
+ESCALAS = {
+    'pequena': {
+        'tiendas': 20, 'productos': 1000, 'compradores': 200, 'resenas': 3, 'seguidores': 20,
+        'pedidos': 2000, 'conversaciones': 50, 'mensajes': 20, 'notificaciones': 200,
+    },
+    'mediana': {
+        'tiendas': 200, 'productos': 20000, 'compradores': 2000, 'resenas': 5, 'seguidores': 100,
+        'pedidos': 40000, 'conversaciones': 300, 'mensajes': 50, 'notificaciones': 2000,
+    },
+    'grande': {
+        'tiendas': 2000, 'productos': 200000, 'compradores': 20000, 'resenas': 5, 'seguidores': 500,
+        'pedidos': 400000, 'conversaciones': 1000, 'mensajes': 100, 'notificaciones': 10000,
+    },
+    # Para los escenarios catalogo_pagina_N: el catálogo grande, el resto modesto.
+    'millon': {
+        'tiendas': 2000, 'productos': 1000000, 'compradores': 5000, 'resenas': 1, 'seguidores': 20,
+        'pedidos': 50000, 'conversaciones': 100, 'mensajes': 20, 'notificaciones': 1000,
+    },
+}
+
+CATEGORIAS = ('Cerámica', 'Textil', 'Madera', 'Joyería', 'Cestería', 'Cuero', 'Vidrio', 'Metal')
+PALABRAS = (
+    'greda', 'lana', 'telar', 'roble', 'cobre', 'plata', 'mimbre', 'alpaca', 'raulí', 'cuarzo',
+    'jarro', 'manta', 'cuenco', 'collar', 'canasto', 'poncho', 'tabla', 'aros', 'fuente', 'chal',
+)
+
+
+def sembrado():
+    return Categoria.objects.filter(slug=f'{PREFIJO}-0').exists()
+
+
+def usuarios_de_prueba():
+    """Usuarios fijos que usa el benchmark para las vistas con sesión."""
+    return {
+        'comprador': User.objects.get(username=f'{PREFIJO}-comprador-0'),
+        'artesano': User.objects.get(username=f'{PREFIJO}-artesano-0'),
+        'staff': User.objects.get(username=f'{PREFIJO}-staff'),
+    }
+
+
+def _ids(modelo, **filtros):
+    return list(modelo.objects.filter(**filtros).order_by('pk').values_list('pk', flat=True))
+
+
+def _insertar(modelo, objetos, lote):
+    with transaction.atomic():
+        modelo.objects.bulk_create(objetos, batch_size=lote)
+
+
+def sembrar(escala, lote=1000, semilla=1, log=print):
+    """Siembra el marketplace con los tamaños de `escala` (un dict como los de ESCALAS)."""
+    rnd = random.Random(semilla)
+    clave = make_password(CLAVE)
+
+    def crear_usuarios(tipo, n, **extra):
+        _insertar(User, [
+            User(username=f'{PREFIJO}-{tipo}-{i}', email=f'{tipo}{i}@bench.test', password=clave, **extra)
+            for i in range(n)
+        ], lote)
+        return _ids(User, username__startswith=f'{PREFIJO}-{tipo}-')
+
+    log("Usuarios y perfiles...")
+    artesanos = crear_usuarios('artesano', escala['tiendas'])
+    compradores = crear_usuarios('comprador', escala['compradores'])
+    User.objects.create_user(username=f'{PREFIJO}-staff', password=CLAVE, is_staff=True, is_superuser=True)
+    _insertar(Perfil, [Perfil(user_id=pk, rol='artesano') for pk in artesanos], lote)
+    _insertar(Perfil, [Perfil(user_id=pk, rol='comprador') for pk in compradores], lote)
+
+    log("Categorías y tiendas...")
+    _insertar(Categoria, [
+        Categoria(nombre=f'{nombre} (bench)', slug=f'{PREFIJO}-{i}') for i, nombre in enumerate(CATEGORIAS)
+    ], lote)
+    categorias = _ids(Categoria, slug__startswith=f'{PREFIJO}-')
+    perfiles = _ids(Perfil, user_id__in=artesanos)
+    _insertar(Tienda, [
+        Tienda(artesano_id=perfil, nombre=f'Taller {i}', ubicacion='Santiago', aprobada=True)
+        for i, perfil in enumerate(perfiles)
+    ], lote)
+    tiendas = _ids(Tienda, artesano_id__in=perfiles)
+
+    log(f"{escala['productos']} productos...")
+    for inicio in range(0, escala['productos'], lote):
+        _insertar(Producto, [
+            Producto(
+                tienda_id=tiendas[i % len(tiendas)], categoria_id=rnd.choice(categorias),
+                nombre=' '.join(rnd.sample(PALABRAS, 3)).capitalize(),
+                descripcion=' '.join(rnd.choices(PALABRAS, k=20)),
+                precio=Decimal(rnd.randrange(1000, 200000)), stock=10 ** 6,
+            )
+            for i in range(inicio, min(inicio + lote, escala['productos']))
+        ], lote)
+    productos = _ids(Producto, tienda_id__in=tiendas)
+
+    log("Reseñas, favoritos y seguidores...")
+    resenas = []
+    for producto in productos:
+        for autor in rnd.sample(compradores, min(len(compradores), rnd.randint(0, 2 * escala['resenas']))):
+            resenas.append(ResenaDeProducto(
+                producto_id=producto, autor_id=autor, calificacion=rnd.randint(1, 5),
+                comentario=' '.join(rnd.choices(PALABRAS, k=12)), aprobada=True,
+            ))
+        if len(resenas) >= lote:
+            _insertar(ResenaDeProducto, resenas, lote)
+            resenas = []
+    _insertar(ResenaDeProducto, resenas, lote)
+    _insertar(Favorito, [
+        Favorito(usuario_id=compradores[0], producto_id=pk) for pk in rnd.sample(productos, min(50, len(productos)))
+    ], lote)
+    _insertar(SeguirTienda, [
+        SeguirTienda(usuario_id=usuario, tienda_id=tienda)
+        for tienda in tiendas
+        for usuario in rnd.sample(compradores, min(len(compradores), escala['seguidores']))
+    ], lote)
+
+    log(f"{escala['pedidos']} pedidos...")
+    # El artesano de prueba recibe una parte fija de los pedidos para que mi_tienda tenga volumen.
+    propios = _ids(Producto, tienda_id=tiendas[0])
+    for inicio in range(0, escala['pedidos'], lote):
+        _insertar(Pedido, [
+            Pedido(
+                comprador_id=rnd.choice(compradores),
+                producto_id=rnd.choice(propios if i % 10 == 0 else productos),
+                estado=rnd.choice('PPPC'),
+            )
+            for i in range(inicio, min(inicio + lote, escala['pedidos']))
+        ], lote)
+
+    log("Chat y notificaciones...")
+    # El comprador de prueba conversa con los primeros artesanos.
+    _insertar(Conversacion, [
+        Conversacion(**Conversacion.pareja(compradores[0], artesano))
+        for artesano in artesanos[:escala['conversaciones']]
+    ], lote)
+    del_comprador = Conversacion.objects.filter(Q(participante_1_id=compradores[0]) | Q(participante_2_id=compradores[0]))
+    conversaciones = [
+        (pk, p2 if p1 == compradores[0] else p1) for pk, p1, p2 in
+        del_comprador.values_list('pk', 'participante_1_id', 'participante_2_id')
+    ]
+    mensajes = []
+    for conversacion, artesano in conversaciones:
+        for i in range(escala['mensajes']):
+            mensajes.append(MensajeChat(
+                conversacion_id=conversacion, remitente_id=rnd.choice((compradores[0], artesano)),
+                texto=' '.join(rnd.choices(PALABRAS, k=8)),
+            ))
+        if len(mensajes) >= lote:
+            _insertar(MensajeChat, mensajes, lote)
+            mensajes = []
+    _insertar(MensajeChat, mensajes, lote)
+    ultimo = MensajeChat.objects.filter(conversacion=OuterRef('pk')).order_by('-fecha_envio', '-id')
+    # Ambos han leído todo salvo los dos últimos mensajes.
+    del_comprador.update(
+        ultimo_mensaje=Subquery(ultimo.values('pk')[:1]),
+        leido_hasta_1=Coalesce(Subquery(ultimo.values('pk')[2:3]), 0),
+        leido_hasta_2=Coalesce(Subquery(ultimo.values('pk')[2:3]), 0),
+    )
+    _insertar(Notificacion, [
+        Notificacion(usuario_id=compradores[0], mensaje=f'Aviso {i}', tipo='general', leida=i % 3 == 0)
+        for i in range(escala['notificaciones'])
+    ], lote)
+
+    log("Agregados, métricas e índice de búsqueda...")
+    call_command('reconciliar_calificaciones', batch_size=lote, stdout=StringIO())
+    call_command('consolidar_metricas', stdout=StringIO())
+    call_command('reindexar_busqueda', batch_size=lote, stdout=StringIO())
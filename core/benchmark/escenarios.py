@@ -0,0 +1,78 @@
+"""
+Escenarios del benchmark: nombre -> (rol, lista de URLs que se piden en rueda).
+
+El rol es None para peticiones anónimas o una clave de
+datos.usuarios_de_prueba(). Las URLs envueltas en carga.Post se piden con POST. Las URLs rotan sobre productos distintos para
+que las cachés por objeto no conviertan todo en aciertos.
+
+Los escenarios catalogo_pagina_N piden la página N del catálogo con su cursor:
+comparados con `catalogo` (la primera), muestran si la latencia por página se
+mantiene plana al paginar en profundidad (con la escala 'millon', ~1M de
+productos).
+"""
+import random
+from urllib.parse import quote
+
+from django.urls import reverse
+
+from ..models import Producto
+from .carga import Post
+from ..paginacion import CursorPaginator, SIGUIENTE
+from ..views import ORDENES_CATALOGO
+
+POR_PAGINA_CATALOGO = 12
+PROFUNDIDADES = (10, 100, 1000, 10000, 80000)
+
+
+def cursor_catalogo(pagina, orden='-fecha_creacion'):
+    """Cursor de la página siguiente a `pagina` del catálogo, sin recorrer las anteriores."""
+    ordering = ORDENES_CATALOGO[orden]
+    paginator = CursorPaginator(Producto.objects.filter(activo=True), POR_PAGINA_CATALOGO, ordering)
+    ultimo = Producto.objects.filter(activo=True).order_by(*ordering)[pagina * POR_PAGINA_CATALOGO - 1:][:1].first()
+    return paginator.codificar(ultimo, SIGUIENTE) if ultimo else ''
+
+
+def escenarios_profundidad(profundidades):
+    """{'catalogo_pagina_N': (None, [url])} para las páginas N que existen."""
+    paginas = -(-Producto.objects.filter(activo=True).count() // POR_PAGINA_CATALOGO)
+    catalogo = reverse('catalogo')
+    return {
+        f'catalogo_pagina_{pagina}': (None, [f'{catalogo}?cursor={quote(cursor_catalogo(pagina - 1))}'])
+        for pagina in sorted(set(profundidades)) if 1 < pagina <= paginas
+    }
+
+
+def construir(usuarios, profundidades=PROFUNDIDADES, variantes=50, semilla=1):
+    rnd = random.Random(semilla)
+    todos = list(Producto.objects.filter(activo=True).values_list('pk', flat=True))
+    ids = rnd.sample(todos, min(variantes, len(todos)))
+    # simular_pedido no admite comprar productos propios.
+    ajenos = list(Producto.objects.filter(pk__in=ids).exclude(
+        tienda__artesano__user=usuarios['artesano'],
+    ).values_list('pk', flat=True))
+    catalogo = reverse('catalogo')
+    return {
+        'catalogo': (None, [catalogo]),
+        'catalogo_busqueda': (None, [f'{catalogo}?q={quote(palabra)}' for palabra in ('greda', 'lana plata', 'cuenco')]),
+        'detalle_producto': (None, [reverse('detalle_producto', args=[pk]) for pk in ids]),
+        'detalle_producto_sesion': ('comprador', [reverse('detalle_producto', args=[pk]) for pk in ids]),
+        'simular_pedido': ('comprador', [Post(reverse('simular_pedido', args=[pk])) for pk in ajenos]),
+        'chat_inbox': ('comprador', [reverse('chat_inbox')]),
+        'mis_notificaciones': ('comprador', [reverse('mis_notificaciones')]),
+        'mi_tienda': ('artesano', [reverse('mi_tienda')]),
+        'admin_dashboard': ('staff', [reverse('admin_dashboard')]),
+        **escenarios_profundidad(profundidades),
+    }
+
+
+def latencia_por_pagina(resultados):
+    """[(página, p50_ms, p50 relativo a la primera página)] de los escenarios medidos del catálogo."""
+    paginas = {1: resultados.get('catalogo')}
+    for nombre, resultado in resultados.items():
+        if nombre.startswith('catalogo_pagina_'):
+            paginas[int(nombre.rsplit('_', 1)[1])] = resultado
+    base = paginas[1]['p50_ms'] if paginas[1] else None
+    return [
+        (pagina, resultado['p50_ms'], round(resultado['p50_ms'] / base, 2) if base else None)
+        for pagina, resultado in sorted(paginas.items()) if resultado
+    ]
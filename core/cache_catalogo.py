@@ -0,0 +1,114 @@
+"""
+Caché del catálogo.
+
+Tres niveles, todos en el cache `default`:
+
+- Páginas de resultados: para cada (q, categoria, calificacion_min, orden,
+  cursor) se guardan los ids de la página, los cursores y el total. La clave
+  incluye una generación que se incrementa cuando cambia algo que altera qué
+  productos aparecen o en qué orden (altas, ediciones, bajas, reseñas...).
+  Los cambios de stock no la tocan: no cambian la página, solo las tarjetas.
+- Tarjetas: el HTML de cada producto, con clave (id, Producto.actualizado).
+  Cualquier cambio visible en la tarjeta mueve `actualizado`, así que una
+  tarjeta obsoleta nunca se vuelve a leer; simplemente expira.
+- La lista de categorías del filtro.
+
+La invalidación la disparan las señales de core/signals.py.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Categoria, Producto
+
+CATALOGO_CACHE_TIMEOUT = 600
+TARJETA_CACHE_TIMEOUT = 60 * 60 * 24
+
+CLAVE_GENERACION = 'catalogo:generacion'
+CLAVE_CATEGORIAS = 'catalogo:categorias'
+
+
+def generacion():
+    valor = cache.get(CLAVE_GENERACION)
+    if valor is None:
+        # Si la clave se perdió (reinicio, desalojo), empezar en un valor que
+        # no pueda coincidir con una generación anterior.
+        valor = time.time_ns()
+        cache.add(CLAVE_GENERACION, valor, None)
+        valor = cache.get(CLAVE_GENERACION, valor)
+    return valor
+
+
+def invalidar_paginas():
+    try:
+        cache.incr(CLAVE_GENERACION)
+    except ValueError:
+        cache.set(CLAVE_GENERACION, time.time_ns(), None)
+
+
+def invalidar_categorias():
+    cache.delete(CLAVE_CATEGORIAS)
+
+
+def categorias():
+    resultado = cache.get(CLAVE_CATEGORIAS)
+    if resultado is None:
+        resultado = list(Categoria.objects.all())
+        cache.set(CLAVE_CATEGORIAS, resultado, CATALOGO_CACHE_TIMEOUT)
+    return resultado
+
+
+def clave_pagina(**parametros):
+    firma = '&'.join(f'{nombre}={parametros[nombre]}' for nombre in sorted(parametros))
+    return f'catalogo:pagina:{generacion()}:{hashlib.sha256(firma.encode()).hexdigest()}'
+
+
+def pagina(calcular, **parametros):
+    """Devuelve la página cacheada para `parametros` o la calcula con `calcular()`."""
+    clave = clave_pagina(**parametros)
+    resultado = cache.get(clave)
+    if resultado is None:
+        resultado = calcular()
+        cache.set(clave, resultado, CATALOGO_CACHE_TIMEOUT)
+    return resultado
+
+
+def clave_tarjeta(producto_id, actualizado):
+    return f'catalogo:tarjeta:{producto_id}:{actualizado.timestamp()}'
+
+
+def renderizar_tarjetas(productos):
+    """Renderiza y guarda las tarjetas de `productos` (con tienda y categoría cargadas)."""
+    nuevas = {
+        clave_tarjeta(producto.pk, producto.actualizado): render_to_string('tarjeta_producto.html', {'producto': producto})
+        for producto in productos
+    }
+    cache.set_many(nuevas, TARJETA_CACHE_TIMEOUT)
+    return nuevas
+
+
+def versiones(ids):
+    """{id: actualizado} de los productos activos entre `ids`."""
+    return dict(Producto.objects.filter(pk__in=ids, activo=True).values_list('pk', 'actualizado'))
+
+
+def tarjetas(ids, versiones_ids=None):
+    """
+    HTML de las tarjetas de los productos `ids`, en ese orden. Cuesta una
+    consulta por las versiones (si no se pasan) y otra solo si falta alguna
+    tarjeta. Los ids que ya no existen o están inactivos se omiten.
+    """
+    if versiones_ids is None:
+        versiones_ids = versiones(ids)
+    claves = {pk: clave_tarjeta(pk, actualizado) for pk, actualizado in versiones_ids.items()}
+    cacheadas = cache.get_many(list(claves.values()))
+
+    faltan = [pk for pk, clave in claves.items() if clave not in cacheadas]
+    if faltan:
+        cacheadas.update(renderizar_tarjetas(
+            Producto.objects.select_related('tienda', 'categoria').filter(pk__in=faltan)
+        ))
+    return [mark_safe(cacheadas[claves[pk]]) for pk in ids if claves.get(pk) in cacheadas]
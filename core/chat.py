@@ -0,0 +1,212 @@
+"""
+Transporte en tiempo real del chat.
+
+La base de datos es la fuente de verdad: los clientes piden "mensajes desde el
+id X" y, si no hay nada nuevo, esperan en el broker a que alguien publique en
+el canal de la conversación antes de volver a consultar. El broker solo avisa;
+nunca transporta el contenido de los mensajes.
+
+`MemoryBroker` reparte los avisos dentro del proceso (un servidor ASGI con un
+solo worker). `SondeoBroker` no comparte nada entre procesos: las esperas
+expiran tras un intervalo corto y el cliente vuelve a consultar, lo que lo
+convierte en un long-poll corriente. Cualquier otro broker (Redis, etc.) se
+enchufa con `CHAT_BROKER` implementando `publicar()` y `suscribir()`.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateformat import format as formatear_fecha
+from django.utils.module_loading import import_string
+
+from .models import Conversacion, MensajeArchivado, MensajeChat
+
+# Segundos que una petición de long-poll espera antes de responder vacía. Solo
+# con ASGI: la espera no ocupa un hilo mientras dura.
+ESPERA_MAXIMA = getattr(settings, 'CHAT_ESPERA_MAXIMA', 25)
+# Con WSGI cada petición abierta ocupa un worker entero (o un hilo con
+# gthread), así que no se espera en el servidor: el cliente vuelve a preguntar
+# cada INTERVALO_SONDEO segundos.
+INTERVALO_SONDEO = getattr(settings, 'CHAT_INTERVALO_SONDEO', 3)
+# Segundos que dura un stream SSE antes de cerrarse; EventSource reconecta solo.
+DURACION_STREAM = getattr(settings, 'CHAT_DURACION_STREAM', 55)
+LATIDO_STREAM = 15
+LIMITE_MENSAJES = 100
+# Mensajes que muestra chat_thread al abrir un hilo y que trae cada "cargar anteriores".
+VENTANA_MENSAJES = 50
+
+
+def canal_conversacion(conversacion_id):
+    return f'chat:{conversacion_id}'
+
+
+class Suscripcion:
+    def __init__(self, broker, canal):
+        self.broker = broker
+        self.canal = canal
+        self.loop = None
+        self.eventos = None
+
+    async def __aenter__(self):
+        self.loop = asyncio.get_running_loop()
+        self.eventos = asyncio.Queue()
+        self.broker._registrar(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.broker._eliminar(self)
+
+    def entregar(self, evento):
+        # Se llama desde el hilo que publica, no desde el del event loop.
+        self.loop.call_soon_threadsafe(self.eventos.put_nowait, evento)
+
+    async def esperar(self, timeout):
+        """Devuelve el siguiente evento del canal o None si vence el plazo."""
+        try:
+            return await asyncio.wait_for(self.eventos.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class MemoryBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscripciones = defaultdict(set)
+
+    def suscribir(self, canal):
+        return Suscripcion(self, canal)
+
+    def _registrar(self, suscripcion):
+        with self._lock:
+            self._suscripciones[suscripcion.canal].add(suscripcion)
+
+    def _eliminar(self, suscripcion):
+        with self._lock:
+            suscripciones = self._suscripciones.get(suscripcion.canal)
+            if suscripciones is not None:
+                suscripciones.discard(suscripcion)
+                if not suscripciones:
+                    del self._suscripciones[suscripcion.canal]
+
+    def publicar(self, canal, evento):
+        with self._lock:
+            suscripciones = list(self._suscripciones.get(canal, ()))
+        for suscripcion in suscripciones:
+            suscripcion.entregar(evento)
+
+
+class SondeoSuscripcion(Suscripcion):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def esperar(self, timeout):
+        await asyncio.sleep(min(timeout, self.broker.intervalo))
+        return None
+
+
+class SondeoBroker:
+    def __init__(self, intervalo=2):
+        self.intervalo = intervalo
+
+    def suscribir(self, canal):
+        return SondeoSuscripcion(self, canal)
+
+    def publicar(self, canal, evento):
+        pass
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'CHAT_BROKER', 'core.chat.MemoryBroker'))()
+        return _broker
+
+
+def publicar(conversacion_id, tipo, **datos):
+    get_broker().publicar(canal_conversacion(conversacion_id), {'tipo': tipo, **datos})
+
+
+def conversacion_de(usuario, conversacion_id):
+    if not usuario.is_authenticated:
+        return None
+    return Conversacion.objects.filter(
+        Q(participante_1=usuario) | Q(participante_2=usuario), pk=conversacion_id,
+    ).first()
+
+
+def serializar_mensaje(mensaje, usuario_id, leido_hasta=0):
+    propio = mensaje.remitente_id == usuario_id
+    return {
+        'id': mensaje.pk,
+        'texto': mensaje.texto,
+        'remitente_id': mensaje.remitente_id,
+        'propio': propio,
+        'fecha_envio': mensaje.fecha_envio.isoformat(),
+        'hora': formatear_fecha(timezone.localtime(mensaje.fecha_envio), 'H:i'),
+        'leido': propio and mensaje.pk <= leido_hasta,
+    }
+
+
+def leido_hasta(conversacion, usuario_id):
+    """Id del último mensaje de `usuario_id` que el otro participante ya leyó (recién leído de la base)."""
+    campo = 'leido_hasta_2' if conversacion.participante_1_id == usuario_id else 'leido_hasta_1'
+    return Conversacion.objects.filter(pk=conversacion.pk).values_list(campo, flat=True).first() or 0
+
+
+def mensajes_desde(conversacion, usuario_id, desde):
+    mensajes = MensajeChat.objects.filter(
+        conversacion_id=conversacion.pk, id__gt=desde,
+    ).order_by('id')[:LIMITE_MENSAJES]
+    hasta = leido_hasta(conversacion, usuario_id)
+    return {
+        'mensajes': [serializar_mensaje(mensaje, usuario_id, hasta) for mensaje in mensajes],
+        'leido_hasta': hasta,
+    }
+
+
+def historial(conversacion, antes=None, limite=None):
+    """
+    Los `limite` mensajes anteriores al id `antes` (los más recientes si es
+    None), en orden cronológico, y si quedan más atrás. Keyset sobre el id:
+    cada página cuesta lo mismo por larga que sea la conversación. Cuando se
+    acaban los mensajes vivos, sigue por MensajeArchivado, que solo se
+    consulta si la conversación tiene algo archivado.
+    """
+    limite = limite or VENTANA_MENSAJES
+    filtro = {'conversacion_id': conversacion.pk}
+    if antes:
+        filtro['id__lt'] = antes
+    mensajes = list(MensajeChat.objects.filter(**filtro).order_by('-id')[:limite + 1])
+    if len(mensajes) <= limite and conversacion.archivado_hasta:
+        faltan = limite + 1 - len(mensajes)
+        mensajes += MensajeArchivado.objects.filter(**filtro).order_by('-id')[:faltan]
+    return mensajes[:limite][::-1], len(mensajes) > limite
+
+
+def marcar_leidos(conversacion, usuario_id, hasta):
+    """
+    Adelanta hasta el id `hasta` el marcador de lectura de `usuario_id`: un
+    UPDATE de una fila de Conversacion, sin tocar los mensajes. El cliente lo
+    llama una vez por tanda de mensajes mostrados. Devuelve si cambió.
+    """
+    # Un cliente no puede marcar como leídos mensajes que aún no existen.
+    hasta = min(hasta, conversacion.ultimo_mensaje_id or 0)
+    campo = conversacion.campo_leido(usuario_id)
+    actualizado = Conversacion.objects.filter(
+        pk=conversacion.pk, **{f'{campo}__lt': hasta},
+    ).update(**{campo: hasta})
+    if actualizado:
+        setattr(conversacion, campo, hasta)
+        publicar(conversacion.pk, 'leido', hasta=hasta)
+    return bool(actualizado)
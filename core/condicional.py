@@ -0,0 +1,36 @@
+"""
+Validadores para GET condicional.
+
+Las vistas públicas de lectura (catálogo, detalle de producto) calculan un
+ETag a partir de datos baratos: la versión del producto (`actualizado`),
+stock, agregados de reseñas, la generación del catálogo... y, si hay sesión,
+el usuario y su estado personal (favorito, seguimiento, barra de
+navegación). Si el cliente ya tiene esa versión, `condition()` responde 304
+sin renderizar la plantilla ni leer las reseñas.
+
+Los ETag son débiles: el HTML lleva un token CSRF distinto en cada render,
+así que dos respuestas con el mismo ETag son equivalentes pero no idénticas
+byte a byte.
+"""
+import hashlib
+
+from django.contrib.messages import get_messages
+
+from .context_processors import estado_navbar
+
+
+def hay_mensajes(request):
+    """Con mensajes flash pendientes la página debe renderizarse para mostrarlos."""
+    return len(get_messages(request)) > 0
+
+
+def firma_usuario(request):
+    if not request.user.is_authenticated:
+        return ('anonimo',)
+    estado = estado_navbar(request.user.pk)
+    return (request.user.pk, estado['tiene_tienda'], estado['notificaciones_count'])
+
+
+def etag_debil(*partes):
+    digest = hashlib.sha256(repr(partes).encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
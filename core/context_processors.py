@@ -1,22 +1,66 @@
-from .models import Perfil, Tienda, Notificacion
+import logging
+import threading
+
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from .models import Tienda, NotificacionesNoLeidas
+
+logger = logging.getLogger(__name__)
+
+NAVBAR_CACHE_TIMEOUT = 300
+
+_estadisticas = {'hits': 0, 'misses': 0}
+_estadisticas_lock = threading.Lock()
+
+
+def clave_navbar(usuario_id):
+    return f'navbar:{usuario_id}'
+
+
+def invalidar_navbar(*usuario_ids):
+    """Borra el estado cacheado de la barra de navegación de esos usuarios."""
+    if usuario_ids:
+        cache.delete_many([clave_navbar(uid) for uid in usuario_ids])
+
+
+def _registrar(resultado):
+    with _estadisticas_lock:
+        _estadisticas[resultado] += 1
+
+
+def estadisticas_navbar():
+    with _estadisticas_lock:
+        hits, misses = _estadisticas['hits'], _estadisticas['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else 0.0}
+
+
+def estado_navbar(usuario_id):
+    clave = clave_navbar(usuario_id)
+    estado = cache.get(clave)
+    if estado is not None:
+        _registrar('hits')
+        return estado
+    _registrar('misses')
+    estado = {
+        'tiene_tienda': Tienda.objects.filter(artesano__user_id=usuario_id).exists(),
+        'notificaciones_count': NotificacionesNoLeidas.de(usuario_id),
+    }
+    cache.set(clave, estado, NAVBAR_CACHE_TIMEOUT)
+    logger.debug("Estado de navbar recalculado para el usuario %s", usuario_id)
+    return estado
+
 
 def tienda_context(request):
-    context = {'tiene_tienda': False, 'notificaciones_count': 0}
-    
-    if request.user.is_authenticated:
-        try:
-            perfil = Perfil.objects.get(user=request.user)
-            tienda = Tienda.objects.filter(artesano=perfil).first()
-            context['tiene_tienda'] = bool(tienda)
-            
-            # Contar notificaciones no leídas
-            notificaciones_count = Notificacion.objects.filter(
-                usuario=request.user, 
-                leida=False
-            ).count()
-            context['notificaciones_count'] = notificaciones_count
-            
-        except Perfil.DoesNotExist:
-            pass
-    
-    return context
+    if not request.user.is_authenticated:
+        return {'tiene_tienda': False, 'notificaciones_count': 0}
+
+    # Se evalúa solo si la plantilla usa alguna de las variables, y una sola
+    # vez por request aunque se usen ambas.
+    usuario_id = request.user.pk
+    estado = SimpleLazyObject(lambda: estado_navbar(usuario_id))
+    return {
+        'tiene_tienda': SimpleLazyObject(lambda: estado['tiene_tienda']),
+        'notificaciones_count': SimpleLazyObject(lambda: estado['notificaciones_count']),
+    }
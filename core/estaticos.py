@@ -0,0 +1,189 @@
+"""
+Archivos estáticos en producción.
+
+`EstaticosComprimidosStorage` (STORAGES['staticfiles'] en
+config/settings_produccion.py) es ManifestStaticFilesStorage: collectstatic
+copia cada archivo con el hash de su contenido en el nombre
+(css/style.3f2a1c9e0b7d.css), reescribe las referencias entre CSS y guarda el
+mapa en staticfiles.json, que `{% static %}` usa para enlazar la versión con
+hash. Además deja junto a cada archivo de texto una copia .gz y, si está
+instalado el paquete opcional `brotli`, una .br: se comprimen una vez al
+desplegar y no en cada petición.
+
+`EstaticosMiddleware` (SERVIR_ESTATICOS=True) sirve STATIC_ROOT desde el propio
+proceso, para despliegues sin un servidor web delante. El índice de archivos
+se construye al arrancar; en cada petición elige la variante comprimida según
+Accept-Encoding. Los nombres con hash no cambian de contenido, así que se
+sirven con un año de caché e `immutable`; el resto, con CACHE_CORTO segundos.
+Desactivado, lanza MiddlewareNotUsed y Django lo quita de la cadena.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRIMIBLES = ('.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.xml', '.html', '.ico')
+MINIMO_BYTES = 256
+# Solo se guarda una variante si ahorra al menos este porcentaje.
+AHORRO_MINIMO = 0.05
+CACHE_LARGO = 365 * 24 * 60 * 60
+CACHE_CORTO = 60
+# Extensión de la variante -> Content-Encoding, en orden de preferencia.
+VARIANTES = (('.br', 'br'), ('.gz', 'gzip'))
+
+
+def comprimir(contenido):
+    """{extensión: bytes} con las variantes comprimidas que merecen la pena."""
+    if len(contenido) < MINIMO_BYTES:
+        return {}
+    variantes = {'.gz': gzip.compress(contenido, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variantes['.br'] = brotli.compress(contenido)
+    return {
+        extension: datos for extension, datos in variantes.items()
+        if len(datos) <= len(contenido) * (1 - AHORRO_MINIMO)
+    }
+
+
+class EstaticosComprimidosStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Originales y versiones con hash: las plantillas enlazan las segundas,
+        # pero las primeras siguen accesibles por su nombre.
+        for nombre in set(paths) | set(self.hashed_files.values()):
+            if nombre.lower().endswith(COMPRIMIBLES):
+                self._comprimir(nombre)
+
+    def _comprimir(self, nombre):
+        ruta = self.path(nombre)
+        with open(ruta, 'rb') as archivo:
+            variantes = comprimir(archivo.read())
+        for extension, _ in VARIANTES:
+            if extension in variantes:
+                with open(ruta + extension, 'wb') as archivo:
+                    archivo.write(variantes[extension])
+            elif os.path.exists(ruta + extension):
+                # Una variante que ya no compensa no debe quedar de un despliegue anterior.
+                os.remove(ruta + extension)
+
+
+class Estatico:
+    __slots__ = ('ruta', 'tipo', 'charset', 'modificado', 'etag', 'variantes', 'inmutable')
+
+    def __init__(self, ruta, inmutable):
+        estado = os.stat(ruta)
+        self.ruta = ruta
+        self.tipo, _ = mimetypes.guess_type(ruta)
+        self.tipo = self.tipo or 'application/octet-stream'
+        self.charset = self.tipo.startswith('text/') or self.tipo in ('application/javascript', 'image/svg+xml')
+        self.modificado = estado.st_mtime
+        self.etag = f'"{estado.st_size:x}-{int(estado.st_mtime):x}"'
+        self.variantes = [
+            (codificacion, ruta + extension) for extension, codificacion in VARIANTES
+            if os.path.exists(ruta + extension)
+        ]
+        self.inmutable = inmutable
+
+    def elegir(self, accept_encoding):
+        """(Content-Encoding o None, ruta) de la mejor variante que acepta el cliente."""
+        aceptadas = _codificaciones_aceptadas(accept_encoding)
+        for codificacion, ruta in self.variantes:
+            if codificacion in aceptadas:
+                return codificacion, ruta
+        return None, self.ruta
+
+
+def _codificaciones_aceptadas(cabecera):
+    aceptadas = set()
+    for parte in cabecera.split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        calidad = parametros.strip()
+        if calidad.startswith('q='):
+            try:
+                if float(calidad[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        aceptadas.add(nombre.strip().lower())
+    return aceptadas
+
+
+def indexar(raiz, inmutables=()):
+    """{ruta relativa con '/': Estatico} de los archivos de `raiz` (sin las variantes .gz/.br)."""
+    inmutables = set(inmutables)
+    archivos = {}
+    if not raiz or not os.path.isdir(raiz):
+        return archivos
+    for directorio, _, nombres in os.walk(raiz):
+        for nombre in nombres:
+            ruta = os.path.join(directorio, nombre)
+            base, extension = os.path.splitext(ruta)
+            if extension in dict(VARIANTES) and os.path.exists(base):
+                continue
+            relativa = os.path.relpath(ruta, raiz).replace(os.sep, '/')
+            archivos[relativa] = Estatico(ruta, relativa in inmutables)
+    return archivos
+
+
+class EstaticosMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVIR_ESTATICOS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefijo = urlsplit(settings.STATIC_URL).path
+        # Con ManifestStaticFilesStorage, los valores del manifiesto son los nombres con hash.
+        inmutables = getattr(staticfiles_storage, 'hashed_files', {}).values()
+        self.archivos = indexar(settings.STATIC_ROOT, inmutables)
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.prefijo):
+            relativa = posixpath.normpath(request.path[len(self.prefijo):]).lstrip('/')
+            estatico = self.archivos.get(relativa)
+            if estatico is not None:
+                return self.servir(request, estatico)
+        return self.get_response(request)
+
+    def servir(self, request, estatico):
+        codificacion, ruta = estatico.elegir(request.headers.get('Accept-Encoding', ''))
+        etag = estatico.etag if codificacion is None else f'{estatico.etag[:-1]}-{codificacion}"'
+        cabeceras = {
+            'ETag': etag,
+            'Last-Modified': http_date(estatico.modificado),
+            'Cache-Control': (
+                f'public, max-age={CACHE_LARGO}, immutable' if estatico.inmutable
+                else f'public, max-age={CACHE_CORTO}'
+            ),
+        }
+        if estatico.variantes:
+            cabeceras['Vary'] = 'Accept-Encoding'
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            tipo = f'{estatico.tipo}; charset=utf-8' if estatico.charset else estatico.tipo
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=tipo)
+                response['Content-Length'] = os.path.getsize(ruta)
+            else:
+                response = FileResponse(open(ruta, 'rb'), content_type=tipo)
+                # FileResponse lo añade con el nombre en disco (que puede ser el .gz).
+                del response['Content-Disposition']
+            if codificacion:
+                response['Content-Encoding'] = codificacion
+        for nombre, valor in cabeceras.items():
+            response[nombre] = valor
+        return response
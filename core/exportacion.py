@@ -0,0 +1,60 @@
+"""
+Exportaciones en streaming (CSV o JSONL) de tablas que pueden ser grandes.
+
+Las filas se leen por lotes con keyset sobre la clave primaria
+(`WHERE pk > último ORDER BY pk LIMIT lote`) en vez de con
+QuerySet.iterator(): con MySQL, mysqlclient guarda en el cliente el
+resultado completo de cada consulta, así que un único SELECT de 100k filas
+ocuparía memoria proporcional a la tabla aunque se recorra con iterator().
+Con lotes la memoria depende solo del tamaño del lote, en cualquier motor, y
+cada consulta usa el índice de la clave primaria.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+FORMATOS = ('csv', 'jsonl')
+LOTE = 2000
+TIPOS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def recorrer_por_lotes(queryset, campos, lote=LOTE):
+    """Genera las tuplas de `campos` de `queryset`, en orden de pk, de `lote` en `lote` filas."""
+    ultimo = None
+    while True:
+        bloque = queryset.order_by('pk')
+        if ultimo is not None:
+            bloque = bloque.filter(pk__gt=ultimo)
+        bloque = list(bloque.values_list('pk', *campos)[:lote])
+        for fila in bloque:
+            yield fila[1:]
+        if len(bloque) < lote:
+            return
+        ultimo = bloque[-1][0]
+
+
+class _Eco:
+    """Archivo falso para csv.writer: devuelve la línea en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def lineas(filas, columnas, formato='csv'):
+    """Serializa `filas` (tuplas en el orden de `columnas`) línea a línea."""
+    if formato == 'jsonl':
+        for fila in filas:
+            yield json.dumps(dict(zip(columnas, fila)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+    else:
+        escritor = csv.writer(_Eco())
+        yield escritor.writerow(columnas)
+        for fila in filas:
+            yield escritor.writerow(['' if valor is None else valor for valor in fila])
+
+
+def respuesta(contenido, nombre, formato='csv'):
+    response = StreamingHttpResponse(contenido, content_type=f'{TIPOS[formato]}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nombre}.{formato}"'
+    return response
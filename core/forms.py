@@ -1,6 +1,7 @@
 # core/forms.py
 from django import forms
-from .models import Tienda, Producto, Categoria, ResenaDeProducto
+from .models import Tienda, Producto, Categoria, ResenaDeProducto, Pedido
+from django.core.files.storage import default_storage
 from django.utils.text import slugify
 
 class ResenaDeProductoForm(forms.ModelForm):
@@ -93,6 +94,61 @@ class ProductoForm(forms.ModelForm):
 
         return super().save(commit)
 
+class ProductoImportacionForm(forms.Form):
+    """Valida una fila de la importación masiva (core/importacion.py)."""
+    nombre = forms.CharField(max_length=200)
+    descripcion = forms.CharField(required=False)
+    precio = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    stock = forms.IntegerField(min_value=0)
+    categoria = forms.CharField(max_length=100)
+    imagen = forms.CharField(max_length=100, required=False)
+
+    def clean_imagen(self):
+        ruta = self.cleaned_data['imagen'].strip().lstrip('/')
+        if not ruta:
+            return ''
+        if '..' in ruta.split('/'):
+            raise forms.ValidationError("Ruta de imagen no válida.")
+        if not default_storage.exists(ruta):
+            raise forms.ValidationError(f"No existe la imagen '{ruta}'.")
+        return ruta
+
+
+class ImportarProductosForm(forms.Form):
+    archivo = forms.FileField(
+        label="Archivo CSV o JSONL",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.jsonl,.ndjson'}),
+    )
+    simular = forms.BooleanField(
+        required=False, label="Solo validar (no guardar nada)",
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+
+class FiltroPedidosForm(forms.Form):
+    desde = forms.DateField(
+        required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}),
+    )
+    hasta = forms.DateField(
+        required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}),
+    )
+    estado = forms.ChoiceField(
+        required=False, choices=[('', 'Todos')] + list(Pedido.ESTADOS),
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+    )
+    formato = forms.ChoiceField(
+        required=False, choices=[('csv', 'CSV'), ('jsonl', 'JSONL')],
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+    )
+    # Solo para el staff: limita la exportación a una tienda.
+    tienda = forms.IntegerField(required=False, widget=forms.HiddenInput)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        desde, hasta = cleaned_data.get('desde'), cleaned_data.get('hasta')
+        if desde and hasta and desde > hasta:
+            raise forms.ValidationError("La fecha 'desde' no puede ser posterior a 'hasta'.")
+        return cleaned_data
+
 # --- NUEVOS FORMULARIOS ---
 
 from .models import SoporteTicket, MensajeChat, ReporteAbuso
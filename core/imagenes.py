@@ -0,0 +1,194 @@
+"""
+Derivadas responsivas de Producto.imagen.
+
+Al subir una imagen se generan versiones WebP (y AVIF si Pillow lo soporta) en
+anchos fijos, sin metadatos EXIF/XMP, con nombres derivados del hash del
+contenido: el mismo original produce siempre los mismos archivos, así que se
+pueden servir con caché de larga duración. El resultado se guarda en
+`Producto.imagen_derivadas` y la etiqueta `{% imagen_producto %}` lo convierte
+en un <picture> con srcset, width y height.
+
+Codificar cada ancho en WebP y AVIF es caro, así que no se hace en la petición
+que guarda el producto: el post_save lo encola y, hasta que las derivadas
+existen, la etiqueta sirve el original. Cómo se generan lo decide
+IMAGENES_EJECUTOR, como en core/notificaciones.py:
+    'hilo'       un hilo de fondo del propio proceso, tras el commit (por defecto).
+    'worker'     no se generan en el servidor; lo hace `manage.py generar_derivadas_imagenes`.
+    'inmediato'  en el mismo hilo, tras el commit (desarrollo y pruebas).
+"""
+import hashlib
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+ANCHOS = (320, 640, 960, 1280)
+CARPETA = 'productos/derivadas'
+FORMATOS = (
+    # (formato, extensión, opciones de guardado)
+    ('webp', 'webp', {'quality': 80, 'method': 4}),
+    ('avif', 'avif', {'quality': 60, 'speed': 6}),
+)
+
+
+def formatos_disponibles():
+    return [formato for formato in FORMATOS if features.check(formato[0])]
+
+
+def hash_contenido(archivo):
+    sha = hashlib.sha256()
+    for bloque in archivo.chunks():
+        sha.update(bloque)
+    return sha.hexdigest()[:16]
+
+
+def anchos_para(ancho_original):
+    anchos = [ancho for ancho in ANCHOS if ancho < ancho_original]
+    if len(anchos) < len(ANCHOS):
+        # La mayor derivada nunca amplía el original.
+        anchos.append(ancho_original)
+    return anchos
+
+
+def _preparar(imagen):
+    # Aplicar la orientación EXIF antes de descartar los metadatos.
+    imagen = ImageOps.exif_transpose(imagen)
+    con_alfa = imagen.mode in ('RGBA', 'LA') or (imagen.mode == 'P' and 'transparency' in imagen.info)
+    return imagen.convert('RGBA' if con_alfa else 'RGB')
+
+
+def derivadas_de_archivo(nombre, storage=None):
+    """
+    Genera (o reutiliza) las derivadas del archivo `nombre` y devuelve el dict
+    que se guarda en Producto.imagen_derivadas. No toca la base de datos, así
+    que se puede ejecutar en otro proceso.
+    """
+    storage = storage or default_storage
+    with storage.open(nombre, 'rb') as archivo:
+        contenido = archivo.read()
+    digest = hashlib.sha256(contenido).hexdigest()[:16]
+    with Image.open(io.BytesIO(contenido)) as original:
+        imagen = _preparar(original)
+
+    ancho, alto = imagen.size
+    variantes = {}
+    for formato, extension, opciones in formatos_disponibles():
+        rutas = []
+        for destino in anchos_para(ancho):
+            ruta = posixpath.join(CARPETA, f'{digest}-{destino}.{extension}')
+            if not storage.exists(ruta):
+                copia = imagen if destino == ancho else imagen.resize(
+                    (destino, max(1, round(alto * destino / ancho))), Image.Resampling.LANCZOS,
+                )
+                buffer = io.BytesIO()
+                # Sin exif/xmp/icc_profile: el archivo no lleva metadatos.
+                copia.save(buffer, format=formato.upper(), **opciones)
+                storage.save(ruta, ContentFile(buffer.getvalue()))
+            rutas.append([destino, ruta])
+        variantes[formato] = rutas
+    return {'origen': nombre, 'hash': digest, 'ancho': ancho, 'alto': alto, 'variantes': variantes}
+
+
+def borrar_derivadas(datos, storage=None):
+    storage = storage or default_storage
+    for rutas in datos.get('variantes', {}).values():
+        for _, ruta in rutas:
+            storage.delete(ruta)
+
+
+def necesita_derivadas(producto):
+    nombre = producto.imagen.name if producto.imagen else ''
+    return nombre != (producto.imagen_derivadas or {}).get('origen', '')
+
+
+def actualizar_derivadas(producto):
+    """Regenera las derivadas si la imagen cambió; borra las que quedan huérfanas."""
+    from .models import Producto
+
+    if not necesita_derivadas(producto):
+        return
+    anteriores = producto.imagen_derivadas or {}
+    nombre = producto.imagen.name if producto.imagen else ''
+    datos = {}
+    if nombre:
+        try:
+            datos = derivadas_de_archivo(nombre)
+        except (OSError, Image.DecompressionBombError):
+            # Sin derivadas la plantilla sirve el original.
+            logger.exception("No se pudieron generar las derivadas de %s", nombre)
+    # Si la imagen volvió a cambiar mientras tanto, su propia tarea la procesa.
+    if not Producto.objects.filter(pk=producto.pk, imagen=nombre).update(
+        imagen_derivadas=datos, actualizado=timezone.now(),
+    ):
+        return
+    producto.imagen_derivadas = datos
+
+    hash_anterior = anteriores.get('hash')
+    if hash_anterior and hash_anterior != datos.get('hash'):
+        compartidas = Producto.objects.filter(imagen_derivadas__hash=hash_anterior).exclude(pk=producto.pk)
+        if not compartidas.exists():
+            borrar_derivadas(anteriores)
+
+
+# --- Ejecución ---
+
+_ejecutor = None
+_pendientes = set()
+_pendientes_lock = threading.Lock()
+
+
+def encolar_derivadas(producto):
+    """post_save: genera las derivadas de `producto` fuera de la petición, tras el commit."""
+    if not necesita_derivadas(producto):
+        return
+    pk = producto.pk
+    transaction.on_commit(lambda: _despachar(pk))
+
+
+def _despachar(pk):
+    global _ejecutor
+    modo = getattr(settings, 'IMAGENES_EJECUTOR', 'hilo')
+    if modo == 'inmediato':
+        generar_pendiente(pk)
+    elif modo == 'hilo':
+        with _pendientes_lock:
+            # Con pendientes, ya hay un drenado en cola que verá también este producto.
+            programado = bool(_pendientes)
+            _pendientes.add(pk)
+            if _ejecutor is None:
+                _ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='imagenes')
+        if not programado:
+            _ejecutor.submit(_drenar_en_hilo)
+
+
+def _drenar_en_hilo():
+    try:
+        while True:
+            with _pendientes_lock:
+                if not _pendientes:
+                    return
+                pk = _pendientes.pop()
+            try:
+                generar_pendiente(pk)
+            except Exception:
+                logger.exception("Error generando las derivadas del producto %s", pk)
+    finally:
+        connections.close_all()
+
+
+def generar_pendiente(pk):
+    from .models import Producto
+
+    producto = Producto.objects.filter(pk=pk).only('pk', 'imagen', 'imagen_derivadas').first()
+    if producto is not None:
+        actualizar_derivadas(producto)
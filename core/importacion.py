@@ -0,0 +1,178 @@
+"""
+Importación y exportación masiva de productos de una tienda.
+
+Formatos: CSV con cabecera o JSONL (un objeto por línea), con las columnas
+de COLUMNAS. `imagen` es la ruta de un archivo ya presente en el storage de
+media (la que da la exportación), no una subida.
+
+La importación recorre el archivo como un stream: valida cada fila con
+ProductoImportacionForm, resuelve las categorías contra un mapa en memoria
+cargado con una sola consulta y crea los productos con bulk_create por
+lotes, todo dentro de una transacción. Si alguna fila es inválida no se
+guarda nada. bulk_create no emite señales, así que al final se indexan los
+productos nuevos, se suman a las métricas, se invalida el catálogo y se
+envía un único aviso a los seguidores. Las derivadas de las imágenes las
+genera `manage.py generar_derivadas_imagenes`; mientras tanto se sirve el
+original.
+"""
+import csv
+import io
+import json
+
+from django.db import transaction
+from django.urls import reverse
+from django.utils.text import slugify
+
+from . import cache_catalogo, exportacion, metricas
+from .forms import ProductoImportacionForm
+from .models import Categoria, Producto
+from .notificaciones import notificar_seguidores
+from .search import indexar_productos
+
+COLUMNAS = ('nombre', 'descripcion', 'precio', 'stock', 'categoria', 'imagen')
+FORMATOS = exportacion.FORMATOS
+LOTE = 500
+MAX_ERRORES = 50
+
+
+class ImportacionInvalida(Exception):
+    def __init__(self, errores, total_errores):
+        super().__init__(f"{total_errores} filas con errores")
+        self.errores = errores
+        self.total_errores = total_errores
+
+
+def formato_de(nombre_archivo, por_defecto='csv'):
+    return 'jsonl' if nombre_archivo.lower().endswith(('.jsonl', '.ndjson')) else por_defecto
+
+
+def leer_filas(archivo_binario, formato):
+    """Genera (número de línea, dict) sin cargar el archivo entero en memoria."""
+    texto = io.TextIOWrapper(archivo_binario, encoding='utf-8-sig', newline='')
+    try:
+        if formato == 'jsonl':
+            for numero, linea in enumerate(texto, start=1):
+                if not linea.strip():
+                    continue
+                try:
+                    fila = json.loads(linea)
+                except ValueError:
+                    yield numero, None
+                    continue
+                yield numero, fila if isinstance(fila, dict) else None
+        else:
+            lector = csv.DictReader(texto)
+            for fila in lector:
+                yield lector.line_num, fila
+    finally:
+        # No cerrar el archivo subyacente: es de quien lo abrió.
+        texto.detach()
+
+
+class MapaCategorias:
+    """Nombre (sin distinguir mayúsculas) -> id, con las categorías nuevas creadas por lotes."""
+
+    def __init__(self):
+        self.ids = {}
+        self.slugs = set()
+        for pk, nombre, slug in Categoria.objects.values_list('pk', 'nombre', 'slug'):
+            self.ids[nombre.lower()] = pk
+            self.slugs.add(slug)
+
+    def resolver(self, nombres):
+        nuevas = {}
+        for nombre in nombres:
+            if nombre.lower() in self.ids or nombre.lower() in nuevas:
+                continue
+            base = slugify(nombre) or 'categoria'
+            slug, n = base, 2
+            while slug in self.slugs:
+                slug, n = f'{base}-{n}', n + 1
+            self.slugs.add(slug)
+            nuevas[nombre.lower()] = Categoria(nombre=nombre, slug=slug)
+        if nuevas:
+            Categoria.objects.bulk_create(nuevas.values())
+            creadas = Categoria.objects.filter(nombre__in=[c.nombre for c in nuevas.values()])
+            for pk, nombre in creadas.values_list('pk', 'nombre'):
+                self.ids[nombre.lower()] = pk
+            cache_catalogo.invalidar_categorias()
+        return self.ids
+
+
+def importar_productos(tienda, filas, lote=LOTE, simular=False, notificar=True):
+    """
+    Importa `filas` (pares (línea, dict) como los de leer_filas) en `tienda`.
+    Devuelve el número de productos creados; lanza ImportacionInvalida con
+    las primeras MAX_ERRORES filas erróneas si hay alguna.
+    """
+    errores, total_errores, creados = [], 0, 0
+    with transaction.atomic():
+        # Los ids nuevos se reconocen por ser mayores que el último existente:
+        # bulk_create no devuelve claves primarias en todos los motores.
+        ultimo_id = Producto.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        categorias = MapaCategorias()
+        pendientes = []
+
+        def guardar():
+            ids = categorias.resolver({datos['categoria'] for datos in pendientes})
+            Producto.objects.bulk_create([
+                Producto(
+                    tienda=tienda, categoria_id=ids[datos['categoria'].lower()], nombre=datos['nombre'],
+                    descripcion=datos['descripcion'], precio=datos['precio'], stock=datos['stock'],
+                    imagen=datos['imagen'] or None,
+                )
+                for datos in pendientes
+            ])
+            pendientes.clear()
+
+        for numero, fila in filas:
+            form = ProductoImportacionForm(fila) if fila is not None else None
+            if form is None or not form.is_valid():
+                total_errores += 1
+                if len(errores) < MAX_ERRORES:
+                    errores.append((numero, _describir_errores(form)))
+                continue
+            if total_errores:
+                # Ya no se va a guardar nada; solo se siguen contando los errores.
+                continue
+            pendientes.append(form.cleaned_data)
+            creados += 1
+            if len(pendientes) >= lote:
+                guardar()
+        if total_errores:
+            raise ImportacionInvalida(errores, total_errores)
+        if pendientes:
+            guardar()
+
+        if simular:
+            transaction.set_rollback(True)
+            return creados
+        metricas.sumar({'productos': creados})
+        nuevos = Producto.objects.filter(tienda=tienda, pk__gt=ultimo_id).select_related('tienda', 'categoria')
+        for inicio in range(0, creados, lote):
+            indexar_productos(list(nuevos.order_by('pk')[inicio:inicio + lote]))
+
+    cache_catalogo.invalidar_paginas()
+    if notificar and creados:
+        notificar_seguidores(
+            tienda, f"¡{tienda.nombre} publicó {creados} productos nuevos!", url=reverse('catalogo'),
+        )
+    return creados
+
+
+def _describir_errores(form):
+    if form is None:
+        return "La fila no es un objeto válido."
+    return '; '.join(
+        f"{campo}: {' '.join(mensajes)}" if campo != '__all__' else ' '.join(mensajes)
+        for campo, mensajes in form.errors.items()
+    )
+
+
+def exportar_productos(tienda, formato='csv', lote=exportacion.LOTE):
+    """Genera el archivo por líneas; la memoria no crece con el número de productos."""
+    filas = exportacion.recorrer_por_lotes(
+        Producto.objects.filter(tienda=tienda, activo=True),
+        ('nombre', 'descripcion', 'precio', 'stock', 'categoria__nombre', 'imagen'), lote,
+    )
+    return exportacion.lineas(filas, COLUMNAS, formato)
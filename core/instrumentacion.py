@@ -0,0 +1,299 @@
+"""
+Instrumentación por petición (opcional).
+
+Con INSTRUMENTACION=True, `InstrumentacionMiddleware` mide en cada petición
+el número y el tiempo de las consultas SQL, el tiempo de render de
+plantillas, los aciertos y fallos de caché y el tiempo total. Lo devuelve en
+la cabecera `Server-Timing` y lo acumula en histogramas por nombre de vista
+para los últimos VENTANA_MINUTOS minutos.
+
+Los histogramas viven en la memoria del proceso: la vista `metricas_rendimiento`
+(solo staff) muestra los del proceso que la atiende. Cada proceso publica
+además una copia en el cache `default` cada PUBLICAR_CADA segundos, que es lo
+que lee `manage.py metricas_rendimiento`; con un backend compartido se ven
+todos los workers.
+
+Desactivada, el middleware lanza MiddlewareNotUsed y Django lo quita de la
+cadena: no queda ningún coste por petición. Activada, envuelve una vez
+Template.render y los get/get_many de los backends de caché; los envoltorios
+solo cuentan si hay una petición instrumentada en curso.
+"""
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+# Límites superiores (ms) de los buckets del histograma; el último es abierto.
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+VENTANA_MINUTOS = 15
+PUBLICAR_CADA = 30
+CLAVE_CACHE = 'instrumentacion:{}'
+CLAVE_PROCESOS = 'instrumentacion:procesos'
+
+_medicion = contextvars.ContextVar('instrumentacion_medicion', default=None)
+_SIN_VALOR = object()
+
+
+class Medicion:
+    __slots__ = ('consultas', 'sql_ms', 'plantillas_ms', 'cache_aciertos', 'cache_fallos', '_profundidad')
+
+    def __init__(self):
+        self.consultas = 0
+        self.sql_ms = 0.0
+        self.plantillas_ms = 0.0
+        self.cache_aciertos = 0
+        self.cache_fallos = 0
+        self._profundidad = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper de las conexiones.
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas += 1
+            self.sql_ms += (time.perf_counter() - inicio) * 1000
+
+    def server_timing(self, total_ms):
+        return ', '.join([
+            f'db;dur={self.sql_ms:.1f};desc="{self.consultas} consultas"',
+            f'tpl;dur={self.plantillas_ms:.1f}',
+            f'cache;desc="aciertos={self.cache_aciertos} fallos={self.cache_fallos}"',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+
+def _medir_anidado(funcion, acumular):
+    """Envuelve `funcion` para que solo la llamada más externa acumule su resultado."""
+    @functools.wraps(funcion)
+    def envoltorio(*args, **kwargs):
+        medicion = _medicion.get()
+        if medicion is None or medicion._profundidad:
+            return funcion(*args, **kwargs)
+        medicion._profundidad += 1
+        inicio = time.perf_counter()
+        try:
+            resultado = funcion(*args, **kwargs)
+        finally:
+            medicion._profundidad -= 1
+        acumular(medicion, resultado, (time.perf_counter() - inicio) * 1000, args, kwargs)
+        return resultado
+    envoltorio._instrumentado = True
+    return envoltorio
+
+
+def _acumular_render(medicion, resultado, ms, args, kwargs):
+    medicion.plantillas_ms += ms
+
+
+def _envolver_get(get):
+    @functools.wraps(get)
+    def envoltorio(self, key, default=None, version=None):
+        medicion = _medicion.get()
+        if medicion is None or medicion._profundidad:
+            return get(self, key, default, version)
+        medicion._profundidad += 1
+        try:
+            valor = get(self, key, _SIN_VALOR, version)
+        finally:
+            medicion._profundidad -= 1
+        if valor is _SIN_VALOR:
+            medicion.cache_fallos += 1
+            return default
+        medicion.cache_aciertos += 1
+        return valor
+    envoltorio._instrumentado = True
+    return envoltorio
+
+
+def _acumular_get_many(medicion, resultado, ms, args, kwargs):
+    pedidas = len(list(args[1] if len(args) > 1 else kwargs.get('keys', ())))
+    medicion.cache_aciertos += len(resultado)
+    medicion.cache_fallos += pedidas - len(resultado)
+
+
+_instalado = False
+_instalado_lock = threading.Lock()
+
+
+def instalar():
+    """Envuelve Template.render y los backends de caché configurados (una sola vez)."""
+    global _instalado
+    with _instalado_lock:
+        if _instalado:
+            return
+        Template.render = _medir_anidado(Template.render, _acumular_render)
+        for alias in settings.CACHES:
+            backend = type(caches[alias])
+            if not getattr(backend.get, '_instrumentado', False):
+                backend.get = _envolver_get(backend.get)
+            if not getattr(backend.get_many, '_instrumentado', False):
+                backend.get_many = _medir_anidado(backend.get_many, _acumular_get_many)
+        _instalado = True
+
+
+class Histograma:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.peticiones = 0
+        self.total_ms = 0.0
+        self.sql_ms = 0.0
+        self.plantillas_ms = 0.0
+        self.consultas = 0
+        self.consultas_max = 0
+        self.cache_aciertos = 0
+        self.cache_fallos = 0
+
+    def registrar(self, total_ms, medicion):
+        self.buckets[bisect.bisect_left(BUCKETS_MS, total_ms)] += 1
+        self.peticiones += 1
+        self.total_ms += total_ms
+        self.sql_ms += medicion.sql_ms
+        self.plantillas_ms += medicion.plantillas_ms
+        self.consultas += medicion.consultas
+        self.consultas_max = max(self.consultas_max, medicion.consultas)
+        self.cache_aciertos += medicion.cache_aciertos
+        self.cache_fallos += medicion.cache_fallos
+
+    def sumar(self, otro):
+        self.buckets = [a + b for a, b in zip(self.buckets, otro.buckets)]
+        for campo in ('peticiones', 'total_ms', 'sql_ms', 'plantillas_ms', 'consultas', 'cache_aciertos', 'cache_fallos'):
+            setattr(self, campo, getattr(self, campo) + getattr(otro, campo))
+        self.consultas_max = max(self.consultas_max, otro.consultas_max)
+
+    def percentil(self, p):
+        """Límite superior del bucket donde cae el percentil `p` (None si cae en el abierto)."""
+        objetivo = p / 100 * self.peticiones
+        acumulado = 0
+        for limite, cantidad in zip(BUCKETS_MS + (None,), self.buckets):
+            acumulado += cantidad
+            if acumulado >= objetivo:
+                return limite
+        return None
+
+    def resumen(self):
+        n = self.peticiones or 1
+        return {
+            'peticiones': self.peticiones,
+            'media_ms': round(self.total_ms / n, 2),
+            'p50_ms': self.percentil(50),
+            'p95_ms': self.percentil(95),
+            'p99_ms': self.percentil(99),
+            'sql_media_ms': round(self.sql_ms / n, 2),
+            'plantillas_media_ms': round(self.plantillas_ms / n, 2),
+            'consultas_media': round(self.consultas / n, 2),
+            'consultas_max': self.consultas_max,
+            'cache_aciertos': self.cache_aciertos,
+            'cache_fallos': self.cache_fallos,
+            'buckets_ms': dict(zip([str(b) for b in BUCKETS_MS] + ['+inf'], self.buckets)),
+        }
+
+    def a_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def de_dict(cls, datos):
+        histograma = cls()
+        histograma.__dict__.update(datos)
+        return histograma
+
+
+class Registro:
+    """Histogramas por (vista, minuto) de los últimos VENTANA_MINUTOS minutos."""
+
+    def __init__(self, ventana=VENTANA_MINUTOS):
+        self.ventana = ventana
+        self._lock = threading.Lock()
+        self._minutos = {}
+
+    def registrar(self, vista, total_ms, medicion, ahora=None):
+        minuto = int((time.time() if ahora is None else ahora) // 60)
+        with self._lock:
+            por_vista = self._minutos.setdefault(minuto, {})
+            por_vista.setdefault(vista, Histograma()).registrar(total_ms, medicion)
+            for viejo in [m for m in self._minutos if m <= minuto - self.ventana]:
+                del self._minutos[viejo]
+
+    def volcar(self, ahora=None):
+        """{vista: dict serializable del histograma} sumando los minutos de la ventana."""
+        desde = int((time.time() if ahora is None else ahora) // 60) - self.ventana
+        with self._lock:
+            minutos = [por_vista for minuto, por_vista in self._minutos.items() if minuto > desde]
+            total = {}
+            for por_vista in minutos:
+                for vista, histograma in por_vista.items():
+                    total.setdefault(vista, Histograma()).sumar(histograma)
+        return {vista: histograma.a_dict() for vista, histograma in total.items()}
+
+    def limpiar(self):
+        with self._lock:
+            self._minutos.clear()
+
+
+registro = Registro()
+
+
+def combinar(volcados):
+    """Suma volcados de varios procesos y devuelve {vista: resumen}."""
+    total = {}
+    for volcado in volcados:
+        for vista, datos in volcado.items():
+            total.setdefault(vista, Histograma()).sumar(Histograma.de_dict(datos))
+    return {vista: total[vista].resumen() for vista in sorted(total)}
+
+
+def publicar():
+    """Copia el volcado de este proceso al cache para `manage.py metricas_rendimiento`."""
+    cache = caches['default']
+    pid = os.getpid()
+    cache.set(CLAVE_CACHE.format(pid), registro.volcar(), VENTANA_MINUTOS * 60)
+    procesos = cache.get(CLAVE_PROCESOS) or []
+    if pid not in procesos:
+        cache.set(CLAVE_PROCESOS, procesos + [pid], None)
+
+
+def leer_publicados():
+    cache = caches['default']
+    procesos = cache.get(CLAVE_PROCESOS) or []
+    publicados = cache.get_many([CLAVE_CACHE.format(pid) for pid in procesos])
+    return list(publicados.values())
+
+
+class InstrumentacionMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTACION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.ultima_publicacion = 0.0
+        instalar()
+
+    def __call__(self, request):
+        medicion = Medicion()
+        token = _medicion.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pila:
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(medicion))
+                response = self.get_response(request)
+        finally:
+            _medicion.reset(token)
+        total_ms = (time.perf_counter() - inicio) * 1000
+
+        response['Server-Timing'] = medicion.server_timing(total_ms)
+        match = request.resolver_match
+        vista = match.view_name if match else 'sin_resolver'
+        registro.registrar(vista, total_ms, medicion)
+        if time.monotonic() - self.ultima_publicacion > PUBLICAR_CADA:
+            self.ultima_publicacion = time.monotonic()
+            publicar()
+        return response
@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from core.models import Conversacion, MensajeArchivado, MensajeChat
+
+CAMPOS = ('id', 'conversacion_id', 'remitente_id', 'texto', 'fecha_envio')
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve por lotes a la tabla de archivo (MensajeArchivado) los mensajes de chat con más de N días. "
+        "El historial del chat los sigue mostrando al cargar mensajes anteriores. Pensado para ejecutarse "
+        "periódicamente (por ejemplo, cada noche con cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=180, help="Antigüedad mínima, en días (por defecto 180).")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Mensajes por lote (por defecto 1000).")
+
+    def handle(self, *args, **options):
+        if options['dias'] < 0 or options['batch_size'] < 1:
+            raise CommandError("--dias no puede ser negativo y --batch-size debe ser al menos 1.")
+        limite = timezone.now() - timedelta(days=options['dias'])
+        # El último mensaje de cada conversación se queda: lo muestra la bandeja de entrada.
+        viejos = MensajeChat.objects.filter(
+            fecha_envio__lt=limite, id__lt=F('conversacion__ultimo_mensaje'),
+        ).order_by('pk')
+        conexion = connections[MensajeChat.objects.db]
+        tabla = conexion.ops.quote_name(MensajeChat._meta.db_table)
+        total, ultimo = 0, 0
+        while True:
+            # Keyset sobre la clave primaria, como en compactar_notificaciones.
+            lote = list(viejos.filter(pk__gt=ultimo).values(*CAMPOS)[:options['batch_size']])
+            if not lote:
+                break
+            ids = [fila['id'] for fila in lote]
+            conversaciones = {fila['conversacion_id'] for fila in lote}
+            with transaction.atomic():
+                MensajeArchivado.objects.bulk_create([MensajeArchivado(**fila) for fila in lote])
+                # Un solo DELETE sin cargar los objetos ni emitir señales.
+                with conexion.cursor() as cursor:
+                    cursor.execute(f"DELETE FROM {tabla} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+                    total += cursor.rowcount
+                mas_reciente = MensajeArchivado.objects.filter(conversacion=OuterRef('pk')).order_by('-id')
+                Conversacion.objects.filter(pk__in=conversaciones).update(
+                    archivado_hasta=Subquery(mas_reciente.values('id')[:1]),
+                )
+            ultimo = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f"{total} mensajes anteriores al {limite:%Y-%m-%d} archivados."))
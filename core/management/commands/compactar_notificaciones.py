@@ -0,0 +1,62 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.utils import timezone
+
+from core.models import Notificacion, NotificacionesNoLeidas
+
+CAMPOS = ('id', 'usuario_id', 'tipo', 'mensaje', 'url', 'fecha_creacion')
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra por lotes las notificaciones leídas con más de N días, guardándolas antes en un "
+        "archivo JSONL si se indica. Pensado para ejecutarse periódicamente (por ejemplo, cada noche con cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=90, help="Antigüedad mínima, en días (por defecto 90).")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Notificaciones por lote (por defecto 1000).")
+        parser.add_argument('--archivo', help="Añade las notificaciones borradas a este archivo JSONL.")
+        parser.add_argument(
+            '--recontar', action='store_true',
+            help="Recalcula además los contadores de notificaciones sin leer de todos los usuarios.",
+        )
+
+    def handle(self, *args, **options):
+        if options['dias'] < 0 or options['batch_size'] < 1:
+            raise CommandError("--dias no puede ser negativo y --batch-size debe ser al menos 1.")
+        limite = timezone.now() - timedelta(days=options['dias'])
+        # Solo leídas: el contador de no leídas no cambia.
+        viejas = Notificacion.objects.filter(leida=True, fecha_creacion__lt=limite).order_by('pk')
+        conexion = connections[Notificacion.objects.db]
+        tabla = conexion.ops.quote_name(Notificacion._meta.db_table)
+        archivo = open(options['archivo'], 'a', encoding='utf-8') if options['archivo'] else None
+        total, ultimo = 0, 0
+        try:
+            while True:
+                # Keyset sobre la clave primaria, como en core/exportacion.py.
+                lote = list(viejas.filter(pk__gt=ultimo).values(*CAMPOS)[:options['batch_size']])
+                if not lote:
+                    break
+                if archivo:
+                    for fila in lote:
+                        archivo.write(json.dumps(fila, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+                    archivo.flush()
+                ids = [fila['id'] for fila in lote]
+                # Un solo DELETE sin cargar los objetos ni emitir señales.
+                with conexion.cursor() as cursor:
+                    cursor.execute(f"DELETE FROM {tabla} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+                    total += cursor.rowcount
+                ultimo = ids[-1]
+        finally:
+            if archivo:
+                archivo.close()
+        self.stdout.write(self.style.SUCCESS(f"{total} notificaciones leídas anteriores al {limite:%Y-%m-%d} borradas."))
+
+        if options['recontar']:
+            usuarios = NotificacionesNoLeidas.recontar()
+            self.stdout.write(f"Contadores recalculados: {len(usuarios)} usuarios con notificaciones sin leer.")
@@ -0,0 +1,41 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import metricas
+from core.models import ContadorMetrica
+
+
+class Command(BaseCommand):
+    help = (
+        "Recuenta los contadores del panel de administración y consolida las ventas diarias "
+        "de los últimos días. Pensado para ejecutarse periódicamente (por ejemplo, cada hora con cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=2,
+            help="Días de ventas a rehacer, contando hoy (por defecto 2: ayer y hoy).",
+        )
+        parser.add_argument('--desde', help="Rehace las ventas desde esta fecha (AAAA-MM-DD); ignora --dias.")
+        parser.add_argument('--sin-contadores', action='store_true', help="Solo consolida las ventas.")
+
+    def handle(self, *args, **options):
+        hoy = timezone.localdate()
+        if options['desde']:
+            try:
+                desde = date.fromisoformat(options['desde'])
+            except ValueError:
+                raise CommandError(f"Fecha no válida: {options['desde']}")
+        else:
+            desde = hoy - timedelta(days=max(options['dias'], 1) - 1)
+
+        if not options['sin_contadores']:
+            anteriores = dict(ContadorMetrica.objects.values_list('nombre', 'valor'))
+            for nombre, valor in metricas.recalcular().items():
+                if anteriores.get(nombre) != valor:
+                    self.stdout.write(f"{nombre}: {anteriores.get(nombre)} -> {valor}")
+
+        filas = metricas.consolidar_ventas(desde, hoy)
+        self.stdout.write(self.style.SUCCESS(f"Ventas consolidadas del {desde} al {hoy}: {filas} filas."))
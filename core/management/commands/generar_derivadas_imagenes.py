@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from core.imagenes import derivadas_de_archivo, necesita_derivadas
+from core.models import Producto
+
+
+def _inicializar_worker():
+    # Con el método 'spawn' el proceso hijo arranca sin Django configurado.
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+class Command(BaseCommand):
+    help = "Genera las derivadas (WebP/AVIF por anchos) de las imágenes de producto existentes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--forzar', action='store_true', help="Regenera aunque ya existan.")
+
+    def handle(self, *args, **options):
+        pendientes = {}
+        productos = Producto.objects.exclude(imagen='').exclude(imagen__isnull=True).only(
+            'pk', 'imagen', 'imagen_derivadas',
+        ).order_by('pk')
+        for producto in productos.iterator(chunk_size=options['batch_size']):
+            if options['forzar'] or necesita_derivadas(producto):
+                pendientes.setdefault(producto.imagen.name, []).append(producto)
+
+        self.stdout.write(f"{len(pendientes)} imágenes por procesar.")
+        if not pendientes:
+            return
+
+        procesadas, errores, lote = 0, 0, []
+        for nombre, datos, error in self.generar(list(pendientes), options['procesos']):
+            if error:
+                errores += 1
+                self.stderr.write(f"{nombre}: {error}")
+                continue
+            for producto in pendientes[nombre]:
+                producto.imagen_derivadas = datos
+                producto.actualizado = timezone.now()
+                lote.append(producto)
+            procesadas += 1
+            if len(lote) >= options['batch_size']:
+                Producto.objects.bulk_update(lote, ['imagen_derivadas', 'actualizado'])
+                lote = []
+        if lote:
+            Producto.objects.bulk_update(lote, ['imagen_derivadas', 'actualizado'])
+        self.stdout.write(self.style.SUCCESS(f"{procesadas} imágenes procesadas, {errores} con errores."))
+
+    def generar(self, nombres, procesos):
+        if procesos <= 1:
+            for nombre in nombres:
+                try:
+                    yield nombre, derivadas_de_archivo(nombre), None
+                except Exception as e:
+                    yield nombre, None, e
+            return
+
+        # Los hijos solo leen y escriben archivos; no deben heredar conexiones abiertas.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_worker) as pool:
+            futuros = {pool.submit(derivadas_de_archivo, nombre): nombre for nombre in nombres}
+            for futuro in as_completed(futuros):
+                try:
+                    yield futuros[futuro], futuro.result(), None
+                except Exception as e:
+                    yield futuros[futuro], None, e
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import importacion
+from core.models import Tienda
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa productos a una tienda desde un CSV o JSONL. Si alguna fila es inválida "
+        "no se guarda nada y se listan los errores."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--tienda', type=int, required=True, help="Id de la tienda.")
+        parser.add_argument('--formato', choices=importacion.FORMATOS, help="Por defecto, según la extensión.")
+        parser.add_argument('--batch-size', type=int, default=importacion.LOTE)
+        parser.add_argument('--dry-run', action='store_true', help="Valida el archivo sin guardar nada.")
+        parser.add_argument(
+            '--sin-avisos', action='store_true', help="No notifica a los seguidores de la tienda.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            tienda = Tienda.objects.get(pk=options['tienda'])
+        except Tienda.DoesNotExist:
+            raise CommandError(f"No existe la tienda {options['tienda']}.")
+        formato = options['formato'] or importacion.formato_de(options['archivo'])
+
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                creados = importacion.importar_productos(
+                    tienda, importacion.leer_filas(archivo, formato), lote=options['batch_size'],
+                    simular=options['dry_run'], notificar=not options['sin_avisos'],
+                )
+        except OSError as e:
+            raise CommandError(f"No se pudo leer {options['archivo']}: {e}")
+        except importacion.ImportacionInvalida as e:
+            for linea, detalle in e.errores:
+                self.stderr.write(f"Línea {linea}: {detalle}")
+            raise CommandError(f"{e.total_errores} filas con errores; no se importó nada.")
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Archivo válido: se importarían {creados} productos."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{creados} productos importados en '{tienda.nombre}'."))
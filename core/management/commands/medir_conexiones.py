@@ -0,0 +1,135 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.utils import load_backend
+
+from core.bd.pool import vaciar_pools
+from core.benchmark.carga import percentil
+
+# Backend de core.bd (con pool) para cada motor.
+BACKENDS = {'mysql': 'core.bd.mysql', 'sqlite': 'core.bd.sqlite3'}
+MODOS = ('nueva', 'persistente', 'pool')
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el coste de conexión por petición con CONN_MAX_AGE=0 (una conexión nueva por petición), "
+        "conexiones persistentes con health checks y el pool de core/bd/pool.py. Cada petición simulada "
+        "hace el ciclo de Django: comprobar la conexión al empezar, N consultas triviales y cerrar o "
+        "conservar la conexión al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=500)
+        parser.add_argument('--consultas', type=int, default=3, help="Consultas por petición (SELECT 1).")
+        parser.add_argument('--modos', nargs='+', choices=MODOS, default=list(MODOS))
+        parser.add_argument(
+            '--hilo-por-peticion', action='store_true',
+            help="Cada petición en un hilo nuevo, como runserver: las conexiones persistentes no se reutilizan.",
+        )
+        parser.add_argument('--tamano-pool', type=int, default=4)
+        parser.add_argument(
+            '--sqlite', action='store_true',
+            help="Usa un archivo SQLite temporal en vez de la base `default` (sustituto local de MySQL).",
+        )
+        parser.add_argument('--salida', help="Guarda los resultados en este archivo JSON.")
+
+    def handle(self, *args, **options):
+        if options['peticiones'] < 1:
+            raise CommandError("--peticiones debe ser al menos 1.")
+        if options['sqlite']:
+            directorio = tempfile.mkdtemp(prefix='bench-conexiones-')
+            base = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(directorio, 'db.sqlite3')}
+        else:
+            base = connections['default'].settings_dict
+        vendor = 'sqlite' if 'sqlite' in base['ENGINE'] else 'mysql'
+
+        resultados = {}
+        for modo in options['modos']:
+            ajustes = self.ajustes(base, modo, options['tamano_pool'])
+            resultados[modo] = self.medir(
+                BACKENDS[vendor], ajustes, f'bench-{modo}', options['peticiones'], options['consultas'],
+                options['hilo_por_peticion'],
+            )
+            r = resultados[modo]
+            self.stdout.write(
+                f"{modo:<12} p50 {r['p50_ms']:>7.3f} ms  p95 {r['p95_ms']:>7.3f} ms  "
+                f"media {r['media_ms']:>7.3f} ms  conexiones abiertas {r['conexiones']}"
+            )
+        vaciar_pools()
+
+        if options['salida']:
+            informe = {
+                'motor': vendor, 'peticiones': options['peticiones'], 'consultas': options['consultas'],
+                'hilo_por_peticion': options['hilo_por_peticion'], 'modos': resultados,
+            }
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(informe, archivo, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['salida']}"))
+
+    def ajustes(self, base, modo, tamano_pool):
+        # configure_settings completa las claves que Django añade a cada entrada de DATABASES.
+        ajustes = {**base, 'CONN_HEALTH_CHECKS': False, 'POOL': None}
+        ajustes = connections.configure_settings({'default': ajustes})['default']
+        if modo == 'nueva':
+            ajustes['CONN_MAX_AGE'] = 0
+        elif modo == 'persistente':
+            ajustes.update(CONN_MAX_AGE=600, CONN_HEALTH_CHECKS=True)
+        else:
+            ajustes.update(CONN_MAX_AGE=0, POOL={'tamano': tamano_pool})
+        return ajustes
+
+    def medir(self, backend, ajustes, alias, peticiones, consultas, hilo_por_peticion):
+        DatabaseWrapper = load_backend(backend).DatabaseWrapper
+        abiertas = {}
+        original = DatabaseWrapper.get_new_connection
+        lock = threading.Lock()
+
+        class Contado(DatabaseWrapper):
+            # Cuenta las conexiones realmente abiertas (no las que se toman del pool).
+            def get_new_connection(self, conn_params):
+                conexion = original(self, conn_params)
+                with lock:
+                    # Se guardan las conexiones para que su id no se reutilice.
+                    abiertas[id(conexion)] = conexion
+                return conexion
+
+        def peticion(conexion):
+            inicio = time.perf_counter()
+            conexion.close_if_unusable_or_obsolete()  # request_started
+            for _ in range(consultas):
+                with conexion.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+            conexion.close_if_unusable_or_obsolete()  # request_finished
+            return (time.perf_counter() - inicio) * 1000
+
+        latencias = []
+        if hilo_por_peticion:
+            for _ in range(peticiones):
+                # Un DatabaseWrapper por hilo, como hace django.db.connections.
+                def en_hilo():
+                    conexion = Contado(ajustes, alias)
+                    latencias.append(peticion(conexion))
+                    # Lo que haría el recolector al terminar el hilo con una conexión persistente.
+                    conexion.close()
+                hilo = threading.Thread(target=en_hilo)
+                hilo.start()
+                hilo.join()
+        else:
+            conexion = Contado(ajustes, alias)
+            latencias = [peticion(conexion) for _ in range(peticiones)]
+            conexion.close()
+
+        latencias.sort()
+        return {
+            'p50_ms': round(percentil(latencias, 50), 3),
+            'p95_ms': round(percentil(latencias, 95), 3),
+            'media_ms': round(sum(latencias) / len(latencias), 3),
+            'conexiones': len(abiertas),
+        }
@@ -0,0 +1,225 @@
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import ExitStack
+from functools import partial
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from core import plantillas
+from core.benchmark import datos, escenarios
+from core.benchmark.carga import ClienteDjango, ClienteHTTP, ServidorLocal, medir
+
+CACHES_BENCHMARK = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'archivo': 'django.core.cache.backends.filebased.FileBasedCache',
+    'ninguna': 'django.core.cache.backends.dummy.DummyCache',
+}
+LOADERS_SIN_CACHE = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+# --plantillas -> loaders; 'cache' y 'precompiladas' vacían la caché antes de cada escenario.
+LOADERS_BENCHMARK = {
+    'sin-cache': LOADERS_SIN_CACHE,
+    'cache': [('django.template.loaders.cached.Loader', LOADERS_SIN_CACHE)],
+    'precompiladas': [('django.template.loaders.cached.Loader', LOADERS_SIN_CACHE)],
+}
+METRICAS_COMPARADAS = ('p50_ms', 'p95_ms', 'p99_ms', 'consultas_media', 'throughput_rps')
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra un marketplace sintético en una base de datos de prueba y mide latencia "
+        "(p50/p95/p99), consultas por petición y throughput de las vistas más usadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', choices=sorted(datos.ESCALAS), default='pequena')
+        for campo in datos.ESCALAS['pequena']:
+            parser.add_argument(f'--{campo}', type=int, help=f"Sobrescribe '{campo}' de la escala.")
+        parser.add_argument('--escenarios', nargs='+', metavar='ESCENARIO', help="Por defecto, todos.")
+        parser.add_argument('--peticiones', type=int, default=200, help="Peticiones medidas por escenario.")
+        parser.add_argument('--concurrencia', type=int, default=4)
+        parser.add_argument('--calentamiento', type=int, default=10)
+        parser.add_argument(
+            '--profundidades', type=int, nargs='+', default=list(escenarios.PROFUNDIDADES), metavar='PAGINA',
+            help="Páginas del catálogo de los escenarios catalogo_pagina_N (se omiten las que no existen).",
+        )
+        parser.add_argument(
+            '--modo', choices=('cliente', 'wsgi'), default='cliente',
+            help="'cliente': cliente de pruebas en el proceso; 'wsgi': HTTP contra un servidor local con hilos.",
+        )
+        parser.add_argument(
+            '--cache', choices=('actual',) + tuple(CACHES_BENCHMARK), default='actual',
+            help="Backend de caché durante la medición.",
+        )
+        parser.add_argument(
+            '--plantillas', choices=('actual',) + tuple(LOADERS_BENCHMARK), default='actual',
+            help=(
+                "Carga de plantillas: 'sin-cache' compila en cada petición; 'cache' y 'precompiladas' "
+                "empiezan cada escenario con la caché vacía, y 'precompiladas' la llena antes (como al "
+                "arrancar con PRECOMPILAR_PLANTILLAS). Compara 'primera' con p50."
+            ),
+        )
+        parser.add_argument(
+            '--conservar-bd', action='store_true',
+            help="Reutiliza (y conserva) la base de datos de prueba sembrada para no volver a sembrar.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--salida', help="Guarda los resultados en este archivo JSON.")
+        parser.add_argument('--comparar', help="JSON de una ejecución anterior con el que comparar.")
+
+    def handle(self, *args, **options):
+        escala = dict(datos.ESCALAS[options['escala']])
+        for campo in escala:
+            if options[campo] is not None:
+                escala[campo] = options[campo]
+        anterior = self.leer(options['comparar']) if options['comparar'] else None
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING("DEBUG=True: las cifras no representan producción."))
+
+        with ExitStack() as pila:
+            pila.enter_context(override_settings(**self.ajustes(options, pila)))
+            pila.callback(self.destruir_bd, self.crear_bd(options['conservar_bd']), options['conservar_bd'])
+
+            if datos.sembrado():
+                self.stdout.write("Reutilizando los datos sembrados.")
+            else:
+                datos.sembrar(escala, lote=options['batch_size'], log=self.stdout.write)
+            usuarios = datos.usuarios_de_prueba()
+            todos = escenarios.construir(usuarios, profundidades=options['profundidades'])
+            nombres = options['escenarios'] or list(todos)
+            desconocidos = set(nombres) - set(todos)
+            if desconocidos:
+                raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+            servidor = pila.enter_context(ServidorLocal()) if options['modo'] == 'wsgi' else None
+            resultados = {}
+            for nombre in nombres:
+                rol, urls = todos[nombre]
+                usuario = usuarios[rol] if rol else None
+                if servidor:
+                    crear_cliente = partial(ClienteHTTP, servidor.url_base, usuario)
+                else:
+                    crear_cliente = partial(ClienteDjango, usuario)
+                precompilar_ms = self.preparar_plantillas(options['plantillas'])
+                resultados[nombre] = medir(
+                    crear_cliente, urls, options['peticiones'],
+                    concurrencia=options['concurrencia'], calentamiento=options['calentamiento'],
+                )
+                if precompilar_ms is not None:
+                    resultados[nombre]['precompilar_ms'] = precompilar_ms
+                self.informar(nombre, resultados[nombre], (anterior or {}).get('escenarios', {}).get(nombre))
+
+        informe = {'meta': self.metadatos(options, escala), 'escenarios': resultados}
+        por_pagina = escenarios.latencia_por_pagina(resultados)
+        if len(por_pagina) > 1:
+            # Con paginación por cursor, el p50 de una página profunda debe quedar cerca del de la primera.
+            self.stdout.write("Catálogo, p50 por página:")
+            for pagina, p50, relativo in por_pagina:
+                self.stdout.write(f"  página {pagina:>7}  {p50:>8.2f} ms" + (f"  x{relativo}" if relativo else ""))
+            informe['catalogo_por_pagina'] = [
+                {'pagina': pagina, 'p50_ms': p50, 'relativo': relativo} for pagina, p50, relativo in por_pagina
+            ]
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(informe, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['salida']}"))
+
+    def ajustes(self, options, pila):
+        ajustes = {
+            'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver', '127.0.0.1', 'localhost'],
+            # Los avisos se encolan pero no se procesan: no compiten con las peticiones medidas.
+            'NOTIFICACIONES_EJECUTOR': 'worker',
+        }
+        if options['plantillas'] != 'actual':
+            motor = dict(settings.TEMPLATES[0], APP_DIRS=False)
+            motor['OPTIONS'] = dict(motor.get('OPTIONS', {}), loaders=LOADERS_BENCHMARK[options['plantillas']])
+            ajustes['TEMPLATES'] = [motor] + list(settings.TEMPLATES[1:])
+        if options['cache'] != 'actual':
+            cache = {'BACKEND': CACHES_BENCHMARK[options['cache']]}
+            if options['cache'] == 'archivo':
+                directorio = tempfile.mkdtemp(prefix='bench-cache-')
+                pila.callback(shutil.rmtree, directorio, ignore_errors=True)
+                cache['LOCATION'] = directorio
+            ajustes['CACHES'] = {'default': cache}
+        return ajustes
+
+    def preparar_plantillas(self, modo):
+        """Vacía la caché de plantillas y, con 'precompiladas', la llena; devuelve lo que tardó (ms)."""
+        if modo not in ('cache', 'precompiladas'):
+            return None
+        plantillas.reiniciar()
+        if modo == 'cache':
+            return None
+        inicio = time.perf_counter()
+        plantillas.precompilar()
+        return round((time.perf_counter() - inicio) * 1000, 2)
+
+    def crear_bd(self, conservar):
+        # Una base de prueba aparte, como la del test runner: nunca se siembra la real.
+        nombre_original = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST'].get('NAME'):
+            # En memoria los hilos se bloquean entre sí al escribir; un archivo se comporta como en producción.
+            connection.settings_dict['TEST']['NAME'] = f'{tempfile.gettempdir()}/marketplace-bench.sqlite3'
+        self.stdout.write("Preparando la base de datos de prueba...")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=conservar, serialize=False)
+        return nombre_original
+
+    def destruir_bd(self, nombre_original, conservar):
+        connection.creation.destroy_test_db(nombre_original, verbosity=0, keepdb=conservar)
+
+    def leer(self, ruta):
+        try:
+            with open(ruta, encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"No se pudo leer {ruta}: {e}")
+
+    def informar(self, nombre, resultado, anterior):
+        linea = (
+            f"{nombre:<24} p50 {resultado['p50_ms']:>8.2f} ms  p95 {resultado['p95_ms']:>8.2f} ms  "
+            f"p99 {resultado['p99_ms']:>8.2f} ms  {resultado['throughput_rps']:>8.1f} req/s  "
+            f"consultas {resultado['consultas_media']}  primera {resultado['primera_ms']:.1f} ms"
+        )
+        if 'precompilar_ms' in resultado:
+            linea += f"  (precompilación {resultado['precompilar_ms']:.1f} ms)"
+        if resultado['errores']:
+            linea += self.style.ERROR(f"  {resultado['errores']} errores")
+        self.stdout.write(linea)
+        if anterior:
+            cambios = []
+            for metrica in METRICAS_COMPARADAS:
+                antes, ahora = anterior.get(metrica), resultado.get(metrica)
+                if antes and ahora is not None:
+                    cambios.append(f"{metrica} {(ahora - antes) / antes:+.1%}")
+            self.stdout.write(f"{'':<24} vs. anterior: {', '.join(cambios)}")
+
+    def metadatos(self, options, escala):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            ).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'fecha': datetime.now(dt_timezone.utc).isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'base_de_datos': connection.vendor,
+            'cache': options['cache'],
+            'plantillas': options['plantillas'],
+            'modo': options['modo'],
+            'debug': settings.DEBUG,
+            'escala': escala,
+            'peticiones': options['peticiones'],
+            'concurrencia': options['concurrencia'],
+        }
@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core import instrumentacion
+
+
+class Command(BaseCommand):
+    help = (
+        "Muestra los histogramas por vista que publican los procesos con INSTRUMENTACION=True "
+        "(requiere un cache compartido para ver más de un proceso)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help="Vuelca el resumen como JSON.")
+        parser.add_argument(
+            '--orden', choices=('media_ms', 'peticiones', 'consultas_media', 'sql_media_ms'), default='media_ms',
+        )
+
+    def handle(self, *args, **options):
+        publicados = instrumentacion.leer_publicados()
+        vistas = instrumentacion.combinar(publicados)
+        if options['json']:
+            self.stdout.write(json.dumps({'procesos': len(publicados), 'vistas': vistas}, indent=2))
+            return
+        if not vistas:
+            self.stdout.write("No hay métricas publicadas (¿INSTRUMENTACION=False o un cache local al proceso?).")
+            return
+
+        self.stdout.write(
+            f"{len(publicados)} procesos, últimos {instrumentacion.VENTANA_MINUTOS} minutos.\n"
+            f"{'vista':<32} {'pet.':>7} {'media':>9} {'p95≤':>7} {'sql':>8} {'tpl':>8} {'consultas':>10} {'cache':>12}"
+        )
+        for vista, r in sorted(vistas.items(), key=lambda item: item[1][options['orden']], reverse=True):
+            p95 = r['p95_ms'] if r['p95_ms'] is not None else f">{instrumentacion.BUCKETS_MS[-1]}"
+            self.stdout.write(
+                f"{vista:<32} {r['peticiones']:>7} {r['media_ms']:>7.1f}ms {p95:>5}ms "
+                f"{r['sql_media_ms']:>6.1f}ms {r['plantillas_media_ms']:>6.1f}ms "
+                f"{r['consultas_media']:>6.1f}/{r['consultas_max']:<3} {r['cache_aciertos']:>5}/{r['cache_fallos']:<6}"
+            )
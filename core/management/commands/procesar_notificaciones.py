@@ -0,0 +1,45 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import TareaNotificacion
+from core.notificaciones import procesar_pendientes, reencolar_atascadas
+
+
+class Command(BaseCommand):
+    help = "Procesa la cola de notificaciones (para NOTIFICACIONES_EJECUTOR='worker')."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help="Vacía la cola y termina.")
+        parser.add_argument('--intervalo', type=float, default=2, help="Segundos de espera con la cola vacía.")
+        parser.add_argument(
+            '--reintentar-tras', type=int, default=10,
+            help="Minutos tras los que una tarea 'procesando' se considera abandonada.",
+        )
+        parser.add_argument(
+            '--purgar-dias', type=int, default=None,
+            help="Borra las tareas completadas con más de N días.",
+        )
+
+    def handle(self, *args, **options):
+        if options['purgar_dias'] is not None:
+            limite = timezone.now() - timedelta(days=options['purgar_dias'])
+            borradas, _ = TareaNotificacion.objects.filter(
+                estado='completada', fecha_actualizacion__lt=limite,
+            ).delete()
+            self.stdout.write(f"{borradas} tareas completadas purgadas.")
+
+        total = 0
+        while True:
+            reencoladas = reencolar_atascadas(options['reintentar_tras'])
+            if reencoladas:
+                self.stdout.write(self.style.WARNING(f"{reencoladas} tareas abandonadas vuelven a la cola."))
+            procesadas = procesar_pendientes()
+            total += procesadas
+            if options['una_vez']:
+                break
+            if not procesadas:
+                time.sleep(options['intervalo'])
+        self.stdout.write(self.style.SUCCESS(f"{total} tareas de notificación procesadas."))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from core.models import Producto, Tienda, agregados_calificacion
+
+
+class Command(BaseCommand):
+    help = "Recalcula los agregados de calificación de productos y tiendas y corrige los desfasados."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Solo informa cuántas filas están desfasadas.",
+        )
+
+    def handle(self, *args, **options):
+        objetivos = [
+            (Producto, Q(resenas__activa=True)),
+            (Tienda, Q(resenas__aprobada=True)),
+        ]
+        for modelo, filtro in objetivos:
+            corregidos = self.reconciliar(modelo, filtro, options['batch_size'], options['dry_run'])
+            nombre = modelo._meta.verbose_name_plural
+            self.stdout.write(f"{nombre}: {corregidos} desfasados.")
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS("Calificaciones reconciliadas."))
+
+    def reconciliar(self, modelo, filtro, batch_size, dry_run):
+        campos = ['calificacion_suma', 'calificacion_conteo', 'calificacion_promedio']
+        campos_guardados = campos + ['actualizado'] if modelo is Producto else campos
+        filas = (
+            modelo.objects
+            .annotate(suma=Sum('resenas__calificacion', filter=filtro), conteo=Count('resenas', filter=filtro))
+            .only('pk', *campos)
+            .order_by('pk')
+            .iterator(chunk_size=batch_size)
+        )
+        corregidos = 0
+        lote = []
+        for obj in filas:
+            esperado = agregados_calificacion(obj.suma, obj.conteo)
+            if all(getattr(obj, campo) == esperado[campo] for campo in campos):
+                continue
+            corregidos += 1
+            if dry_run:
+                continue
+            for campo, valor in esperado.items():
+                setattr(obj, campo, valor)
+            if modelo is Producto:
+                obj.actualizado = timezone.now()
+            lote.append(obj)
+            if len(lote) >= batch_size:
+                self.guardar(modelo, lote, campos_guardados)
+                lote = []
+        if lote:
+            self.guardar(modelo, lote, campos_guardados)
+        return corregidos
+
+    def guardar(self, modelo, lote, campos):
+        with transaction.atomic():
+            modelo.objects.bulk_update(lote, campos)
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Producto, ProductoBusqueda
+from core.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda del catálogo por lotes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--limpiar', action='store_true',
+            help="Borra los documentos existentes antes de reindexar.",
+        )
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        batch_size = options['batch_size']
+        total = 0
+
+        with transaction.atomic():
+            if options['limpiar']:
+                ProductoBusqueda.objects.all().delete()
+
+            productos = (
+                Producto.objects.select_related('tienda', 'categoria')
+                .order_by('id')
+                .iterator(chunk_size=batch_size)
+            )
+            lote = []
+            for producto in productos:
+                lote.append(producto)
+                if len(lote) >= batch_size:
+                    total += backend.indexar(lote)
+                    lote = []
+            if lote:
+                total += backend.indexar(lote)
+
+        backend.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f"{total} productos indexados."))
@@ -0,0 +1,179 @@
+"""
+Métricas del panel de administración.
+
+Contadores: una fila de ContadorMetrica por total que muestra el panel
+(usuarios, productos, tiendas y las colas de moderación). Las señales de
+core/signals.py los ajustan con un UPDATE `valor = valor + delta` dentro de
+la misma transacción que el cambio, comparando si la fila cumplía el filtro
+del contador antes y después de guardarla. bulk_create, update() y los
+borrados con SQL no emiten señales: quien los use llama a sumar(), y
+`manage.py consolidar_metricas` recuenta periódicamente para corregir la
+deriva.
+
+Ventas: VentaDiaria guarda por día, tienda y categoría los pedidos no
+cancelados ni rechazados. consolidar_ventas() rehace los días pedidos a
+partir de Pedido (un pedido puede cambiar de estado después), y el panel
+solo lee esas filas, así que su coste no depende del número de pedidos.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import ContadorMetrica, Pedido, Producto, ReporteAbuso, ResenaDeProducto, SoporteTicket, Tienda, VentaDiaria
+
+# nombre -> (modelo, filtro). Si se añade uno, 0014_metricas_admin solo crea
+# los existentes: los nuevos se calculan la primera vez que se leen.
+CONTADORES = {
+    'usuarios': (User, {}),
+    'productos': (Producto, {}),
+    'tiendas': (Tienda, {}),
+    'tiendas_pendientes': (Tienda, {'aprobada': False}),
+    'resenas_pendientes': (ResenaDeProducto, {'aprobada': False, 'activa': True}),
+    'tickets_abiertos': (SoporteTicket, {'estado': 'abierto'}),
+    'reportes_pendientes': (ReporteAbuso, {'estado': 'pendiente'}),
+}
+# Estados de Pedido que cuentan como venta.
+ESTADOS_VENTA = ('P', 'C')
+DIAS_PANEL = 30
+
+
+# --- Contadores ---
+
+def _contadores_de(modelo):
+    return {nombre: filtro for nombre, (m, filtro) in CONTADORES.items() if m is modelo}
+
+
+def _cumple(valor_de, filtro):
+    return all(valor_de(campo) == esperado for campo, esperado in filtro.items())
+
+
+def _estado(modelo, valor_de):
+    return {nombre: _cumple(valor_de, filtro) for nombre, filtro in _contadores_de(modelo).items()}
+
+
+def sumar(deltas):
+    """Aplica {nombre: delta} a los contadores."""
+    for nombre, delta in deltas.items():
+        if not delta:
+            continue
+        actualizados = ContadorMetrica.objects.filter(nombre=nombre).update(valor=F('valor') + delta)
+        if not actualizados:
+            recalcular([nombre])
+
+
+def recordar_estado(modelo, instance, update_fields=None):
+    """pre_save: guarda qué contadores cumplía la fila antes de modificarla."""
+    if instance._state.adding or instance.pk is None:
+        return
+    campos = {campo for filtro in _contadores_de(modelo).values() for campo in filtro}
+    if not campos or (update_fields is not None and not campos.intersection(update_fields)):
+        return
+    fila = modelo._base_manager.filter(pk=instance.pk).values(*campos).first()
+    if fila is not None:
+        instance._metricas_antes = _estado(modelo, fila.get)
+
+
+def al_guardar(modelo, instance, created):
+    despues = _estado(modelo, lambda campo: getattr(instance, campo))
+    if created:
+        antes = dict.fromkeys(despues, False)
+    else:
+        antes = instance.__dict__.pop('_metricas_antes', despues)
+    sumar({nombre: int(despues[nombre]) - int(antes[nombre]) for nombre in despues})
+
+
+def al_borrar(modelo, instance):
+    despues = _estado(modelo, lambda campo: getattr(instance, campo))
+    sumar({nombre: -1 for nombre, cumplia in despues.items() if cumplia})
+
+
+def recalcular(nombres=None):
+    """Recuenta los contadores (todos por defecto) y devuelve {nombre: valor}."""
+    valores = {}
+    for nombre in nombres or CONTADORES:
+        modelo, filtro = CONTADORES[nombre]
+        valores[nombre] = modelo.objects.filter(**filtro).count()
+        ContadorMetrica.objects.update_or_create(nombre=nombre, defaults={'valor': valores[nombre]})
+    return valores
+
+
+def valores():
+    """{nombre: valor} de todos los contadores, en una consulta."""
+    actuales = dict(ContadorMetrica.objects.filter(nombre__in=CONTADORES).values_list('nombre', 'valor'))
+    faltan = set(CONTADORES) - set(actuales)
+    if faltan:
+        actuales.update(recalcular(sorted(faltan)))
+    return actuales
+
+
+# --- Ventas ---
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def consolidar_ventas(desde, hasta=None):
+    """
+    Rehace las filas de VentaDiaria de los días `desde`..`hasta` (incluidos).
+    Devuelve cuántas escribe.
+
+    El monto usa el precio guardado en cada pedido; solo los pedidos que no
+    lo tienen (anteriores a Pedido.precio_unitario o creados sin
+    realizar_pedido) usan el precio actual del producto.
+    """
+    hasta = hasta or timezone.localdate()
+    monto = ExpressionWrapper(
+        F('cantidad') * Coalesce('precio_unitario', 'producto__precio'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    filas = (
+        Pedido.objects.filter(
+            estado__in=ESTADOS_VENTA,
+            fecha_creacion__gte=_inicio_del_dia(desde),
+            fecha_creacion__lt=_inicio_del_dia(hasta + timedelta(days=1)),
+        )
+        .annotate(dia=TruncDate('fecha_creacion'))
+        .values('dia', 'producto__tienda_id', 'producto__categoria_id')
+        .annotate(total_pedidos=Count('id'), total_unidades=Sum('cantidad'), total_monto=Sum(monto))
+        .order_by()
+    )
+    with transaction.atomic():
+        # update_or_create sobre la restricción única (fecha, tienda, categoría):
+        # dos consolidaciones a la vez no pueden duplicar una fila.
+        escritas = []
+        for fila in filas:
+            venta, _ = VentaDiaria.objects.update_or_create(
+                fecha=fila['dia'], tienda_id=fila['producto__tienda_id'], categoria_id=fila['producto__categoria_id'],
+                defaults={
+                    'pedidos': fila['total_pedidos'], 'unidades': fila['total_unidades'],
+                    'monto': fila['total_monto'] or Decimal('0'),
+                },
+            )
+            escritas.append(venta.pk)
+        # Días, tiendas o categorías que ya no tienen ventas (pedidos cancelados después).
+        VentaDiaria.objects.filter(fecha__gte=desde, fecha__lte=hasta).exclude(pk__in=escritas).delete()
+    return len(escritas)
+
+
+def resumen_ventas(dias=DIAS_PANEL, limite=5):
+    """Totales de los últimos `dias` días y las tiendas y categorías que más vendieron."""
+    ventas = VentaDiaria.objects.filter(fecha__gte=timezone.localdate() - timedelta(days=dias - 1))
+    sumas = {'pedidos': Sum('pedidos'), 'unidades': Sum('unidades'), 'monto': Sum('monto')}
+    totales = ventas.aggregate(**sumas)
+    return {
+        'dias': dias,
+        'pedidos': totales['pedidos'] or 0,
+        'unidades': totales['unidades'] or 0,
+        'monto': totales['monto'] or Decimal('0'),
+        'tiendas': list(
+            ventas.values('tienda_id', 'tienda__nombre').annotate(**sumas).order_by('-monto', 'tienda_id')[:limite]
+        ),
+        'categorias': list(
+            ventas.values('categoria__nombre').annotate(**sumas).order_by('-monto', 'categoria__nombre')[:limite]
+        ),
+    }
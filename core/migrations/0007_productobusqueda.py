@@ -0,0 +1,84 @@
+# Generated by Django 4.2.26 on 2026-10-18 15:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+FTS_TABLE = 'core_productobusqueda_fts'
+
+
+def crear_indice_texto(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute(
+            'CREATE FULLTEXT INDEX core_productobusqueda_documento_ft '
+            'ON core_productobusqueda (documento)'
+        )
+    elif vendor == 'sqlite':
+        # Tabla FTS5 de contenido externo sincronizada por triggers.
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"documento, content='core_productobusqueda', content_rowid='producto_id', "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER core_productobusqueda_ai AFTER INSERT ON core_productobusqueda BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, documento) VALUES (new.producto_id, new.documento); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER core_productobusqueda_ad AFTER DELETE ON core_productobusqueda BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, documento) VALUES ('delete', old.producto_id, old.documento); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER core_productobusqueda_au AFTER UPDATE ON core_productobusqueda BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, documento) VALUES ('delete', old.producto_id, old.documento); "
+            f"INSERT INTO {FTS_TABLE}(rowid, documento) VALUES (new.producto_id, new.documento); END"
+        )
+
+
+def borrar_indice_texto(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute(
+            'DROP INDEX core_productobusqueda_documento_ft ON core_productobusqueda'
+        )
+    elif vendor == 'sqlite':
+        for trigger in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS core_productobusqueda_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def indexar_productos(apps, schema_editor):
+    from core.search import documento_producto
+
+    Producto = apps.get_model('core', 'Producto')
+    ProductoBusqueda = apps.get_model('core', 'ProductoBusqueda')
+    db = schema_editor.connection.alias
+    productos = Producto.objects.using(db).select_related('tienda', 'categoria').iterator(chunk_size=1000)
+    lote = []
+    for producto in productos:
+        lote.append(ProductoBusqueda(producto_id=producto.id, documento=documento_producto(producto)))
+        if len(lote) >= 1000:
+            ProductoBusqueda.objects.using(db).bulk_create(lote)
+            lote = []
+    if lote:
+        ProductoBusqueda.objects.using(db).bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_notificacion_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductoBusqueda',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='busqueda', serialize=False, to='core.producto')),
+                ('documento', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.RunPython(crear_indice_texto, borrar_indice_texto),
+        migrations.RunPython(indexar_productos, migrations.RunPython.noop),
+    ]
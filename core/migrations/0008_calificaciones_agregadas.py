@@ -0,0 +1,67 @@
+# Generated by Django 4.2.26 on 2026-10-18 15:12
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def calcular_agregados(apps, schema_editor):
+    db = schema_editor.connection.alias
+    for nombre, filtro in (('Producto', Q(resenas__activa=True)), ('Tienda', Q(resenas__aprobada=True))):
+        modelo = apps.get_model('core', nombre)
+        filas = modelo.objects.using(db).annotate(
+            suma=Sum('resenas__calificacion', filter=filtro),
+            conteo=Count('resenas', filter=filtro),
+        ).filter(conteo__gt=0)
+        for fila in filas.iterator(chunk_size=1000):
+            modelo.objects.using(db).filter(pk=fila.pk).update(
+                calificacion_suma=fila.suma,
+                calificacion_conteo=fila.conteo,
+                calificacion_promedio=(Decimal(fila.suma) / fila.conteo).quantize(Decimal('0.01')),
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_productobusqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='calificacion_conteo',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='calificacion_promedio',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='calificacion_suma',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tienda',
+            name='calificacion_conteo',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tienda',
+            name='calificacion_promedio',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='tienda',
+            name='calificacion_suma',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['activo', '-calificacion_promedio'], name='producto_activo_calif_idx'),
+        ),
+        migrations.RunPython(calcular_agregados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,130 @@
+# Generated by Django 4.2.26 on 2026-10-18 15:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_calificaciones_agregadas'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tienda',
+            name='aprobada',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddIndex(
+            model_name='conversacion',
+            index=models.Index(fields=['participante_1', '-fecha_actualizacion'], name='conv_p1_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversacion',
+            index=models.Index(fields=['participante_2', '-fecha_actualizacion'], name='conv_p2_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mensajechat',
+            index=models.Index(fields=['conversacion', 'fecha_envio'], name='mensaje_conv_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mensajechat',
+            index=models.Index(fields=['conversacion', 'leido'], name='mensaje_conv_leido_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['usuario', 'leida'], name='notif_usuario_leida_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['usuario', '-fecha_creacion'], name='notif_usuario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(condition=models.Q(('leida', False)), fields=['usuario'], name='notif_no_leidas_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['comprador', '-fecha_creacion'], name='pedido_comprador_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['producto', '-fecha_creacion'], name='pedido_producto_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['producto', 'estado'], name='pedido_producto_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['-fecha_creacion'], name='pedido_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['activo', 'fecha_creacion'], name='producto_act_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['activo', 'categoria', 'fecha_creacion'], name='producto_act_cat_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['activo', 'precio'], name='producto_act_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['activo', 'nombre'], name='producto_act_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['tienda', 'activo', 'nombre'], name='producto_tienda_act_nom_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['fecha_creacion'], name='producto_p_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['categoria', 'fecha_creacion'], name='producto_p_cat_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['precio'], name='producto_p_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['nombre'], name='producto_p_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['calificacion_promedio', 'calificacion_conteo'], name='producto_p_calif_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reporteabuso',
+            index=models.Index(fields=['estado', '-fecha_creacion'], name='reporte_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reporteabuso',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['-fecha_creacion'], name='reporte_pendiente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resenadeproducto',
+            index=models.Index(fields=['producto', 'activa', '-fecha_creacion'], name='resena_prod_activa_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resenadeproducto',
+            index=models.Index(fields=['aprobada', 'activa'], name='resena_moderacion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resenadeproducto',
+            index=models.Index(condition=models.Q(('activa', True), ('aprobada', False)), fields=['-fecha_creacion'], name='resena_pendiente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='soporteticket',
+            index=models.Index(fields=['estado'], name='ticket_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='soporteticket',
+            index=models.Index(fields=['usuario', '-fecha_creacion'], name='ticket_usuario_fecha_idx'),
+        ),
+    ]
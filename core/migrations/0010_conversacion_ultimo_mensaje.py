@@ -0,0 +1,29 @@
+# Generated by Django 4.2.26 on 2026-10-18 15:24
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def rellenar_ultimo_mensaje(apps, schema_editor):
+    Conversacion = apps.get_model('core', 'Conversacion')
+    MensajeChat = apps.get_model('core', 'MensajeChat')
+    db = schema_editor.connection.alias
+    ultimo = MensajeChat.objects.using(db).filter(conversacion=OuterRef('pk')).order_by('-fecha_envio', '-id')
+    Conversacion.objects.using(db).update(ultimo_mensaje=Subquery(ultimo.values('pk')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_indices_compuestos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversacion',
+            name='ultimo_mensaje',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.mensajechat'),
+        ),
+        migrations.RunPython(rellenar_ultimo_mensaje, migrations.RunPython.noop),
+    ]
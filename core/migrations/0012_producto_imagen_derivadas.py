@@ -0,0 +1,24 @@
+# Generated by Django 4.2.26 on 2026-10-18 15:34
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_tareanotificacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='imagen_derivadas',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='producto',
+            name='imagen',
+            field=models.ImageField(blank=True, null=True, upload_to=core.models.ruta_imagen_producto),
+        ),
+    ]
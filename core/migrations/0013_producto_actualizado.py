@@ -0,0 +1,20 @@
+# Generated by Django 4.2.26 on 2026-10-18 15:58
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_producto_imagen_derivadas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.26 on 2026-10-18 15:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Copia de core.metricas.CONTADORES en el momento de la migración.
+CONTADORES = {
+    'usuarios': (settings.AUTH_USER_MODEL, {}),
+    'productos': ('core.Producto', {}),
+    'tiendas': ('core.Tienda', {}),
+    'tiendas_pendientes': ('core.Tienda', {'aprobada': False}),
+    'resenas_pendientes': ('core.ResenaDeProducto', {'aprobada': False, 'activa': True}),
+    'tickets_abiertos': ('core.SoporteTicket', {'estado': 'abierto'}),
+    'reportes_pendientes': ('core.ReporteAbuso', {'estado': 'pendiente'}),
+}
+
+
+def contar(apps, schema_editor):
+    ContadorMetrica = apps.get_model('core', 'ContadorMetrica')
+    db = schema_editor.connection.alias
+    ContadorMetrica.objects.using(db).bulk_create([
+        ContadorMetrica(nombre=nombre, valor=apps.get_model(modelo).objects.using(db).filter(**filtro).count())
+        for nombre, (modelo, filtro) in CONTADORES.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0013_producto_actualizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorMetrica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('valor', models.BigIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('pedidos', models.PositiveIntegerField(default=0)),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('monto', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.categoria')),
+                ('tienda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.tienda')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fecha'], name='venta_diaria_fecha_idx'), models.Index(fields=['tienda', 'fecha'], name='venta_diaria_tienda_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(contar, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.26 on 2026-10-18 16:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def contar_no_leidas(apps, schema_editor):
+    Notificacion = apps.get_model('core', 'Notificacion')
+    NotificacionesNoLeidas = apps.get_model('core', 'NotificacionesNoLeidas')
+    db = schema_editor.connection.alias
+    conteos = Notificacion.objects.using(db).filter(leida=False).values_list('usuario_id').annotate(n=Count('id')).order_by()
+    NotificacionesNoLeidas.objects.using(db).bulk_create(
+        [NotificacionesNoLeidas(usuario_id=uid, cantidad=n) for uid, n in conteos], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0014_metricas_admin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificacionesNoLeidas',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('cantidad', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['usuario', 'tipo', '-fecha_creacion'], name='notif_usuario_tipo_fecha_idx'),
+        ),
+        migrations.RunPython(contar_no_leidas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 4.2.26 on 2026-10-18 16:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def calcular_leido_hasta(apps, schema_editor):
+    # El marcador de cada participante es el último mensaje del otro que ya tenía leido=True.
+    db = schema_editor.connection.alias
+    Conversacion = apps.get_model('core', 'Conversacion')
+    MensajeChat = apps.get_model('core', 'MensajeChat')
+    leidos = MensajeChat.objects.using(db).filter(conversacion=OuterRef('pk'), leido=True).order_by('-id')
+    Conversacion.objects.using(db).update(
+        leido_hasta_1=Coalesce(Subquery(leidos.exclude(remitente=OuterRef('participante_1')).values('id')[:1]), Value(0)),
+        leido_hasta_2=Coalesce(Subquery(leidos.exclude(remitente=OuterRef('participante_2')).values('id')[:1]), Value(0)),
+    )
+
+
+def restaurar_leido(apps, schema_editor):
+    db = schema_editor.connection.alias
+    MensajeChat = apps.get_model('core', 'MensajeChat')
+    MensajeChat.objects.using(db).filter(
+        Q(remitente=F('conversacion__participante_2'), id__lte=F('conversacion__leido_hasta_1'))
+        | Q(remitente=F('conversacion__participante_1'), id__lte=F('conversacion__leido_hasta_2'))
+    ).update(leido=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0015_notificaciones_no_leidas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MensajeArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('texto', models.TextField()),
+                ('fecha_envio', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversacion',
+            name='archivado_hasta',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversacion',
+            name='leido_hasta_1',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversacion',
+            name='leido_hasta_2',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mensajearchivado',
+            name='conversacion',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.conversacion'),
+        ),
+        migrations.AddField(
+            model_name='mensajearchivado',
+            name='remitente',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='mensajearchivado',
+            index=models.Index(fields=['conversacion', 'id'], name='archivado_conv_id_idx'),
+        ),
+        migrations.RunPython(calcular_leido_hasta, restaurar_leido),
+        migrations.RemoveIndex(
+            model_name='mensajechat',
+            name='mensaje_conv_leido_idx',
+        ),
+        migrations.RemoveField(
+            model_name='mensajechat',
+            name='leido',
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.26 on 2026-10-18 16:27
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def _leido_hasta(MensajeChat, db, conversaciones, usuario_id):
+    """
+    Marcador de `usuario_id` en la conversación fusionada: lo último que había
+    leído, salvo que en alguna de las originales le quede un mensaje sin leer
+    anterior, que debe seguir apareciendo como no leído.
+    """
+    marcadores, sin_leer = [], []
+    for conversacion in conversaciones:
+        campo = 'leido_hasta_1' if conversacion.participante_1_id == usuario_id else 'leido_hasta_2'
+        marcador = getattr(conversacion, campo)
+        marcadores.append(marcador)
+        primero = MensajeChat.objects.using(db).filter(
+            conversacion_id=conversacion.pk, id__gt=marcador,
+        ).exclude(remitente_id=usuario_id).order_by('id').values_list('id', flat=True).first()
+        if primero is not None:
+            sin_leer.append(primero)
+    return min(sin_leer) - 1 if sin_leer else max(marcadores)
+
+
+def canonizar_conversaciones(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Conversacion = apps.get_model('core', 'Conversacion')
+    MensajeChat = apps.get_model('core', 'MensajeChat')
+    MensajeArchivado = apps.get_model('core', 'MensajeArchivado')
+    conversaciones = Conversacion.objects.using(db)
+
+    # Conversaciones de un usuario consigo mismo: la web no permite crearlas.
+    conversaciones.filter(participante_1=F('participante_2')).delete()
+
+    for invertida in conversaciones.filter(participante_1__gt=F('participante_2')).order_by('pk'):
+        menor, mayor = invertida.participante_2_id, invertida.participante_1_id
+        directa = conversaciones.filter(participante_1_id=menor, participante_2_id=mayor).first()
+        if directa is None:
+            conversaciones.filter(pk=invertida.pk).update(
+                participante_1_id=menor, participante_2_id=mayor,
+                leido_hasta_1=invertida.leido_hasta_2, leido_hasta_2=invertida.leido_hasta_1,
+            )
+            continue
+
+        # A→B y B→A: los mensajes de la invertida pasan a la directa, que se queda.
+        pareja = [directa, invertida]
+        leido_hasta_1 = _leido_hasta(MensajeChat, db, pareja, menor)
+        leido_hasta_2 = _leido_hasta(MensajeChat, db, pareja, mayor)
+        MensajeChat.objects.using(db).filter(conversacion_id=invertida.pk).update(conversacion_id=directa.pk)
+        MensajeArchivado.objects.using(db).filter(conversacion_id=invertida.pk).update(conversacion_id=directa.pk)
+        ultimo = MensajeChat.objects.using(db).filter(
+            conversacion_id=directa.pk,
+        ).order_by('-fecha_envio', '-id').first()
+        conversaciones.filter(pk=directa.pk).update(
+            ultimo_mensaje=ultimo,
+            fecha_actualizacion=max(directa.fecha_actualizacion, invertida.fecha_actualizacion),
+            leido_hasta_1=leido_hasta_1,
+            leido_hasta_2=leido_hasta_2,
+            archivado_hasta=max(directa.archivado_hasta, invertida.archivado_hasta),
+        )
+        conversaciones.filter(pk=invertida.pk).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_chat_leido_hasta_archivo'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonizar_conversaciones, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversacion',
+            constraint=models.CheckConstraint(check=models.Q(('participante_1__lt', models.F('participante_2'))), name='conv_pareja_ordenada'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.26 on 2026-10-18 16:41
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+import django.db.models.functions.comparison
+
+
+def rellenar_precio_unitario(apps, schema_editor):
+    # El precio histórico no se guardaba: los pedidos existentes toman el actual.
+    Pedido = apps.get_model('core', 'Pedido')
+    Producto = apps.get_model('core', 'Producto')
+    db = schema_editor.connection.alias
+    precio = Producto.objects.using(db).filter(pk=OuterRef('producto_id')).values('precio')[:1]
+    Pedido.objects.using(db).filter(precio_unitario__isnull=True).update(precio_unitario=Subquery(precio))
+
+
+def quitar_ventas_duplicadas(apps, schema_editor):
+    VentaDiaria = apps.get_model('core', 'VentaDiaria')
+    db = schema_editor.connection.alias
+    repetidas = (
+        VentaDiaria.objects.using(db).values('fecha', 'tienda', 'categoria')
+        .annotate(n=Count('id'), primera=Min('id')).filter(n__gt=1)
+    )
+    for grupo in repetidas:
+        VentaDiaria.objects.using(db).filter(
+            fecha=grupo['fecha'], tienda=grupo['tienda'], categoria=grupo['categoria'],
+        ).exclude(pk=grupo['primera']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_conversacion_pareja_ordenada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='precio_unitario',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(rellenar_precio_unitario, migrations.RunPython.noop),
+        migrations.RunPython(quitar_ventas_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ventadiaria',
+            constraint=models.UniqueConstraint(models.F('fecha'), models.F('tienda'), django.db.models.functions.comparison.Coalesce(models.F('categoria'), models.Value(0)), name='venta_diaria_unica'),
+        ),
+    ]
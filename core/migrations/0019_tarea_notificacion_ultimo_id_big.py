@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-18 17:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_ventas_unicas_precio_pedido'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tareanotificacion',
+            name='ultimo_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -1,7 +1,27 @@
-from django.db import models
+import posixpath
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .imagenes import hash_contenido
+
+
+def agregados_calificacion(suma, conteo):
+    suma, conteo = suma or 0, conteo or 0
+    promedio = (Decimal(suma) / conteo).quantize(Decimal('0.01')) if conteo else Decimal('0.00')
+    return {'calificacion_suma': suma, 'calificacion_conteo': conteo, 'calificacion_promedio': promedio}
+
+
+def actualizar_calificacion(modelo, pk, resenas, **extra):
+    """Bloquea la fila de `modelo` y guarda suma, conteo y promedio de `resenas` (y los campos de `extra`)."""
+    with transaction.atomic():
+        list(modelo.objects.select_for_update().filter(pk=pk).values_list('pk', flat=True))
+        totales = resenas.aggregate(suma=Sum('calificacion'), conteo=Count('pk'))
+        modelo.objects.filter(pk=pk).update(**agregados_calificacion(totales['suma'], totales['conteo']), **extra)
 
 
 class Perfil(models.Model):
@@ -30,11 +50,19 @@ class Tienda(models.Model):
     ubicacion = models.CharField(max_length=100)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     activa = models.BooleanField(default=True)
-    aprobada = models.BooleanField(default=False)
+    aprobada = models.BooleanField(default=False, db_index=True)
+    calificacion_suma = models.PositiveIntegerField(default=0)
+    calificacion_conteo = models.PositiveIntegerField(default=0)
+    calificacion_promedio = models.DecimalField(max_digits=3, decimal_places=2, default=0)
 
     def __str__(self):
         return self.nombre
 
+    @classmethod
+    def recalcular_calificacion(cls, pk):
+        """Recalcula los agregados a partir de las reseñas aprobadas."""
+        actualizar_calificacion(cls, pk, ResenaDeTienda.objects.filter(tienda_id=pk, aprobada=True))
+
 
 
 class Categoria(models.Model):
@@ -48,6 +76,13 @@ class Categoria(models.Model):
     def __str__(self):
         return self.nombre
 
+
+def ruta_imagen_producto(instance, filename):
+    """Nombre por hash de contenido: subir dos veces la misma foto no la duplica."""
+    extension = posixpath.splitext(filename)[1].lower()
+    return f'productos/{hash_contenido(instance.imagen)}{extension}'
+
+
 class Producto(models.Model):
     tienda = models.ForeignKey(Tienda, on_delete=models.CASCADE, related_name='productos')
     categoria = models.ForeignKey(Categoria, related_name='productos', on_delete=models.SET_NULL, null=True, blank=True)
@@ -55,18 +90,55 @@ class Producto(models.Model):
     descripcion = models.TextField(blank=True)
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField(default=1)
-    imagen = models.ImageField(upload_to='productos/', null=True, blank=True)
+    imagen = models.ImageField(upload_to=ruta_imagen_producto, null=True, blank=True)
+    # Versiones redimensionadas de `imagen`; ver core/imagenes.py.
+    imagen_derivadas = models.JSONField(default=dict, blank=True, editable=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Versión del producto para cachés: los update() que cambian lo que se
+    # muestra (stock, calificación, imagen) también deben fijarlo.
+    actualizado = models.DateTimeField(auto_now=True)
     activo = models.BooleanField(default=True)
+    calificacion_suma = models.PositiveIntegerField(default=0)
+    calificacion_conteo = models.PositiveIntegerField(default=0)
+    calificacion_promedio = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['activo', '-calificacion_promedio'], name='producto_activo_calif_idx'),
+            models.Index(fields=['activo', 'fecha_creacion'], name='producto_act_fecha_idx'),
+            models.Index(fields=['activo', 'categoria', 'fecha_creacion'], name='producto_act_cat_fecha_idx'),
+            models.Index(fields=['activo', 'precio'], name='producto_act_precio_idx'),
+            models.Index(fields=['activo', 'nombre'], name='producto_act_nombre_idx'),
+            models.Index(fields=['tienda', 'activo', 'nombre'], name='producto_tienda_act_nom_idx'),
+            # SQLite compila filter(activo=True) como `WHERE activo`, que no
+            # puede usar los índices anteriores; sí usa estos parciales. Son
+            # ascendentes para recorrerse hacia atrás en los órdenes `-campo, -id`.
+            models.Index(fields=['fecha_creacion'], name='producto_p_fecha_idx', condition=models.Q(activo=True)),
+            models.Index(fields=['categoria', 'fecha_creacion'], name='producto_p_cat_fecha_idx', condition=models.Q(activo=True)),
+            models.Index(fields=['precio'], name='producto_p_precio_idx', condition=models.Q(activo=True)),
+            models.Index(fields=['nombre'], name='producto_p_nombre_idx', condition=models.Q(activo=True)),
+            models.Index(fields=['calificacion_promedio', 'calificacion_conteo'], name='producto_p_calif_idx',
+                         condition=models.Q(activo=True)),
+        ]
 
     def __str__(self):
         return self.nombre
 
-    def calificacion_promedio(self):
-        qs = self.resenas.filter(activa=True)
-        if not qs.exists():
-            return 0
-        return round(sum(r.calificacion for r in qs) / qs.count(), 1)
+    @classmethod
+    def recalcular_calificacion(cls, pk):
+        """Recalcula los agregados a partir de las reseñas activas."""
+        actualizar_calificacion(
+            cls, pk, ResenaDeProducto.objects.filter(producto_id=pk, activa=True), actualizado=timezone.now(),
+        )
+
+
+class ProductoBusqueda(models.Model):
+    """Documento de búsqueda normalizado de un Producto (ver core.search)."""
+    producto = models.OneToOneField(Producto, on_delete=models.CASCADE, primary_key=True, related_name='busqueda')
+    documento = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Búsqueda de {self.producto_id}"
 
 
 class Pedido(models.Model):
@@ -79,9 +151,19 @@ class Pedido(models.Model):
     comprador = models.ForeignKey(User, related_name='pedidos', on_delete=models.CASCADE)
     producto = models.ForeignKey(Producto, on_delete=models.PROTECT)
     cantidad = models.PositiveIntegerField(default=1)
+    # Precio del producto al comprar (realizar_pedido); las ventas consolidadas
+    # no cambian si luego cambia el precio. Vacío en pedidos creados sin él.
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     estado = models.CharField(max_length=2, choices=ESTADOS, default='P')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['comprador', '-fecha_creacion'], name='pedido_comprador_fecha_idx'),
+            models.Index(fields=['producto', '-fecha_creacion'], name='pedido_producto_fecha_idx'),
+            models.Index(fields=['producto', 'estado'], name='pedido_producto_estado_idx'),
+            models.Index(fields=['-fecha_creacion'], name='pedido_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"Pedido #{self.id} - {self.producto.nombre}"
@@ -101,6 +183,18 @@ class ResenaDeProducto(models.Model):
         verbose_name = "reseña de producto"
         verbose_name_plural = "reseñas de productos"
         unique_together = ('producto', 'autor')
+        indexes = [
+            models.Index(fields=['producto', 'activa', '-fecha_creacion'], name='resena_prod_activa_fecha_idx'),
+            models.Index(fields=['aprobada', 'activa'], name='resena_moderacion_idx'),
+            # Cola de moderación; solo se crea en motores con índices parciales.
+            models.Index(fields=['-fecha_creacion'], name='resena_pendiente_idx',
+                         condition=models.Q(aprobada=False, activa=True)),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Producto.recalcular_calificacion(self.producto_id)
 
     def responder(self, texto):
         self.respuesta_artesano = texto
@@ -123,6 +217,11 @@ class ResenaDeTienda(models.Model):
         verbose_name_plural = "reseñas de tiendas"
         unique_together = ('tienda', 'autor')
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Tienda.recalcular_calificacion(self.tienda_id)
+
     def __str__(self):
         return f"Reseña de {self.autor.username} en {self.tienda.nombre}"
 
@@ -151,10 +250,92 @@ class Notificacion(models.Model):
     tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, default='general')
     url = models.CharField(max_length=200, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', 'leida'], name='notif_usuario_leida_idx'),
+            models.Index(fields=['usuario', '-fecha_creacion'], name='notif_usuario_fecha_idx'),
+            models.Index(fields=['usuario', 'tipo', '-fecha_creacion'], name='notif_usuario_tipo_fecha_idx'),
+            models.Index(fields=['usuario'], name='notif_no_leidas_idx', condition=models.Q(leida=False)),
+        ]
+
     def __str__(self):
         return f"Notificación para {self.usuario.username} — {self.mensaje[:30]}"
 
 
+class NotificacionesNoLeidas(models.Model):
+    """
+    Notificaciones sin leer de un usuario, desnormalizado para la barra de
+    navegación. Sin fila equivale a cero. Lo mantienen las señales de
+    Notificacion y, para bulk_create y update(), quien los usa
+    (core/notificaciones.py); `manage.py compactar_notificaciones --recontar`
+    lo recalcula.
+    """
+    usuario = models.OneToOneField(User, primary_key=True, related_name='+', on_delete=models.CASCADE)
+    cantidad = models.IntegerField(default=0)
+
+    @classmethod
+    def de(cls, usuario_id):
+        return cls.objects.filter(usuario_id=usuario_id).values_list('cantidad', flat=True).first() or 0
+
+    @classmethod
+    def sumar(cls, usuario_ids, delta=1):
+        usuario_ids = list(usuario_ids)
+        if not usuario_ids or not delta:
+            return
+        if delta > 0:
+            cls.objects.bulk_create([cls(usuario_id=uid) for uid in usuario_ids], ignore_conflicts=True)
+        cls.objects.filter(usuario_id__in=usuario_ids).update(cantidad=F('cantidad') + delta)
+
+    @classmethod
+    def recontar(cls, usuario_ids=None):
+        """Recalcula los contadores (de todos los usuarios por defecto) a partir de Notificacion."""
+        pendientes = Notificacion.objects.filter(leida=False)
+        if usuario_ids is not None:
+            pendientes = pendientes.filter(usuario_id__in=usuario_ids)
+        conteos = dict(pendientes.values_list('usuario_id').annotate(n=Count('id')).order_by())
+        with transaction.atomic():
+            anteriores = cls.objects.all() if usuario_ids is None else cls.objects.filter(usuario_id__in=usuario_ids)
+            anteriores.delete()
+            cls.objects.bulk_create(
+                [cls(usuario_id=uid, cantidad=n) for uid, n in conteos.items()], batch_size=1000,
+            )
+        return conteos
+
+
+class TareaNotificacion(models.Model):
+    """
+    Envío pendiente de notificaciones (ver core/notificaciones.py). El
+    destinatario es un usuario o, si hay `tienda`, todos sus seguidores.
+    """
+    ESTADOS = (
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    )
+    usuario = models.ForeignKey(User, null=True, blank=True, related_name='+', on_delete=models.CASCADE)
+    tienda = models.ForeignKey(Tienda, null=True, blank=True, related_name='+', on_delete=models.CASCADE)
+    mensaje = models.CharField(max_length=255)
+    tipo = models.CharField(max_length=20, choices=Notificacion.TIPO_CHOICES, default='general')
+    url = models.CharField(max_length=200, null=True, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    # Último SeguirTienda notificado: un envío interrumpido se reanuda desde aquí.
+    ultimo_id = models.PositiveBigIntegerField(default=0)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'id'], name='tarea_notif_estado_idx'),
+        ]
+
+    def __str__(self):
+        destino = f"seguidores de la tienda {self.tienda_id}" if self.tienda_id else f"usuario {self.usuario_id}"
+        return f"Notificación para {destino} ({self.get_estado_display()})"
+
+
 # --- NUEVOS MODELOS PARA EL MÓDULO ADMINISTRATIVO Y COMUNICACIÓN ---
 
 from django.contrib.contenttypes.fields import GenericForeignKey
@@ -174,33 +355,119 @@ class SoporteTicket(models.Model):
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     respuesta_admin = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado'], name='ticket_estado_idx'),
+            models.Index(fields=['usuario', '-fecha_creacion'], name='ticket_usuario_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"Ticket #{self.id} - {self.asunto} ({self.get_estado_display()})"
 
 
 class Conversacion(models.Model):
+    # Cada pareja se guarda una sola vez, con el id menor en participante_1
+    # (Conversacion.pareja): la conversación entre dos usuarios se encuentra
+    # con una sola búsqueda en el índice único.
     participante_1 = models.ForeignKey(User, related_name='conversaciones_p1', on_delete=models.CASCADE)
     participante_2 = models.ForeignKey(User, related_name='conversaciones_p2', on_delete=models.CASCADE)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
+    # Desnormalizado para la bandeja de entrada; lo mantiene MensajeChat.save().
+    ultimo_mensaje = models.ForeignKey(
+        'MensajeChat', null=True, blank=True, related_name='+', on_delete=models.SET_NULL
+    )
+    # Id del último mensaje que ha leído cada participante (core.chat.marcar_leidos).
+    leido_hasta_1 = models.BigIntegerField(default=0)
+    leido_hasta_2 = models.BigIntegerField(default=0)
+    # Id del mensaje más reciente movido a MensajeArchivado; 0 si no hay ninguno.
+    archivado_hasta = models.BigIntegerField(default=0)
 
     class Meta:
         unique_together = ('participante_1', 'participante_2')
+        constraints = [
+            models.CheckConstraint(check=Q(participante_1__lt=F('participante_2')), name='conv_pareja_ordenada'),
+        ]
+        indexes = [
+            models.Index(fields=['participante_1', '-fecha_actualizacion'], name='conv_p1_fecha_idx'),
+            models.Index(fields=['participante_2', '-fecha_actualizacion'], name='conv_p2_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"Chat: {self.participante_1.username} y {self.participante_2.username}"
 
+    @staticmethod
+    def pareja(usuario_a_id, usuario_b_id):
+        """Filtro (o valores de creación) de la conversación entre dos usuarios, en orden canónico."""
+        menor, mayor = sorted((usuario_a_id, usuario_b_id))
+        return {'participante_1_id': menor, 'participante_2_id': mayor}
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.participante_1_id > self.participante_2_id:
+            self.participante_1, self.participante_2 = self.participante_2, self.participante_1
+        super().save(*args, **kwargs)
+
+    def otro_participante(self, usuario):
+        return self.participante_2 if self.participante_1_id == usuario.pk else self.participante_1
+
+    def campo_leido(self, usuario_id):
+        """Nombre del campo leido_hasta_N de `usuario_id`."""
+        return 'leido_hasta_1' if self.participante_1_id == usuario_id else 'leido_hasta_2'
+
+    def leido_por_otro(self, usuario_id):
+        """Hasta qué id ha leído el otro participante los mensajes de `usuario_id`."""
+        return self.leido_hasta_2 if self.participante_1_id == usuario_id else self.leido_hasta_1
+
+    @classmethod
+    def actualizar_ultimo_mensaje(cls, pk):
+        ultimo = MensajeChat.objects.filter(conversacion_id=pk).order_by('-fecha_envio', '-id').first()
+        cls.objects.filter(pk=pk).update(ultimo_mensaje=ultimo)
+
 
 class MensajeChat(models.Model):
     conversacion = models.ForeignKey(Conversacion, related_name='mensajes', on_delete=models.CASCADE)
     remitente = models.ForeignKey(User, related_name='mensajes_enviados', on_delete=models.CASCADE)
     texto = models.TextField()
     fecha_envio = models.DateTimeField(auto_now_add=True)
-    leido = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversacion', 'fecha_envio'], name='mensaje_conv_fecha_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        nuevo = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if nuevo:
+                Conversacion.objects.filter(pk=self.conversacion_id).update(
+                    ultimo_mensaje=self, fecha_actualizacion=self.fecha_envio,
+                )
 
     def __str__(self):
         return f"Mensaje de {self.remitente.username} en {self.conversacion}"
 
 
+class MensajeArchivado(models.Model):
+    """
+    Mensajes antiguos que el comando archivar_mensajes saca de MensajeChat.
+    Conservan su id, así que el historial del chat sigue por aquí con el mismo
+    cursor; sin más índice que (conversacion, id), que es por donde se leen.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    conversacion = models.ForeignKey(Conversacion, related_name='+', on_delete=models.CASCADE, db_index=False)
+    remitente = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    texto = models.TextField()
+    fecha_envio = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversacion', 'id'], name='archivado_conv_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Mensaje archivado {self.pk} en la conversación {self.conversacion_id}"
+
+
 class ReporteAbuso(models.Model):
     ESTADOS = (
         ('pendiente', 'Pendiente'),
@@ -217,6 +484,13 @@ class ReporteAbuso(models.Model):
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey('content_type', 'object_id')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', '-fecha_creacion'], name='reporte_estado_fecha_idx'),
+            models.Index(fields=['-fecha_creacion'], name='reporte_pendiente_idx',
+                         condition=models.Q(estado='pendiente')),
+        ]
+
     def __str__(self):
         return f"Reporte de {self.reportante.username} - {self.get_estado_display()}"
 
@@ -231,3 +505,42 @@ class SeguirTienda(models.Model):
 
     def __str__(self):
         return f"{self.usuario.username} sigue a {self.tienda.nombre}"
+
+
+# --- MÉTRICAS DEL PANEL DE ADMINISTRACIÓN (ver core/metricas.py) ---
+
+class ContadorMetrica(models.Model):
+    """Total mantenido por señales (usuarios, tiendas, colas de moderación...)."""
+    nombre = models.CharField(max_length=50, unique=True)
+    valor = models.BigIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.nombre} = {self.valor}"
+
+
+class VentaDiaria(models.Model):
+    """Ventas de un día por tienda y categoría; las consolida `manage.py consolidar_metricas`."""
+    fecha = models.DateField()
+    tienda = models.ForeignKey(Tienda, related_name='+', on_delete=models.CASCADE)
+    categoria = models.ForeignKey(Categoria, null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+    pedidos = models.PositiveIntegerField(default=0)
+    unidades = models.PositiveIntegerField(default=0)
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # Una fila por (fecha, tienda, categoría). Con fields= dos filas sin
+            # categoría no chocarían (NULL es distinto de NULL en un índice
+            # único) y MySQL no admite índices parciales: se indexa COALESCE.
+            models.UniqueConstraint(
+                F('fecha'), F('tienda'), Coalesce(F('categoria'), Value(0)), name='venta_diaria_unica',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['fecha'], name='venta_diaria_fecha_idx'),
+            models.Index(fields=['tienda', 'fecha'], name='venta_diaria_tienda_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.tienda_id}/{self.categoria_id}: {self.monto}"
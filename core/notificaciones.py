@@ -0,0 +1,201 @@
+"""
+Despacho de notificaciones.
+
+Las vistas no crean Notificacion directamente: encolan una TareaNotificacion
+(un INSERT, dentro de la misma transacción que el cambio que la origina) y la
+tarea se procesa fuera del request. Un aviso a los seguidores de una tienda
+recorre los seguimientos por lotes de `values_list` y crea las notificaciones
+con bulk_create, guardando el avance para poder reanudar.
+
+Cómo se ejecutan las tareas lo decide NOTIFICACIONES_EJECUTOR:
+    'hilo'       un hilo de fondo del propio proceso, tras el commit (por defecto).
+    'worker'     solo se encolan; las procesa `manage.py procesar_notificaciones`.
+    'inmediato'  en el mismo hilo, tras el commit (desarrollo y pruebas).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .context_processors import invalidar_navbar
+from .models import Notificacion, NotificacionesNoLeidas, SeguirTienda, TareaNotificacion
+
+logger = logging.getLogger(__name__)
+
+MAX_INTENTOS = 3
+
+
+def tamano_lote():
+    return getattr(settings, 'NOTIFICACIONES_LOTE', 1000)
+
+
+def _recortar(mensaje):
+    max_length = TareaNotificacion._meta.get_field('mensaje').max_length
+    return mensaje if len(mensaje) <= max_length else mensaje[:max_length - 1] + '…'
+
+
+def aviso(usuario_id, mensaje, tipo='general', url=None):
+    """Tarea sin guardar para un único usuario; se encola con encolar()."""
+    return TareaNotificacion(usuario_id=usuario_id, mensaje=_recortar(mensaje), tipo=tipo, url=url)
+
+
+def encolar(*tareas):
+    TareaNotificacion.objects.bulk_create(tareas)
+    transaction.on_commit(_despachar)
+
+
+def notificar(usuario_id, mensaje, tipo='general', url=None):
+    encolar(aviso(usuario_id, mensaje, tipo, url))
+
+
+def notificar_seguidores(tienda, mensaje, tipo='general', url=None):
+    encolar(TareaNotificacion(tienda=tienda, mensaje=_recortar(mensaje), tipo=tipo, url=url))
+
+
+# --- Ejecución ---
+
+_ejecutor = None
+_ejecutor_lock = threading.Lock()
+_drenado_programado = threading.Event()
+
+
+def _despachar():
+    modo = getattr(settings, 'NOTIFICACIONES_EJECUTOR', 'hilo')
+    if modo == 'inmediato':
+        procesar_pendientes()
+    elif modo == 'hilo':
+        _programar_drenado()
+
+
+def _programar_drenado():
+    global _ejecutor
+    # Si ya hay un drenado en cola, ese verá también esta tarea.
+    if _drenado_programado.is_set():
+        return
+    _drenado_programado.set()
+    with _ejecutor_lock:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='notificaciones')
+    _ejecutor.submit(_drenar_en_hilo)
+
+
+def _drenar_en_hilo():
+    _drenado_programado.clear()
+    try:
+        procesar_pendientes()
+    except Exception:
+        logger.exception("Error procesando notificaciones en segundo plano")
+    finally:
+        connections.close_all()
+
+
+def reclamar_tarea():
+    """Pasa una tarea pendiente a 'procesando'. El UPDATE condicional evita que dos workers tomen la misma."""
+    candidatas = TareaNotificacion.objects.filter(estado='pendiente').order_by('id').values_list('id', flat=True)[:10]
+    for pk in candidatas:
+        if TareaNotificacion.objects.filter(pk=pk, estado='pendiente').update(
+            estado='procesando', fecha_actualizacion=timezone.now(),
+        ):
+            return TareaNotificacion.objects.get(pk=pk)
+    return None
+
+
+def procesar_pendientes(limite=None):
+    procesadas = 0
+    while limite is None or procesadas < limite:
+        tarea = reclamar_tarea()
+        if tarea is None:
+            break
+        ejecutar(tarea)
+        procesadas += 1
+    return procesadas
+
+
+def reencolar_atascadas(minutos=10):
+    """Devuelve a 'pendiente' las tareas de un worker que murió a mitad de envío."""
+    limite = timezone.now() - timedelta(minutes=minutos)
+    return TareaNotificacion.objects.filter(estado='procesando', fecha_actualizacion__lt=limite).update(
+        estado='pendiente', fecha_actualizacion=timezone.now(),
+    )
+
+
+def ejecutar(tarea):
+    try:
+        if tarea.tienda_id:
+            _enviar_a_seguidores(tarea)
+        else:
+            _enviar_a_usuario(tarea)
+    except Exception as e:
+        logger.exception("Falló la tarea de notificación %s", tarea.pk)
+        intentos = tarea.intentos + 1
+        TareaNotificacion.objects.filter(pk=tarea.pk).update(
+            estado='fallida' if intentos >= MAX_INTENTOS else 'pendiente',
+            intentos=intentos, error=str(e), fecha_actualizacion=timezone.now(),
+        )
+    else:
+        TareaNotificacion.objects.filter(pk=tarea.pk).update(estado='completada', fecha_actualizacion=timezone.now())
+
+
+def _notificacion(tarea, usuario_id):
+    return Notificacion(usuario_id=usuario_id, mensaje=tarea.mensaje, tipo=tarea.tipo, url=tarea.url)
+
+
+def _enviar_a_usuario(tarea):
+    # bulk_create no emite post_save: el contador y la barra se actualizan a mano.
+    with transaction.atomic():
+        Notificacion.objects.bulk_create([_notificacion(tarea, tarea.usuario_id)])
+        NotificacionesNoLeidas.sumar([tarea.usuario_id])
+    invalidar_navbar(tarea.usuario_id)
+
+
+def _enviar_a_seguidores(tarea):
+    lote = tamano_lote()
+    while True:
+        with transaction.atomic():
+            seguimientos = list(
+                SeguirTienda.objects.filter(tienda_id=tarea.tienda_id, id__gt=tarea.ultimo_id)
+                .order_by('id').values_list('id', 'usuario_id')[:lote]
+            )
+            if not seguimientos:
+                return
+            usuario_ids = [usuario_id for _, usuario_id in seguimientos]
+            Notificacion.objects.bulk_create(
+                [_notificacion(tarea, usuario_id) for usuario_id in usuario_ids], batch_size=lote,
+            )
+            NotificacionesNoLeidas.sumar(usuario_ids)
+            # El avance se guarda con el lote: si el proceso muere, no se duplica.
+            tarea.ultimo_id = seguimientos[-1][0]
+            TareaNotificacion.objects.filter(pk=tarea.pk).update(
+                ultimo_id=tarea.ultimo_id, fecha_actualizacion=timezone.now(),
+            )
+        invalidar_navbar(*usuario_ids)
+        if len(seguimientos) < lote:
+            return
+
+
+# --- Lectura ---
+
+def marcar_leidas(usuario_id, hasta=None, desde=None, tipo=None, ids=None):
+    """
+    Marca como leídas las notificaciones sin leer del usuario con id en
+    [desde, hasta] (o las de `ids`), opcionalmente de un tipo. Devuelve cuántas.
+    """
+    pendientes = Notificacion.objects.filter(usuario_id=usuario_id, leida=False)
+    if ids is not None:
+        pendientes = pendientes.filter(pk__in=ids)
+    if hasta:
+        pendientes = pendientes.filter(pk__lte=hasta)
+    if desde:
+        pendientes = pendientes.filter(pk__gte=desde)
+    if tipo:
+        pendientes = pendientes.filter(tipo=tipo)
+    with transaction.atomic():
+        marcadas = pendientes.update(leida=True)
+        NotificacionesNoLeidas.sumar([usuario_id], -marcadas)
+    if marcadas:
+        invalidar_navbar(usuario_id)
+    return marcadas
@@ -0,0 +1,154 @@
+"""
+Paginación por cursor (keyset).
+
+En vez de COUNT(*) + OFFSET, cada página filtra a partir de los valores de
+orden de la última fila vista (`WHERE (campo, id) > (valor, último_id)`), así
+que el coste de una página no crece con su profundidad. Los cursores son
+tokens firmados y opacos para el cliente.
+"""
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q
+
+SALT = 'core.paginacion'
+PREVIA = 'p'
+SIGUIENTE = 's'
+
+
+class CursorInvalido(Exception):
+    pass
+
+
+class CursorPage:
+    def __init__(self, object_list, paginator, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class CursorPaginator:
+    """
+    `ordering` es una secuencia de campos (con '-' para descendente) cuya
+    combinación debe ser única; normalmente se termina con 'id' o '-id'.
+
+    `queryset` puede ser también una lista de querysets disjuntos del mismo
+    modelo, que se paginan como su UNION ALL. Sirve para sustituir un OR
+    entre columnas distintas, que no puede usar un solo índice, por una rama
+    por columna con su propio índice (véase chat_inbox).
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.ramas = list(queryset) if isinstance(queryset, (list, tuple)) else [queryset]
+        self.queryset = self.ramas[0]
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.campos = [campo.lstrip('-') for campo in self.ordering]
+        self.descendente = [campo.startswith('-') for campo in self.ordering]
+
+    def contar(self, limite=1000):
+        """
+        Cuenta hasta `limite` filas; devuelve (total, exacto). Evita recorrer
+        resultados muy grandes solo para mostrar "más de N".
+        """
+        total = sum(qs.order_by()[:limite + 1].count() for qs in self.ramas)
+        if total > limite:
+            return limite, False
+        return total, True
+
+    def codificar(self, obj, direccion):
+        valores = [self._valor(obj, campo) for campo in self.campos]
+        return signing.dumps({'v': valores, 'd': direccion}, salt=SALT, compress=True)
+
+    def decodificar(self, cursor):
+        try:
+            datos = signing.loads(cursor, salt=SALT)
+            valores, direccion = datos['v'], datos['d']
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            raise CursorInvalido(cursor)
+        if direccion not in (PREVIA, SIGUIENTE) or len(valores) != len(self.campos):
+            raise CursorInvalido(cursor)
+        return [self._convertir(campo, valor) for campo, valor in zip(self.campos, valores)], direccion
+
+    def _valor(self, obj, campo):
+        valor = getattr(obj, campo)
+        if hasattr(valor, 'isoformat'):
+            return valor.isoformat()
+        if valor is not None and not isinstance(valor, (int, float, str, bool)):
+            return str(valor)
+        return valor
+
+    def _convertir(self, campo, valor):
+        try:
+            field = self.queryset.model._meta.get_field(campo)
+        except FieldDoesNotExist:
+            # Anotaciones (p. ej. la relevancia de la búsqueda).
+            return valor
+        return field.to_python(valor)
+
+    def _filtro(self, valores, hacia_atras):
+        """(c1, c2, ...) > (v1, v2, ...) expandido en ORs, respetando la dirección de cada campo."""
+        condicion = Q()
+        for i, campo in enumerate(self.campos):
+            desc = self.descendente[i] != hacia_atras
+            paso = Q(**{f'{campo}__{"lt" if desc else "gt"}': valores[i]})
+            for anterior, valor in zip(self.campos[:i], valores[:i]):
+                paso &= Q(**{anterior: valor})
+            condicion |= paso
+        return condicion
+
+    def _consulta(self, ramas, orden):
+        if len(ramas) == 1:
+            return ramas[0].order_by(*orden)
+        if connections[ramas[0].db].features.supports_slicing_ordering_in_compound:
+            # Cada rama trae solo su página, leída en orden de su índice (MySQL).
+            ramas = [qs.order_by(*orden)[:self.per_page + 1] for qs in ramas]
+        else:
+            # SQLite no admite LIMIT dentro de un UNION: se ordena el total.
+            ramas = [qs.order_by() for qs in ramas]
+        return ramas[0].union(*ramas[1:], all=True).order_by(*orden)
+
+    def page(self, cursor=None):
+        hacia_atras = False
+        ramas = self.ramas
+        if cursor:
+            try:
+                valores, direccion = self.decodificar(cursor)
+            except CursorInvalido:
+                cursor = None
+            else:
+                hacia_atras = direccion == PREVIA
+                filtro = self._filtro(valores, hacia_atras)
+                ramas = [qs.filter(filtro) for qs in ramas]
+
+        if hacia_atras:
+            orden = [campo[1:] if campo.startswith('-') else f'-{campo}' for campo in self.ordering]
+        else:
+            orden = list(self.ordering)
+        filas = list(self._consulta(ramas, orden)[:self.per_page + 1])
+        hay_mas = len(filas) > self.per_page
+        filas = filas[:self.per_page]
+        if hacia_atras:
+            filas.reverse()
+            has_next, has_previous = True, hay_mas
+        else:
+            has_next, has_previous = hay_mas, bool(cursor)
+
+        next_cursor = self.codificar(filas[-1], SIGUIENTE) if has_next and filas else None
+        previous_cursor = self.codificar(filas[0], PREVIA) if has_previous and filas else None
+        return CursorPage(filas, self, has_next, has_previous, next_cursor, previous_cursor)
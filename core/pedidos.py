@@ -0,0 +1,118 @@
+"""
+Servicio de pedidos.
+
+El stock se descuenta con un UPDATE condicional (`stock >= cantidad`) dentro de
+una transacción, de modo que dos compradores concurrentes no pueden vender la
+misma unidad dos veces. Un carrito con varios productos se confirma entero o no
+se confirma.
+
+La exportación de pedidos (para el artesano o el staff) se genera en
+streaming con core/exportacion.py.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import exportacion
+from .models import Producto, Pedido
+from .notificaciones import aviso, encolar
+
+
+COLUMNAS_EXPORTACION = (
+    'id', 'fecha', 'estado', 'cantidad', 'producto_id', 'producto', 'precio_actual', 'tienda', 'comprador',
+)
+CAMPOS_EXPORTACION = (
+    'id', 'fecha_creacion', 'estado', 'cantidad', 'producto_id', 'producto__nombre', 'producto__precio',
+    'producto__tienda__nombre', 'comprador__username',
+)
+
+
+class PedidoError(Exception):
+    pass
+
+
+class StockInsuficiente(PedidoError):
+    def __init__(self, producto):
+        self.producto = producto
+        super().__init__(f"❌ Lo sentimos, {producto.nombre} está agotado.")
+
+
+class ProductoPropio(PedidoError):
+    def __init__(self, producto):
+        self.producto = producto
+        super().__init__("No puedes comprar tu propio producto.")
+
+
+def _mensaje_artesano(comprador, items):
+    if len(items) == 1:
+        producto, cantidad = items[0]
+        detalle = producto.nombre if cantidad == 1 else f"{cantidad} x {producto.nombre}"
+        return f"Nuevo pedido de {detalle} por {comprador.username}"
+    nombres = ', '.join(producto.nombre for producto, _ in items)
+    return f"Nuevo pedido de {len(items)} productos ({nombres}) por {comprador.username}"
+
+
+def realizar_pedido(comprador, items):
+    """
+    Crea un Pedido por cada (producto, cantidad) de `items`.
+
+    Los productos deben venir con `tienda__artesano__user` precargado. Lanza
+    StockInsuficiente o ProductoPropio sin dejar cambios a medias.
+    """
+    items = [(producto, int(cantidad)) for producto, cantidad in items if int(cantidad) > 0]
+    for producto, _ in items:
+        if producto.tienda.artesano.user_id == comprador.pk:
+            raise ProductoPropio(producto)
+
+    # Orden fijo por id para que dos carritos concurrentes bloqueen las filas
+    # en el mismo orden y no se produzcan deadlocks.
+    items.sort(key=lambda item: item[0].pk)
+    por_artesano = defaultdict(list)
+    with transaction.atomic():
+        for producto, cantidad in items:
+            actualizados = Producto.objects.filter(
+                pk=producto.pk, activo=True, stock__gte=cantidad,
+            ).update(stock=F('stock') - cantidad, actualizado=timezone.now())
+            if not actualizados:
+                raise StockInsuficiente(producto)
+            producto.stock -= cantidad
+            por_artesano[producto.tienda.artesano.user_id].append((producto, cantidad))
+
+        pedidos = Pedido.objects.bulk_create([
+            Pedido(producto=producto, comprador=comprador, cantidad=cantidad, precio_unitario=producto.precio)
+            for producto, cantidad in items
+        ])
+        # Las tareas se confirman con los pedidos: si la compra falla, no se avisa.
+        encolar(*[
+            aviso(artesano_id, _mensaje_artesano(comprador, lineas), tipo='pedido')
+            for artesano_id, lineas in por_artesano.items()
+        ])
+    return pedidos
+
+
+def devolver_stock(pedido):
+    """Repone en el producto las unidades de un pedido cancelado o rechazado."""
+    Producto.objects.filter(pk=pedido.producto_id).update(
+        stock=F('stock') + pedido.cantidad, actualizado=timezone.now(),
+    )
+
+
+def filtrar_pedidos(pedidos, desde=None, hasta=None, estado=None):
+    """Filtra por estado y por fecha de creación entre los días `desde` y `hasta`, ambos incluidos."""
+    if estado:
+        pedidos = pedidos.filter(estado=estado)
+    # Rangos de datetimes en vez de __date para que se use el índice de fecha.
+    if desde:
+        pedidos = pedidos.filter(fecha_creacion__gte=timezone.make_aware(datetime.combine(desde, time.min)))
+    if hasta:
+        siguiente = datetime.combine(hasta + timedelta(days=1), time.min)
+        pedidos = pedidos.filter(fecha_creacion__lt=timezone.make_aware(siguiente))
+    return pedidos
+
+
+def lineas_exportacion(pedidos, formato='csv', lote=exportacion.LOTE):
+    filas = exportacion.recorrer_por_lotes(pedidos, CAMPOS_EXPORTACION, lote)
+    return exportacion.lineas(filas, COLUMNAS_EXPORTACION, formato)
@@ -0,0 +1,69 @@
+"""
+Carga de plantillas en producción.
+
+config/settings_produccion.py configura el cached loader de forma explícita:
+cada plantilla se lee y se compila una sola vez por proceso, y las
+siguientes peticiones reutilizan el árbol ya compilado. Sin más, esa
+compilación la paga la primera petición que usa cada plantilla;
+precompilar() la adelanta al arranque del proceso (config/wsgi.py y
+config/asgi.py, con PRECOMPILAR_PLANTILLAS=True).
+
+Las plantillas de Django no se pueden guardar compiladas entre procesos: la
+precompilación llena la caché en memoria de cada worker.
+"""
+import logging
+import os
+
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES = ('.html', '.txt', '.xml')
+
+
+def _nombres(directorio):
+    for raiz, _, archivos in os.walk(directorio):
+        for archivo in archivos:
+            if archivo.endswith(EXTENSIONES):
+                yield os.path.relpath(os.path.join(raiz, archivo), directorio).replace(os.sep, '/')
+
+
+def _directorios(motor):
+    for loader in motor.engine.template_loaders:
+        # El cached loader delega en los loaders que envuelve.
+        for cargador in getattr(loader, 'loaders', [loader]):
+            if hasattr(cargador, 'get_dirs'):
+                yield from cargador.get_dirs()
+
+
+def precompilar():
+    """Compila todas las plantillas de los motores de Django con el cached loader. Devuelve cuántas."""
+    total = 0
+    for motor in engines.all():
+        if not isinstance(motor, DjangoTemplates):
+            continue
+        vistos = set()
+        for directorio in _directorios(motor):
+            for nombre in _nombres(directorio):
+                if nombre in vistos:
+                    continue
+                vistos.add(nombre)
+                try:
+                    motor.get_template(nombre)
+                except (TemplateDoesNotExist, TemplateSyntaxError) as e:
+                    # Fragmentos que no compilan solos: se compilarán al usarse.
+                    logger.debug("No se precompiló %s: %s", nombre, e)
+                    continue
+                total += 1
+    logger.info("%s plantillas precompiladas", total)
+    return total
+
+
+def reiniciar():
+    """Vacía la caché de los cached loaders (la próxima petición vuelve a compilar)."""
+    for motor in engines.all():
+        if isinstance(motor, DjangoTemplates):
+            for loader in motor.engine.template_loaders:
+                if hasattr(loader, 'reset'):
+                    loader.reset()
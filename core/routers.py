@@ -0,0 +1,179 @@
+"""
+Enrutado de lecturas a réplicas.
+
+Durante una petición, las lecturas van a una de las bases de REPLICAS_LECTURA
+(config/settings.py, DB_REPLICA_HOSTS) y las escrituras a `default`. La
+réplica se elige una vez por petición, por turno o la de menor retraso
+(REPLICAS_ESTRATEGIA); las que llevan más de REPLICAS_RETRASO_MAXIMO segundos
+de retraso, o no responden, se saltan, y si no queda ninguna se lee de
+`default`.
+
+Leer lo que uno mismo acaba de escribir: una petición queda fijada a
+`default` desde su primera escritura (o desde el principio si es POST, PUT,
+PATCH o DELETE), y ReplicaMiddleware deja una cookie que fija también las
+peticiones de los REPLICAS_FIJAR_SEGUNDOS siguientes. Así, la redirección de
+simular_pedido a mis_pedidos ve el pedido aunque la réplica vaya atrasada.
+
+También se lee de `default`:
+- fuera de una petición (comandos, el worker de notificaciones, hilos);
+- dentro de transaction.atomic(), donde la lectura es parte de la escritura;
+- las sesiones (SIEMPRE_PRIMARIA): de ellas depende quién es el usuario;
+- los objetos relacionados de una instancia leída de `default`.
+
+Sin réplicas configuradas, el middleware se retira de la cadena y el router
+no cambia nada.
+"""
+import contextvars
+import itertools
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+COOKIE = 'primaria_hasta'
+SIEMPRE_PRIMARIA = frozenset({'sessions'})
+METODOS_SEGUROS = frozenset({'GET', 'HEAD', 'OPTIONS', 'TRACE'})
+# Cada cuánto (segundos) vuelve a medirse el retraso de las réplicas.
+REVISAR_CADA = 10
+
+_peticion = contextvars.ContextVar('routers_peticion', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'REPLICAS_LECTURA', ()))
+
+
+def medir_retraso(alias):
+    """Segundos de retraso de la réplica `alias`; None si la replicación está parada."""
+    conexion = connections[alias]
+    if conexion.vendor != 'mysql':
+        return 0.0
+    with conexion.cursor() as cursor:
+        try:
+            cursor.execute('SHOW REPLICA STATUS')
+        except DatabaseError:
+            # MySQL < 8.0.22
+            cursor.execute('SHOW SLAVE STATUS')
+        fila = cursor.fetchone()
+        if fila is None:
+            # No es una réplica (p. ej. un entorno de pruebas que apunta a la primaria).
+            return 0.0
+        estado = dict(zip([columna[0] for columna in cursor.description], fila))
+    retraso = estado.get('Seconds_Behind_Source', estado.get('Seconds_Behind_Master'))
+    return None if retraso is None else float(retraso)
+
+
+class SelectorReplicas:
+    """Elige réplica; los retrasos se miden como mucho cada REVISAR_CADA segundos por proceso."""
+
+    def __init__(self):
+        self._turno = itertools.count()
+        self._retrasos = {}
+        self._medido = 0.0
+        self._lock = threading.Lock()
+
+    def retrasos(self, aliases):
+        with self._lock:
+            vigentes = time.monotonic() - self._medido < REVISAR_CADA and set(self._retrasos) == set(aliases)
+            if vigentes:
+                return dict(self._retrasos)
+            self._medido = time.monotonic()
+        retrasos = {}
+        for alias in aliases:
+            try:
+                retrasos[alias] = medir_retraso(alias)
+            except DatabaseError:
+                retrasos[alias] = None
+        with self._lock:
+            self._retrasos = retrasos
+        return dict(retrasos)
+
+    def elegir(self, aliases):
+        if not aliases:
+            return None
+        maximo = getattr(settings, 'REPLICAS_RETRASO_MAXIMO', None)
+        retrasos = self.retrasos(aliases)
+        disponibles = [
+            alias for alias in aliases
+            if retrasos.get(alias) is not None and (maximo is None or retrasos[alias] <= maximo)
+        ]
+        if not disponibles:
+            return None
+        if getattr(settings, 'REPLICAS_ESTRATEGIA', 'turno') == 'menor_retraso':
+            return min(disponibles, key=lambda alias: retrasos[alias])
+        return disponibles[next(self._turno) % len(disponibles)]
+
+    def olvidar(self):
+        with self._lock:
+            self._retrasos, self._medido = {}, 0.0
+
+
+selector = SelectorReplicas()
+
+
+class EstadoPeticion:
+    __slots__ = ('fijada', 'escribio', '_replica')
+
+    def __init__(self, fijada=False):
+        self.fijada = fijada
+        self.escribio = False
+        self._replica = False  # False: aún no elegida; None: ninguna disponible
+
+    def replica(self):
+        if self._replica is False:
+            self._replica = selector.elegir(replicas())
+        return self._replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        peticion = _peticion.get()
+        if peticion is None or peticion.fijada or model._meta.app_label in SIEMPRE_PRIMARIA:
+            return None
+        instancia = hints.get('instance')
+        if instancia is not None and instancia._state.db is not None:
+            return instancia._state.db
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return peticion.replica()
+
+    def db_for_write(self, model, **hints):
+        peticion = _peticion.get()
+        if peticion is not None:
+            peticion.escribio = peticion.fijada = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Las réplicas tienen los mismos datos que `default`.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas()
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            fijada_hasta = float(request.COOKIES.get(COOKIE, 0))
+        except ValueError:
+            fijada_hasta = 0
+        estado = EstadoPeticion(fijada=request.method not in METODOS_SEGUROS or fijada_hasta > time.time())
+        token = _peticion.set(estado)
+        try:
+            response = self.get_response(request)
+        finally:
+            _peticion.reset(token)
+        if estado.escribio:
+            segundos = getattr(settings, 'REPLICAS_FIJAR_SEGUNDOS', 5)
+            response.set_cookie(
+                COOKIE, str(math.ceil(time.time() + segundos)), max_age=segundos, httponly=True, samesite='Lax',
+            )
+        return response
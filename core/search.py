@@ -0,0 +1,163 @@
+"""
+Búsqueda de texto completo del catálogo.
+
+Cada Producto mantiene un documento de búsqueda (ProductoBusqueda) con su
+nombre, descripción, categoría y tienda ya normalizados (minúsculas, sin
+tildes y con un stemming ligero para español). El backend concreto se elige
+según la base de datos: FULLTEXT en MySQL y FTS5 en SQLite. Se puede forzar
+uno distinto con el setting SEARCH_BACKEND (ruta de importación).
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+FTS_TABLE = 'core_productobusqueda_fts'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Sufijos frecuentes en español, del más largo al más corto. El objetivo no es
+# un stemmer completo, sino que "collares" encuentre "collar" y "tejidas"
+# encuentre "tejido".
+_SUFIJOS = (
+    'amientos', 'imientos', 'amiento', 'imiento',
+    'aciones', 'iciones', 'mente', 'acion', 'icion',
+    'ces', 'es', 'as', 'os', 'a', 'o', 's',
+)
+
+
+def quitar_tildes(texto):
+    descompuesto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def raiz(palabra):
+    """Stemming ligero: recorta un sufijo conservando al menos 3 letras."""
+    for sufijo in _SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 3:
+            if sufijo == 'ces':
+                return palabra[:-3] + 'z'
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+def tokenizar(texto):
+    texto = quitar_tildes((texto or '').lower())
+    return [raiz(t) for t in _TOKEN_RE.findall(texto)]
+
+
+def normalizar(texto):
+    return ' '.join(tokenizar(texto))
+
+
+def documento_producto(producto):
+    partes = [producto.nombre, producto.descripcion]
+    if producto.categoria_id:
+        partes.append(producto.categoria.nombre)
+    partes.append(producto.tienda.nombre)
+    return normalizar(' '.join(p for p in partes if p))
+
+
+class MatchAgainst(models.Func):
+    """MATCH(col) AGAINST (%s IN BOOLEAN MODE) de MySQL."""
+    output_field = models.FloatField()
+
+    def __init__(self, expresion, consulta):
+        super().__init__(expresion, models.Value(consulta))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        columna, columna_params = compiler.compile(self.source_expressions[0])
+        valor, valor_params = compiler.compile(self.source_expressions[1])
+        sql = f'MATCH ({columna}) AGAINST ({valor} IN BOOLEAN MODE)'
+        return sql, (*columna_params, *valor_params)
+
+
+class BaseSearchBackend:
+    def indexar(self, productos):
+        from .models import ProductoBusqueda
+        documentos = [
+            ProductoBusqueda(producto_id=p.id, documento=documento_producto(p))
+            for p in productos
+        ]
+        if documentos:
+            ProductoBusqueda.objects.bulk_create(
+                documentos,
+                update_conflicts=True,
+                unique_fields=['producto'],
+                update_fields=['documento'],
+            )
+        return len(documentos)
+
+    def reconstruir(self):
+        """Se llama tras una reindexación masiva."""
+
+    def buscar(self, queryset, consulta):
+        """Filtra el queryset de Producto y lo anota con `relevancia`."""
+        raise NotImplementedError
+
+
+class SimpleBackend(BaseSearchBackend):
+    """Respaldo sin índice de texto: LIKE sobre una sola columna normalizada."""
+
+    def buscar(self, queryset, consulta):
+        terminos = tokenizar(consulta)
+        for termino in terminos:
+            queryset = queryset.filter(busqueda__documento__contains=termino)
+        return queryset.annotate(relevancia=models.Value(0.0, models.FloatField()))
+
+
+class MySQLFulltextBackend(BaseSearchBackend):
+    def buscar(self, queryset, consulta):
+        terminos = tokenizar(consulta)
+        if not terminos:
+            return queryset.annotate(relevancia=models.Value(0.0, models.FloatField()))
+        booleana = ' '.join(f'+{t}*' for t in terminos)
+        return queryset.annotate(
+            relevancia=MatchAgainst(models.F('busqueda__documento'), booleana)
+        ).filter(relevancia__gt=0)
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    def reconstruir(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+
+    def buscar(self, queryset, consulta):
+        terminos = tokenizar(consulta)
+        if not terminos:
+            return queryset.annotate(relevancia=models.Value(0.0, models.FloatField()))
+        match = ' '.join(f'"{t}"*' for t in terminos)
+        tabla = queryset.model._meta.db_table
+        ids = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,))
+        # bm25() devuelve valores negativos: cuanto menor, más relevante.
+        relevancia = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{tabla}"."id"',
+            (match,),
+            output_field=models.FloatField(),
+        )
+        return queryset.filter(id__in=ids).annotate(relevancia=relevancia)
+
+
+BACKENDS_POR_MOTOR = {
+    'mysql': MySQLFulltextBackend,
+    'sqlite': SQLiteFTS5Backend,
+}
+
+
+def get_backend():
+    ruta = getattr(settings, 'SEARCH_BACKEND', None)
+    if ruta:
+        return import_string(ruta)()
+    return BACKENDS_POR_MOTOR.get(connection.vendor, SimpleBackend)()
+
+
+def indexar_productos(productos):
+    return get_backend().indexar(productos)
+
+
+def buscar_productos(queryset, consulta):
+    return get_backend().buscar(queryset, consulta)
@@ -0,0 +1,190 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache_catalogo, chat, metricas
+from .context_processors import invalidar_navbar
+from .imagenes import encolar_derivadas
+from .models import (
+    Perfil, Producto, Tienda, Categoria, ResenaDeProducto, ResenaDeTienda, Notificacion, NotificacionesNoLeidas,
+    Conversacion, MensajeChat, SoporteTicket, ReporteAbuso,
+)
+from .search import indexar_productos
+
+# Campos de Producto que forman parte del documento de búsqueda.
+CAMPOS_BUSQUEDA = {'nombre', 'descripcion', 'categoria', 'categoria_id', 'tienda', 'tienda_id'}
+
+
+@receiver(post_save, sender=Producto)
+def reindexar_producto(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not CAMPOS_BUSQUEDA.intersection(update_fields):
+        return
+    indexar_productos([instance])
+
+
+@receiver(post_save, sender=Producto)
+def generar_derivadas_imagen(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and 'imagen' not in update_fields):
+        return
+    encolar_derivadas(instance)
+
+
+# Campos de Tienda que entran en el documento de búsqueda de sus productos.
+CAMPOS_BUSQUEDA_TIENDA = {'nombre'}
+
+
+@receiver(post_save, sender=Tienda)
+def reindexar_productos_tienda(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created or not CAMPOS_BUSQUEDA_TIENDA.intersection(_campos_cambiados(instance)):
+        return
+    indexar_productos(instance.productos.select_related('tienda', 'categoria'))
+
+
+@receiver(post_save, sender=Tienda)
+def invalidar_navbar_tienda_creada(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        invalidar_navbar(instance.artesano.user_id)
+
+
+@receiver(post_save, sender=Categoria)
+def reindexar_productos_categoria(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    indexar_productos(instance.productos.select_related('tienda', 'categoria'))
+
+
+# Caché del catálogo: las páginas se invalidan subiendo la generación; las
+# tarjetas, moviendo Producto.actualizado de los productos afectados.
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=ResenaDeProducto)
+@receiver(post_delete, sender=ResenaDeProducto)
+def invalidar_paginas_catalogo(sender, raw=False, **kwargs):
+    if not raw:
+        cache_catalogo.invalidar_paginas()
+
+
+# Campos de Tienda que se ven en las tarjetas de sus productos.
+CAMPOS_TARJETA_TIENDA = {'nombre'}
+CAMPOS_VIGILADOS_TIENDA = CAMPOS_BUSQUEDA_TIENDA | CAMPOS_TARJETA_TIENDA
+
+
+@receiver(pre_save, sender=Tienda)
+def recordar_campos_tienda(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Guarda los valores anteriores de los campos vigilados que se van a guardar."""
+    instance._campos_antes = {}
+    vigilados = CAMPOS_VIGILADOS_TIENDA
+    campos = vigilados if update_fields is None else vigilados.intersection(update_fields)
+    if raw or instance._state.adding or not campos:
+        return
+    instance._campos_antes = Tienda._base_manager.filter(pk=instance.pk).values(*campos).first() or {}
+
+
+def _campos_cambiados(instance):
+    antes = instance.__dict__.get('_campos_antes', {})
+    return {campo for campo, valor in antes.items() if getattr(instance, campo) != valor}
+
+
+@receiver(post_save, sender=Tienda)
+def invalidar_tarjetas_tienda(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created or not CAMPOS_TARJETA_TIENDA.intersection(_campos_cambiados(instance)):
+        return
+    instance.productos.update(actualizado=timezone.now())
+    cache_catalogo.invalidar_paginas()
+
+
+# pre_delete: en post_delete el SET_NULL ya dejó los productos sin categoría.
+@receiver(post_save, sender=Categoria)
+@receiver(pre_delete, sender=Categoria)
+def invalidar_categorias_catalogo(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    cache_catalogo.invalidar_categorias()
+    Producto.objects.filter(categoria_id=instance.pk).update(actualizado=timezone.now())
+    cache_catalogo.invalidar_paginas()
+
+
+# El borrado (incluido el borrado en cascada) corre dentro de la transacción
+# del Collector, así que los agregados se actualizan de forma atómica.
+@receiver(post_delete, sender=ResenaDeProducto)
+def recalcular_calificacion_producto(sender, instance, **kwargs):
+    Producto.recalcular_calificacion(instance.producto_id)
+
+
+@receiver(post_delete, sender=ResenaDeTienda)
+def recalcular_calificacion_tienda(sender, instance, **kwargs):
+    Tienda.recalcular_calificacion(instance.tienda_id)
+
+
+@receiver(post_save, sender=MensajeChat)
+def publicar_mensaje(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        # Tras el commit: quien despierte debe poder leer el mensaje.
+        transaction.on_commit(lambda: chat.publicar(instance.conversacion_id, 'mensaje', id=instance.pk))
+
+
+@receiver(post_delete, sender=MensajeChat)
+def actualizar_ultimo_mensaje(sender, instance, **kwargs):
+    Conversacion.actualizar_ultimo_mensaje(instance.conversacion_id)
+
+
+@receiver(post_delete, sender=Tienda)
+def invalidar_navbar_tienda(sender, instance, **kwargs):
+    # En un borrado en cascada el Perfil puede haberse borrado ya.
+    invalidar_navbar(*Perfil.objects.filter(pk=instance.artesano_id).values_list('user_id', flat=True))
+
+
+# bulk_create y update() no emiten estas señales: quien los use debe ajustar
+# NotificacionesNoLeidas y llamar a invalidar_navbar() explícitamente.
+@receiver(post_save, sender=Notificacion)
+def contar_notificacion(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw and not instance.leida:
+        NotificacionesNoLeidas.sumar([instance.usuario_id])
+
+
+@receiver(post_delete, sender=Notificacion)
+def descontar_notificacion(sender, instance, **kwargs):
+    if not instance.leida:
+        NotificacionesNoLeidas.sumar([instance.usuario_id], -1)
+
+
+@receiver(post_save, sender=Notificacion)
+@receiver(post_delete, sender=Notificacion)
+def invalidar_navbar_notificacion(sender, instance, **kwargs):
+    invalidar_navbar(instance.usuario_id)
+
+
+# Contadores del panel de administración (core/metricas.py). Solo los modelos
+# con contadores filtrados necesitan leer el estado anterior en pre_save.
+@receiver(pre_save, sender=Tienda)
+@receiver(pre_save, sender=ResenaDeProducto)
+@receiver(pre_save, sender=SoporteTicket)
+@receiver(pre_save, sender=ReporteAbuso)
+def recordar_estado_metricas(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        metricas.recordar_estado(sender, instance, update_fields)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Producto)
+@receiver(post_save, sender=Tienda)
+@receiver(post_save, sender=ResenaDeProducto)
+@receiver(post_save, sender=SoporteTicket)
+@receiver(post_save, sender=ReporteAbuso)
+def actualizar_contadores(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        metricas.al_guardar(sender, instance, created)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Producto)
+@receiver(post_delete, sender=Tienda)
+@receiver(post_delete, sender=ResenaDeProducto)
+@receiver(post_delete, sender=SoporteTicket)
+@receiver(post_delete, sender=ReporteAbuso)
+def descontar_contadores(sender, instance, **kwargs):
+    metricas.al_borrar(sender, instance)
@@ -1,13 +1,10 @@
 from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
 import math
 
 register = template.Library()
 
-@register.filter(name='filter_by_type')
-def filter_by_type(notificaciones, types):
-    type_list = [t.strip() for t in types.split(',')]
-    return [n for n in notificaciones if n.tipo in type_list]
-
 @register.filter(name='eq')
 def eq(value, arg):
     return value == arg
@@ -18,3 +15,39 @@ def price(value):
         return '{:,.0f}'.format(value).replace(',', '.')
     except (ValueError, TypeError):
         return value
+
+
+def _srcset(rutas):
+    return ', '.join(f"{default_storage.url(ruta)} {ancho}w" for ancho, ruta in rutas)
+
+
+@register.simple_tag
+def imagen_producto(producto, sizes='100vw', clase='', estilo='', carga='lazy'):
+    """
+    <picture> con las derivadas de la imagen del producto (AVIF, WebP) y
+    width/height para que el navegador reserve el espacio. Si aún no hay
+    derivadas de la imagen actual, sirve el original.
+    """
+    datos = producto.imagen_derivadas or {}
+    # Las de la imagen anterior, mientras se generan las nuevas, no valen.
+    variantes = datos.get('variantes', {}) if datos.get('origen') == producto.imagen.name else {}
+    webp = variantes.get('webp')
+    if not webp:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}" loading="{}" decoding="async">',
+            producto.imagen.url, producto.nombre, clase, estilo, carga,
+        )
+    mayor = webp[-1][0]
+    alto = round(datos['alto'] * mayor / datos['ancho'])
+    fuentes = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((formato, _srcset(rutas), sizes) for formato, rutas in variantes.items() if formato != 'webp'),
+    )
+    # El src de respaldo es la derivada intermedia, nunca el original.
+    respaldo = webp[len(webp) // 2][1]
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" '
+        'style="{}" loading="{}" decoding="async"></picture>',
+        fuentes, default_storage.url(respaldo), _srcset(webp), sizes, mayor, alto,
+        producto.nombre, clase, estilo, carga,
+    )
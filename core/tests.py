@@ -1,3 +1,1946 @@
-from django.test import TestCase
+import asyncio
+from decimal import Decimal
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from PIL import Image
+
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.sessions.models import Session
+from django.db import connection, connections, transaction, IntegrityError, OperationalError
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Q
+from django.shortcuts import resolve_url
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .bd.pool import vaciar_pools
+from .bd.sqlite3.base import DatabaseWrapper as PoolSqlite
+from .benchmark import datos as datos_benchmark, escenarios as escenarios_benchmark
+from .benchmark.carga import ClienteDjango, medir, percentil
+from . import estaticos, importacion, instrumentacion, metricas, plantillas
+from .chat import MemoryBroker
+from .notificaciones import notificar, notificar_seguidores, procesar_pendientes
+from .context_processors import estadisticas_navbar
+from .models import (
+    Perfil, Tienda, Categoria, Producto, ProductoBusqueda, ResenaDeProducto, ResenaDeTienda, Notificacion, Pedido,
+    Favorito, SeguirTienda, Conversacion, MensajeChat, SoporteTicket, ReporteAbuso, TareaNotificacion,
+    ContadorMetrica, NotificacionesNoLeidas, MensajeArchivado, VentaDiaria,
+)
+from .paginacion import CursorPaginator
+from . import routers
+from .pedidos import realizar_pedido, StockInsuficiente, ProductoPropio
+from .search import normalizar, buscar_productos
+
+
+class BusquedaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='artesana', password='clave-segura-123')
+        perfil = Perfil.objects.create(user=user, rol='artesano')
+        cls.tienda = Tienda.objects.create(artesano=perfil, nombre='Telar del Sur', ubicacion='Temuco')
+        cls.categoria = Categoria.objects.create(nombre='Cerámica', slug='ceramica')
+        cls.taza = Producto.objects.create(
+            tienda=cls.tienda, categoria=cls.categoria, nombre='Taza de greda',
+            descripcion='Taza pintada a mano', precio=5000,
+        )
+        cls.collar = Producto.objects.create(
+            tienda=cls.tienda, nombre='Collar de cobre',
+            descripcion='Collar artesanal', precio=12000,
+        )
+
+    def buscar(self, consulta):
+        return list(buscar_productos(Producto.objects.all(), consulta))
+
+    def test_normalizar_quita_tildes_y_plurales(self):
+        self.assertEqual(normalizar('Cerámicas'), normalizar('ceramica'))
+        self.assertEqual(normalizar('Collares'), normalizar('collar'))
+
+    def test_busqueda_por_nombre_categoria_y_tienda(self):
+        self.assertEqual(self.buscar('tazas'), [self.taza])
+        self.assertEqual(self.buscar('ceramica'), [self.taza])
+        self.assertCountEqual(self.buscar('telar'), [self.taza, self.collar])
+
+    def test_busqueda_por_prefijo(self):
+        self.assertEqual(self.buscar('cobr'), [self.collar])
+
+    def test_reindexa_al_renombrar_tienda(self):
+        self.tienda.nombre = 'Greda Viva'
+        self.tienda.save()
+        self.assertCountEqual(self.buscar('viva'), [self.taza, self.collar])
+        self.assertEqual(self.buscar('telar'), [])
+
+    def test_guardar_tienda_sin_renombrarla_no_reindexa(self):
+        self.tienda.ubicacion = 'Pomaire'
+        with mock.patch('core.signals.indexar_productos') as indexar:
+            self.tienda.save()
+            self.tienda.save(update_fields=['ubicacion'])
+        indexar.assert_not_called()
+
+    def test_reindexa_al_editar_producto(self):
+        self.collar.nombre = 'Pulsera de cobre'
+        self.collar.save()
+        self.assertEqual(self.buscar('pulsera'), [self.collar])
+
+    def test_eliminar_producto_lo_quita_del_indice(self):
+        self.collar.delete()
+        self.assertEqual(self.buscar('cobre'), [])
+
+    def test_comando_reindexar(self):
+        ProductoBusqueda.objects.all().delete()
+        call_command('reindexar_busqueda', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(ProductoBusqueda.objects.count(), 2)
+        self.assertEqual(self.buscar('greda'), [self.taza])
+
+    def test_catalogo_ordena_por_relevancia(self):
+        response = self.client.get(reverse('catalogo'), {'q': 'collar'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['producto_ids'], [self.collar.pk])
+        self.assertEqual(response.context['orden'], 'relevancia')
+
+
+class CalificacionesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        artesano = User.objects.create_user(username='alfarero', password='clave-segura-123')
+        perfil = Perfil.objects.create(user=artesano, rol='artesano')
+        cls.tienda = Tienda.objects.create(artesano=perfil, nombre='Greda', ubicacion='Pomaire')
+        cls.producto = Producto.objects.create(tienda=cls.tienda, nombre='Olla', precio=8000)
+        cls.compradores = [
+            User.objects.create_user(username=f'comprador{i}', password='clave-segura-123')
+            for i in range(3)
+        ]
+
+    def test_agregados_al_crear_editar_y_desactivar(self):
+        r1 = ResenaDeProducto.objects.create(producto=self.producto, autor=self.compradores[0], calificacion=5)
+        ResenaDeProducto.objects.create(producto=self.producto, autor=self.compradores[1], calificacion=4)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.calificacion_conteo, 2)
+        self.assertEqual(self.producto.calificacion_suma, 9)
+        self.assertEqual(self.producto.calificacion_promedio, Decimal('4.50'))
+
+        r1.calificacion = 1
+        r1.save()
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.calificacion_promedio, Decimal('2.50'))
+
+        r1.activa = False
+        r1.save()
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.calificacion_conteo, 1)
+        self.assertEqual(self.producto.calificacion_promedio, Decimal('4.00'))
+
+    def test_borrar_resena_actualiza_agregados(self):
+        resena = ResenaDeProducto.objects.create(producto=self.producto, autor=self.compradores[0], calificacion=3)
+        resena.delete()
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.calificacion_conteo, 0)
+        self.assertEqual(self.producto.calificacion_promedio, 0)
+
+    def test_tienda_solo_cuenta_resenas_aprobadas(self):
+        resena = ResenaDeTienda.objects.create(tienda=self.tienda, autor=self.compradores[0], calificacion=4, comentario='Bien')
+        self.tienda.refresh_from_db()
+        self.assertEqual(self.tienda.calificacion_conteo, 0)
+        resena.aprobada = True
+        resena.save()
+        self.tienda.refresh_from_db()
+        self.assertEqual(self.tienda.calificacion_conteo, 1)
+        self.assertEqual(self.tienda.calificacion_promedio, Decimal('4.00'))
+
+    def test_comando_reconciliar_corrige_desfases(self):
+        ResenaDeProducto.objects.create(producto=self.producto, autor=self.compradores[0], calificacion=2)
+        Producto.objects.filter(pk=self.producto.pk).update(calificacion_suma=0, calificacion_conteo=0, calificacion_promedio=0)
+        call_command('reconciliar_calificaciones', stdout=StringIO())
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.calificacion_conteo, 1)
+        self.assertEqual(self.producto.calificacion_promedio, Decimal('2.00'))
+
+    def test_catalogo_ordena_y_filtra_por_calificacion(self):
+        otro = Producto.objects.create(tienda=self.tienda, nombre='Plato', precio=3000)
+        ResenaDeProducto.objects.create(producto=self.producto, autor=self.compradores[0], calificacion=3)
+        ResenaDeProducto.objects.create(producto=otro, autor=self.compradores[0], calificacion=5)
+        response = self.client.get(reverse('catalogo'), {'orden': 'calificacion'})
+        self.assertEqual(response.context['producto_ids'], [otro.pk, self.producto.pk])
+        response = self.client.get(reverse('catalogo'), {'calificacion_min': '4'})
+        self.assertEqual(response.context['producto_ids'], [otro.pk])
+
+
+class NavbarContextTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tejedora', password='clave-segura-123')
+        cls.perfil = Perfil.objects.create(user=cls.user, rol='artesano')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def navbar(self):
+        response = self.client.get(reverse('home'))
+        return response.context['tiene_tienda'], response.context['notificaciones_count']
+
+    def test_segunda_visita_usa_cache(self):
+        self.navbar()
+        antes = estadisticas_navbar()
+        with self.assertNumQueries(3):  # sesión, usuario y perfil (base.html)
+            tiene_tienda, count = self.navbar()
+        self.assertFalse(tiene_tienda)
+        self.assertEqual(count, 0)
+        self.assertEqual(estadisticas_navbar()['hits'], antes['hits'] + 1)
+
+    def test_invalida_al_crear_tienda_y_notificacion(self):
+        self.navbar()
+        Tienda.objects.create(artesano=self.perfil, nombre='Lanas', ubicacion='Chiloé')
+        Notificacion.objects.create(usuario=self.user, mensaje='Hola')
+        tiene_tienda, count = self.navbar()
+        self.assertTrue(tiene_tienda)
+        self.assertEqual(count, 1)
+
+    def test_invalida_al_leer_notificaciones(self):
+        Notificacion.objects.create(usuario=self.user, mensaje='Hola')
+        self.assertEqual(self.navbar()[1], 1)
+        self.client.get(reverse('mis_notificaciones'))
+        self.assertEqual(self.navbar()[1], 0)
+
+    def test_redireccion_no_consulta_el_estado(self):
+        Tienda.objects.create(artesano=self.perfil, nombre='Lanas', ubicacion='Chiloé')
+        antes = estadisticas_navbar()
+        response = self.client.get(reverse('crear_tienda'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(estadisticas_navbar(), antes)
+
+
+def crear_tienda_con_productos(username, *stocks):
+    artesano = User.objects.create_user(username=username, password='clave-segura-123')
+    perfil = Perfil.objects.create(user=artesano, rol='artesano')
+    tienda = Tienda.objects.create(artesano=perfil, nombre=f'Tienda de {username}', ubicacion='Valdivia')
+    productos = [
+        Producto.objects.create(tienda=tienda, nombre=f'Producto {i}', precio=1000, stock=stock)
+        for i, stock in enumerate(stocks)
+    ]
+    return artesano, productos
+
+
+class PedidosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artesano, (cls.p1, cls.p2) = crear_tienda_con_productos('ceramista', 2, 1)
+        cls.comprador = User.objects.create_user(username='compradora', password='clave-segura-123')
+
+    def cargar(self, *productos):
+        ids = [p.pk for p in productos]
+        return list(Producto.objects.select_related('tienda__artesano__user').filter(pk__in=ids).order_by('pk'))
+
+    @override_settings(NOTIFICACIONES_EJECUTOR='inmediato')
+    def test_carrito_crea_pedidos_y_una_notificacion_por_artesano(self):
+        p1, p2 = self.cargar(self.p1, self.p2)
+        with self.captureOnCommitCallbacks(execute=True):
+            pedidos = realizar_pedido(self.comprador, [(p1, 2), (p2, 1)])
+        self.assertEqual(len(pedidos), 2)
+        self.assertEqual(Pedido.objects.filter(comprador=self.comprador).count(), 2)
+        self.assertEqual(list(Producto.objects.order_by('pk').values_list('stock', flat=True)), [0, 0])
+        self.assertEqual(Notificacion.objects.filter(usuario=self.artesano, tipo='pedido').count(), 1)
+
+    def test_carrito_sin_stock_no_deja_cambios(self):
+        p1, p2 = self.cargar(self.p1, self.p2)
+        with self.assertRaises(StockInsuficiente):
+            realizar_pedido(self.comprador, [(p1, 1), (p2, 2)])
+        self.assertFalse(Pedido.objects.exists())
+        self.assertEqual(list(Producto.objects.order_by('pk').values_list('stock', flat=True)), [2, 1])
+
+    def test_artesano_no_compra_su_producto(self):
+        with self.assertRaises(ProductoPropio):
+            realizar_pedido(self.artesano, [(self.cargar(self.p1)[0], 1)])
+
+    def test_cancelar_repone_stock_una_sola_vez(self):
+        self.client.force_login(self.comprador)
+        self.assertEqual(self.client.get(reverse('simular_pedido', args=[self.p2.pk])).status_code, 405)
+        self.client.post(reverse('simular_pedido', args=[self.p2.pk]))
+        pedido = Pedido.objects.get()
+        self.assertEqual(self.client.get(reverse('cancelar_pedido', args=[pedido.pk])).status_code, 405)
+        self.client.post(reverse('cancelar_pedido', args=[pedido.pk]))
+        self.client.post(reverse('cancelar_pedido', args=[pedido.pk]))
+        self.p2.refresh_from_db()
+        self.assertEqual(self.p2.stock, 1)
+
+    def test_rechazar_repone_stock_una_sola_vez(self):
+        self.client.force_login(self.comprador)
+        self.client.post(reverse('simular_pedido', args=[self.p2.pk]))
+        pedido = Pedido.objects.get()
+        self.client.force_login(self.artesano)
+        url = reverse('actualizar_estado_pedido', args=[pedido.pk, 'R'])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.client.post(url)
+        self.client.post(url)
+        self.p2.refresh_from_db()
+        self.assertEqual(self.p2.stock, 1)
+        self.assertEqual(Pedido.objects.get().estado, 'R')
+
+    def test_rechazar_un_pedido_cancelado_no_repone_stock(self):
+        self.client.force_login(self.comprador)
+        self.client.post(reverse('simular_pedido', args=[self.p2.pk]))
+        pedido = Pedido.objects.get()
+        self.client.post(reverse('cancelar_pedido', args=[pedido.pk]))
+        self.client.force_login(self.artesano)
+        self.client.post(reverse('actualizar_estado_pedido', args=[pedido.pk, 'R']))
+        self.p2.refresh_from_db()
+        self.assertEqual(self.p2.stock, 1)
+        self.assertEqual(Pedido.objects.get().estado, 'CA')
+
+    def test_vista_carrito(self):
+        self.client.force_login(self.comprador)
+        response = self.client.post(reverse('comprar_carrito'), {
+            'producto': [self.p1.pk, self.p2.pk], 'cantidad': ['1', '0'],
+        })
+        self.assertRedirects(response, reverse('mis_pedidos'))
+        self.assertEqual(Pedido.objects.get().producto, self.p1)
+
+
+@override_settings(NOTIFICACIONES_EJECUTOR='worker', NOTIFICACIONES_LOTE=2)
+class NotificacionesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artesano, (cls.producto,) = crear_tienda_con_productos('tejedora', 3)
+        cls.tienda = cls.producto.tienda
+        seguidores = User.objects.bulk_create([User(username=f'seguidor{i}') for i in range(5)])
+        cls.seguimientos = SeguirTienda.objects.bulk_create(
+            [SeguirTienda(usuario=u, tienda=cls.tienda) for u in seguidores]
+        )
+
+    def test_crear_producto_solo_encola(self):
+        self.client.force_login(self.artesano)
+        response = self.client.post(reverse('crear_producto'), {
+            'nombre': 'Chal', 'descripcion': 'Lana', 'precio': 9000, 'stock': 1, 'nueva_categoria': 'Textil',
+        })
+        self.assertRedirects(response, reverse('mi_tienda'))
+        tarea = TareaNotificacion.objects.get()
+        self.assertEqual((tarea.tienda, tarea.estado), (self.tienda, 'pendiente'))
+        self.assertFalse(Notificacion.objects.exists())
+
+    def test_envio_a_seguidores_por_lotes(self):
+        notificar_seguidores(self.tienda, 'Nuevo producto', url='/producto/1/')
+        # Reclamar la tarea (3), tres lotes de 2-2-1 seguidores (leer, insertar,
+        # sumar al contador de no leídas con INSERT y UPDATE, y guardar el avance,
+        # entre SAVEPOINT y RELEASE), completarla y ver la cola vacía.
+        with self.assertNumQueries(3 + 3 * 7 + 1 + 1):
+            self.assertEqual(procesar_pendientes(), 1)
+        self.assertEqual(Notificacion.objects.filter(url='/producto/1/').count(), 5)
+        tarea = TareaNotificacion.objects.get()
+        self.assertEqual((tarea.estado, tarea.ultimo_id), ('completada', self.seguimientos[-1].pk))
+
+    def test_envio_interrumpido_se_reanuda(self):
+        notificar_seguidores(self.tienda, 'Nuevo producto')
+        TareaNotificacion.objects.update(ultimo_id=self.seguimientos[1].pk)
+        procesar_pendientes()
+        notificados = set(Notificacion.objects.values_list('usuario_id', flat=True))
+        self.assertEqual(notificados, {s.usuario_id for s in self.seguimientos[2:]})
+
+    def test_avance_admite_ids_de_64_bits(self):
+        # SeguirTienda.id es BigAutoField: el cursor tiene que poder pasar de 2**31.
+        notificar_seguidores(self.tienda, 'Nuevo producto')
+        TareaNotificacion.objects.update(ultimo_id=2 ** 40)
+        self.assertEqual(TareaNotificacion.objects.get().ultimo_id, 2 ** 40)
+
+    def test_fallo_reintenta_y_marca_fallida(self):
+        notificar(self.artesano.pk, 'Hola')
+        with mock.patch('core.notificaciones._enviar_a_usuario', side_effect=RuntimeError('caída')), \
+                self.assertLogs('core.notificaciones', 'ERROR'):
+            for _ in range(3):
+                procesar_pendientes()
+        tarea = TareaNotificacion.objects.get()
+        self.assertEqual((tarea.estado, tarea.intentos, tarea.error), ('fallida', 3, 'caída'))
+
+    def test_worker_vacia_la_cola(self):
+        notificar(self.artesano.pk, 'Hola', tipo='pedido')
+        out = StringIO()
+        call_command('procesar_notificaciones', '--una-vez', stdout=out)
+        self.assertIn('1 tareas', out.getvalue())
+        self.assertTrue(Notificacion.objects.filter(usuario=self.artesano, tipo='pedido').exists())
+
+
+
+class LecturaNotificacionesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lectora', password='clave-segura-123')
+        Perfil.objects.create(user=cls.user, rol='comprador')
+        for i in range(4):
+            Notificacion.objects.create(usuario=cls.user, mensaje=f'Pedido {i}', tipo='pedido')
+        for i in range(3):
+            Notificacion.objects.create(usuario=cls.user, mensaje=f'Aviso {i}')
+        cls.ids = list(Notificacion.objects.order_by('pk').values_list('pk', flat=True))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_contador_sigue_altas_bajas_y_envios(self):
+        self.assertEqual(NotificacionesNoLeidas.de(self.user.pk), 7)
+        Notificacion.objects.filter(pk=self.ids[0]).get().delete()
+        Notificacion.objects.create(usuario=self.user, mensaje='Leída', leida=True)
+        self.assertEqual(NotificacionesNoLeidas.de(self.user.pk), 6)
+        notificar(self.user.pk, 'Por la cola')
+        procesar_pendientes()
+        self.assertEqual(NotificacionesNoLeidas.de(self.user.pk), 7)
+        NotificacionesNoLeidas.objects.update(cantidad=99)
+        NotificacionesNoLeidas.recontar()
+        self.assertEqual(NotificacionesNoLeidas.de(self.user.pk), 7)
+
+    def test_feed_filtra_por_tipo_y_marca_solo_la_pagina(self):
+        with mock.patch('core.views.NOTIFICACIONES_POR_PAGINA', 3):
+            response = self.client.get(reverse('mis_notificaciones'), {'tipo': 'pedido'})
+        self.assertEqual([n.mensaje for n in response.context['notificaciones']], ['Pedido 3', 'Pedido 2', 'Pedido 1'])
+        # La página se muestra como nueva en esta visita y queda leída después.
+        self.assertContains(response, 'notif-nueva">', count=3)
+        self.assertEqual(Notificacion.objects.filter(leida=False).count(), 4)
+        self.assertEqual(NotificacionesNoLeidas.de(self.user.pk), 4)
+        response = self.client.get(reverse('mis_notificaciones'), {'tipo': 'desconocido'})
+        self.assertIsNone(response.context['tipo'])
+        self.assertEqual(len(response.context['notificaciones']), 7)
+
+    def test_sondeo_desde_un_id(self):
+        response = self.client.get(reverse('notificaciones_nuevas'), {'desde': self.ids[4]})
+        datos = response.json()
+        self.assertEqual([n['id'] for n in datos['notificaciones']], self.ids[5:])
+        self.assertEqual((datos['ultimo_id'], datos['no_leidas']), (self.ids[-1], 7))
+        with self.assertNumQueries(4):  # sesión, usuario, notificaciones y contador
+            datos = self.client.get(reverse('notificaciones_nuevas'), {'desde': self.ids[-1]}).json()
+        self.assertEqual((datos['notificaciones'], datos['ultimo_id']), ([], self.ids[-1]))
+
+    def test_marcar_leidas_por_rango(self):
+        response = self.client.post(
+            reverse('marcar_notificaciones_leidas'), {'desde': self.ids[1], 'hasta': self.ids[5], 'tipo': 'pedido'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.json(), {'marcadas': 3, 'no_leidas': 4})
+        self.assertEqual(
+            set(Notificacion.objects.filter(leida=True).values_list('pk', flat=True)), set(self.ids[1:4]),
+        )
+        response = self.client.post(reverse('marcar_notificaciones_leidas'), {'hasta': self.ids[-1]})
+        self.assertRedirects(response, reverse('mis_notificaciones'))
+        self.assertEqual(NotificacionesNoLeidas.de(self.user.pk), 0)
+
+    def test_tipo_se_valida_y_se_codifica(self):
+        url = reverse('marcar_notificaciones_leidas')
+        response = self.client.post(url, {'tipo': 'reseña'})
+        self.assertEqual(response['Location'], reverse('mis_notificaciones') + '?tipo=rese%C3%B1a')
+        response = self.client.post(url, {'tipo': 'pedido&cursor=x'})
+        self.assertEqual(response['Location'], reverse('mis_notificaciones'))
+        datos = self.client.get(reverse('notificaciones_nuevas'), {'tipo': 'desconocido'}).json()
+        self.assertEqual(len(datos['notificaciones']), 7)
+
+    def test_compactar_archiva_y_borra_leidas_viejas(self):
+        Notificacion.objects.filter(pk__in=self.ids[:5]).update(
+            fecha_creacion=timezone.now() - timezone.timedelta(days=100),
+        )
+        Notificacion.objects.filter(pk__in=self.ids[:3]).update(leida=True)
+        NotificacionesNoLeidas.recontar()
+        with tempfile.NamedTemporaryFile('r', suffix='.jsonl') as archivo:
+            call_command(
+                'compactar_notificaciones', '--dias', '90', '--batch-size', '2', '--archivo', archivo.name,
+                stdout=StringIO(),
+            )
+            archivadas = [json.loads(linea) for linea in archivo]
+        self.assertEqual([fila['id'] for fila in archivadas], self.ids[:3])
+        self.assertEqual(list(Notificacion.objects.order_by('pk').values_list('pk', flat=True)), self.ids[3:])
+        self.assertEqual(NotificacionesNoLeidas.de(self.user.pk), 4)
+
+def archivo_csv(*filas, nombre='productos.csv'):
+    lineas = ['nombre,descripcion,precio,stock,categoria,imagen'] + [','.join(fila) for fila in filas]
+    return SimpleUploadedFile(nombre, '\n'.join(lineas).encode(), content_type='text/csv')
+
+
+class ImportacionProductosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artesano, (cls.producto,) = crear_tienda_con_productos('cestera', 3)
+        cls.tienda = cls.producto.tienda
+        cls.textil = Categoria.objects.create(nombre='Textil', slug='textil')
+        seguidores = User.objects.bulk_create([User(username=f'fan{i}') for i in range(3)])
+        SeguirTienda.objects.bulk_create([SeguirTienda(usuario=u, tienda=cls.tienda) for u in seguidores])
+
+    def importar(self, archivo, **datos):
+        self.client.force_login(self.artesano)
+        return self.client.post(reverse('importar_productos'), {'archivo': archivo, **datos})
+
+    def test_importa_por_lotes_con_un_solo_aviso(self):
+        filas = [(f'Cesto {i}', 'Mimbre', '1500', '2', 'textil' if i % 2 else 'Cestería', '') for i in range(7)]
+        with mock.patch('core.importacion.LOTE', 3):
+            response = self.importar(archivo_csv(*filas))
+        self.assertRedirects(response, reverse('mi_tienda'))
+        nuevos = Producto.objects.filter(tienda=self.tienda, nombre__startswith='Cesto')
+        self.assertEqual(nuevos.count(), 7)
+        # 'textil' se resuelve contra la categoría existente; 'Cestería' se crea una vez.
+        self.assertEqual(nuevos.filter(categoria=self.textil).count(), 3)
+        self.assertEqual(Categoria.objects.get(nombre='Cestería').slug, 'cesteria')
+        self.assertEqual(ProductoBusqueda.objects.filter(producto__in=nuevos).count(), 7)
+        tarea = TareaNotificacion.objects.get()
+        self.assertIn('7 productos nuevos', tarea.mensaje)
+
+    def test_una_fila_invalida_no_guarda_nada(self):
+        response = self.importar(archivo_csv(
+            ('Cesto', '', '1500', '2', 'Textil', ''),
+            ('Cesto caro', '', '-1', '2', 'Textil', ''),
+            ('Cesto sin foto', '', '1500', '2', 'Nueva', 'productos/no-existe.jpg'),
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_errores'], 2)
+        self.assertEqual([linea for linea, _ in response.context['errores']], [3, 4])
+        self.assertFalse(Producto.objects.filter(nombre__startswith='Cesto').exists())
+        self.assertFalse(Categoria.objects.filter(nombre='Nueva').exists())
+        self.assertFalse(TareaNotificacion.objects.exists())
+
+    def test_simular_valida_sin_guardar(self):
+        response = self.importar(archivo_csv(('Cesto', '', '1500', '2', 'Nueva', '')), simular='on')
+        self.assertRedirects(response, reverse('mi_tienda'))
+        self.assertFalse(Producto.objects.filter(nombre='Cesto').exists())
+        self.assertFalse(Categoria.objects.filter(nombre='Nueva').exists())
+
+    def test_exportacion_se_reimporta(self):
+        Producto.objects.filter(tienda=self.tienda).update(categoria=self.textil)
+        Producto.objects.create(tienda=self.tienda, categoria=self.textil, nombre='Manta, "grande"', precio=12000, stock=1)
+        self.client.force_login(self.artesano)
+        for formato in ('csv', 'jsonl'):
+            with self.subTest(formato=formato):
+                response = self.client.get(reverse('exportar_productos'), {'formato': formato})
+                self.assertTrue(response.streaming)
+                self.assertIn(f'productos-{self.tienda.pk}.{formato}', response['Content-Disposition'])
+                contenido = b''.join(response.streaming_content)
+                otro, _ = crear_tienda_con_productos(f'copia-{formato}')
+                tienda = Tienda.objects.get(artesano__user=otro)
+                filas = importacion.leer_filas(io.BytesIO(contenido), formato)
+                self.assertEqual(importacion.importar_productos(tienda, filas, notificar=False), 2)
+                self.assertEqual(
+                    sorted(tienda.productos.values_list('nombre', 'precio', 'categoria')),
+                    sorted(self.tienda.productos.values_list('nombre', 'precio', 'categoria')),
+                )
+
+    def test_exportacion_por_lotes(self):
+        Producto.objects.bulk_create([
+            Producto(tienda=self.tienda, nombre=f'Cesto {i}', precio=1000, stock=1) for i in range(50)
+        ])
+        # 51 productos de 7 en 7: ocho consultas por keyset, nunca la tabla entera.
+        with self.assertNumQueries(8):
+            lineas = list(importacion.exportar_productos(self.tienda, lote=7))
+        self.assertEqual(len(lineas), 52)
+
+    def test_comando(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.jsonl') as archivo:
+            archivo.write(b'{"nombre": "Cesto", "precio": 1500, "stock": 2, "categoria": "Textil"}\n')
+            archivo.flush()
+            out = StringIO()
+            call_command('importar_productos', archivo.name, '--tienda', str(self.tienda.pk), stdout=out)
+        self.assertIn('1 productos importados', out.getvalue())
+        self.assertEqual(Producto.objects.get(nombre='Cesto').categoria, self.textil)
+
+
+class PedidosTiendaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artesano, (cls.producto,) = crear_tienda_con_productos('orfebre', 100)
+        cls.tienda = cls.producto.tienda
+        _, (ajeno,) = crear_tienda_con_productos('tallador', 100)
+        cls.comprador = User.objects.create_user(username='clienta')
+        cls.staff = User.objects.create_user(username='moderadora', is_staff=True)
+        cls.pedidos = Pedido.objects.bulk_create(
+            [Pedido(producto=cls.producto, comprador=cls.comprador, estado='C' if i % 5 else 'P') for i in range(25)]
+            + [Pedido(producto=ajeno, comprador=cls.comprador)]
+        )
+        # Los primeros diez pedidos de la tienda son de hace un mes.
+        Pedido.objects.filter(pk__in=[p.pk for p in cls.pedidos[:10]]).update(
+            fecha_creacion=timezone.now() - timezone.timedelta(days=30),
+        )
+
+    def exportar(self, usuario, **filtros):
+        self.client.force_login(usuario)
+        response = self.client.get(reverse('exportar_pedidos'), filtros)
+        self.assertTrue(response.streaming)
+        lineas = b''.join(response.streaming_content).decode().splitlines()
+        return response, lineas
+
+    def test_mi_tienda_pagina_los_pedidos(self):
+        self.client.force_login(self.artesano)
+        response = self.client.get(reverse('mi_tienda'))
+        pagina = response.context['pedidos']
+        self.assertEqual((len(pagina), response.context['total_pedidos']), (20, 25))
+        response = self.client.get(reverse('mi_tienda'), {'pedidos': pagina.next_cursor})
+        ids = [p.pk for p in response.context['pedidos']]
+        self.assertEqual(ids, sorted(p.pk for p in self.pedidos[:5])[::-1])
+
+    def test_artesano_exporta_solo_su_tienda_con_filtros(self):
+        response, lineas = self.exportar(self.artesano)
+        self.assertIn(f'pedidos-{self.tienda.pk}.csv', response['Content-Disposition'])
+        self.assertEqual(lineas[0].split(',')[:3], ['id', 'fecha', 'estado'])
+        self.assertEqual(len(lineas), 1 + 25)
+
+        hoy = timezone.localdate()
+        _, lineas = self.exportar(self.artesano, desde=hoy - timezone.timedelta(days=1), hasta=hoy, estado='P')
+        self.assertEqual(len(lineas), 1 + 3)
+
+        _, lineas = self.exportar(self.artesano, formato='jsonl', hasta=hoy - timezone.timedelta(days=7))
+        filas = [json.loads(linea) for linea in lineas]
+        self.assertEqual(len(filas), 10)
+        self.assertEqual(filas[0]['tienda'], self.tienda.nombre)
+
+    def test_staff_exporta_todo_o_una_tienda(self):
+        _, lineas = self.exportar(self.staff)
+        self.assertEqual(len(lineas), 1 + 26)
+        _, lineas = self.exportar(self.staff, tienda=self.tienda.pk)
+        self.assertEqual(len(lineas), 1 + 25)
+
+    def test_rango_invalido_vuelve_con_error(self):
+        self.client.force_login(self.artesano)
+        response = self.client.get(reverse('exportar_pedidos'), {'desde': '2025-02-01', 'hasta': '2025-01-01'})
+        self.assertRedirects(response, reverse('mi_tienda'), fetch_redirect_response=False)
+
+    def test_exportacion_en_memoria_constante(self):
+        import tracemalloc
+        n = 20000
+        Pedido.objects.bulk_create(
+            [Pedido(producto=self.producto, comprador=self.comprador) for _ in range(n)], batch_size=5000,
+        )
+        self.client.force_login(self.artesano)
+        response = self.client.get(reverse('exportar_pedidos'))
+        tracemalloc.start()
+        try:
+            total = sum(1 for _ in response.streaming_content)
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(total, 1 + 25 + n)
+        # Cargar las 20k filas de una vez ocuparía varias veces esto.
+        self.assertLess(pico, 3 * 1024 * 1024)
+
+
+class MetricasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artesano, (cls.producto,) = crear_tienda_con_productos('tejedor', 50)
+        cls.tienda = cls.producto.tienda
+        cls.comprador = User.objects.create_user(username='compradora')
+        cls.staff = User.objects.create_user(username='admin', is_staff=True)
+
+    def test_contadores_siguen_los_cambios(self):
+        antes = metricas.valores()
+        _, (otro,) = crear_tienda_con_productos('platero', 1)
+        resena = ResenaDeProducto.objects.create(producto=self.producto, autor=self.comprador, calificacion=4)
+        ticket = SoporteTicket.objects.create(usuario=self.comprador, asunto='Ayuda', mensaje='...')
+        self.tienda.aprobada = True
+        self.tienda.save()
+        resena.aprobada = True
+        resena.save()
+        ticket.delete()
+        cambios = {nombre: valor - antes[nombre] for nombre, valor in metricas.valores().items()}
+        self.assertEqual(cambios, {
+            'usuarios': 1, 'productos': 1, 'tiendas': 1, 'tiendas_pendientes': 0,
+            'resenas_pendientes': 0, 'tickets_abiertos': 0, 'reportes_pendientes': 0,
+        })
+        otro.tienda.delete()
+        self.assertEqual(metricas.valores()['productos'], antes['productos'])
+
+    def test_guardar_campos_ajenos_no_consulta_el_estado(self):
+        ticket = SoporteTicket.objects.create(usuario=self.comprador, asunto='Ayuda', mensaje='...')
+        with self.assertNumQueries(1):
+            ticket.save(update_fields=['asunto'])
+        # Sin update_fields se lee el estado anterior; si no cambia, el contador no se toca.
+        with self.assertNumQueries(2):
+            ticket.save()
+
+    def test_comando_corrige_la_deriva(self):
+        ContadorMetrica.objects.filter(nombre='usuarios').update(valor=999)
+        out = StringIO()
+        call_command('consolidar_metricas', stdout=out)
+        self.assertIn('usuarios: 999 -> 3', out.getvalue())
+        self.assertEqual(metricas.valores()['usuarios'], 3)
+
+    def test_ventas_consolidadas_por_dia_tienda_y_categoria(self):
+        textil = Categoria.objects.create(nombre='Textil', slug='textil')
+        Producto.objects.filter(pk=self.producto.pk).update(categoria=textil)
+        _, (ajeno,) = crear_tienda_con_productos('ceramista', 50)
+        ayer = timezone.now() - timezone.timedelta(days=1)
+        pedidos = Pedido.objects.bulk_create([
+            Pedido(producto=self.producto, comprador=self.comprador, cantidad=2),
+            Pedido(producto=self.producto, comprador=self.comprador, cantidad=1),
+            Pedido(producto=self.producto, comprador=self.comprador, cantidad=5, estado='CA'),
+            Pedido(producto=ajeno, comprador=self.comprador, cantidad=1),
+        ])
+        Pedido.objects.filter(pk=pedidos[1].pk).update(fecha_creacion=ayer)
+        hoy = timezone.localdate()
+        for _ in range(2):
+            self.assertEqual(metricas.consolidar_ventas(hoy - timezone.timedelta(days=1)), 3)
+        resumen = metricas.resumen_ventas()
+        self.assertEqual((resumen['pedidos'], resumen['unidades'], resumen['monto']), (3, 4, Decimal('4000')))
+        self.assertEqual(resumen['tiendas'][0]['tienda_id'], self.tienda.pk)
+        self.assertEqual(resumen['tiendas'][0]['monto'], Decimal('3000'))
+        self.assertEqual([c['categoria__nombre'] for c in resumen['categorias']], ['Textil', None])
+
+    def test_ventas_consolidadas_usan_el_precio_del_pedido(self):
+        Pedido.objects.bulk_create([
+            Pedido(producto=self.producto, comprador=self.comprador, cantidad=2, precio_unitario=Decimal('800')),
+            Pedido(producto=self.producto, comprador=self.comprador, cantidad=1),
+        ])
+        Producto.objects.filter(pk=self.producto.pk).update(precio=Decimal('5000'), categoria=None)
+        hoy = timezone.localdate()
+        for _ in range(2):
+            self.assertEqual(metricas.consolidar_ventas(hoy), 1)
+        # Una sola fila sin categoría aunque se consolide dos veces.
+        venta = VentaDiaria.objects.get(fecha=hoy, tienda=self.tienda)
+        self.assertEqual(venta.monto, Decimal('6600'))
+
+    def test_colas_de_moderacion_paginadas(self):
+        otros = User.objects.bulk_create([User(username=f'cliente{i}') for i in range(25)])
+        ResenaDeProducto.objects.bulk_create([
+            ResenaDeProducto(producto=self.producto, autor=u, calificacion=5) for u in otros
+        ])
+        self.client.force_login(self.staff)
+        for cola in ('tiendas', 'resenas', 'tickets', 'reportes'):
+            with self.subTest(cola=cola):
+                self.assertEqual(self.client.get(reverse('admin_moderacion', args=[cola])).status_code, 200)
+        response = self.client.get(reverse('admin_moderacion', args=['resenas']))
+        pagina = response.context['pagina']
+        self.assertEqual(len(pagina), 20)
+        response = self.client.get(reverse('admin_moderacion', args=['resenas']), {'cursor': pagina.next_cursor})
+        self.assertEqual(len(response.context['pagina']), 5)
+        self.assertEqual(self.client.get(reverse('admin_moderacion', args=['otra'])).status_code, 404)
+
+
+@override_settings(NOTIFICACIONES_EJECUTOR='worker')
+class PedidosConcurrenciaTests(TransactionTestCase):
+    HILOS = 24
+    STOCK = 5
+
+    def setUp(self):
+        # Una base SQLite en memoria no se comparte entre conexiones de hilos.
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Requiere una base de datos de pruebas en disco.")
+
+    def test_compras_concurrentes_no_sobrevenden(self):
+        _, (producto,) = crear_tienda_con_productos('orfebre', self.STOCK)
+        compradores = [
+            User.objects.create_user(username=f'cliente{i}', password='clave-segura-123')
+            for i in range(self.HILOS)
+        ]
+        producto = Producto.objects.select_related('tienda__artesano__user').get(pk=producto.pk)
+        barrera = threading.Barrier(self.HILOS)
+        resultados = []
+
+        def comprar(comprador):
+            barrera.wait()
+            try:
+                for _ in range(20):
+                    try:
+                        realizar_pedido(comprador, [(Producto.objects.select_related('tienda__artesano__user').get(pk=producto.pk), 1)])
+                        resultados.append('ok')
+                        return
+                    except StockInsuficiente:
+                        resultados.append('agotado')
+                        return
+                    except OperationalError:
+                        # SQLite devuelve "database is locked" si se agota su
+                        # timeout de espera; el pedido no se aplicó y se reintenta.
+                        continue
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=comprar, args=(c,)) for c in compradores]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        producto.refresh_from_db()
+        self.assertEqual(producto.stock, 0)
+        self.assertEqual(resultados.count('ok'), self.STOCK)
+        self.assertEqual(Pedido.objects.filter(producto=producto).count(), self.STOCK)
+
+
+class BenchmarkTests(TransactionTestCase):
+    # Los hilos de medir() usan su propia conexión: los datos tienen que estar confirmados.
+    ESCALA = {
+        'tiendas': 3, 'productos': 30, 'compradores': 5, 'resenas': 1, 'seguidores': 2,
+        'pedidos': 20, 'conversaciones': 2, 'mensajes': 3, 'notificaciones': 5,
+    }
+
+    def setUp(self):
+        cache.clear()
+
+    def test_percentiles(self):
+        valores = list(range(1, 101))
+        self.assertEqual([percentil(valores, p) for p in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual(percentil([7], 99), 7)
+
+    @override_settings(NOTIFICACIONES_EJECUTOR='worker')
+    def test_siembra_y_mide_todos_los_escenarios(self):
+        # Como en PedidosConcurrenciaTests: los hilos de medir() necesitan una base en disco.
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Requiere una base de datos de pruebas en disco.")
+        datos_benchmark.sembrar(self.ESCALA, lote=7, log=lambda *a: None)
+        self.assertTrue(datos_benchmark.sembrado())
+        self.assertEqual(Producto.objects.count(), 30)
+        self.assertEqual(ProductoBusqueda.objects.count(), 30)
+        self.assertEqual(Pedido.objects.count(), 20)
+        conversacion = Conversacion.objects.first()
+        self.assertEqual(conversacion.ultimo_mensaje, conversacion.mensajes.latest('id'))
+        con_resenas = Producto.objects.filter(calificacion_conteo__gt=0).first()
+        self.assertEqual(con_resenas.calificacion_conteo, con_resenas.resenas.count())
+
+        usuarios = datos_benchmark.usuarios_de_prueba()
+        resultados = {}
+        # 30 productos son 3 páginas: la 99 no existe y no se mide.
+        for nombre, (rol, urls) in escenarios_benchmark.construir(usuarios, profundidades=[2, 99]).items():
+            usuario = usuarios[rol] if rol else None
+            resultado = resultados[nombre] = medir(lambda: ClienteDjango(usuario), urls, 4, concurrencia=2)
+            self.assertEqual(resultado['peticiones'], 4, nombre)
+            self.assertEqual(resultado['errores'], 0, nombre)
+            self.assertIn(resultado['primera_status'], (200, 302), nombre)
+            self.assertGreater(resultado['consultas_media'], 0, nombre)
+        self.assertEqual([pagina for pagina, _, _ in escenarios_benchmark.latencia_por_pagina(resultados)], [1, 2])
+
+    def test_medir_propaga_errores_de_los_hilos(self):
+        class ClienteRoto:
+            # El primer cliente (el de la primera petición, en este hilo) funciona; los de los hilos no.
+            creados = 0
+
+            def __init__(self):
+                ClienteRoto.creados += 1
+                self.roto = ClienteRoto.creados > 1
+
+            def pedir(self, url):
+                if self.roto:
+                    raise RuntimeError(url)
+                return 200, 1
+
+            def cerrar(self):
+                pass
+
+        with self.assertRaisesMessage(RuntimeError, '/roto/'):
+            medir(ClienteRoto, ['/roto/'], 4, concurrencia=2)
+
+
+@override_settings(INSTRUMENTACION=True)
+class InstrumentacionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artesano, cls.productos = crear_tienda_con_productos('luthier', 1, 1)
+        cls.staff = User.objects.create_user(username='jefa', password='x', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        instrumentacion.registro.limpiar()
+
+    def server_timing(self, response):
+        return dict(
+            (parte.split(';')[0].strip(), parte) for parte in response['Server-Timing'].split(',')
+        )
+
+    def test_cabecera_server_timing(self):
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.get(reverse('catalogo'))
+        timing = self.server_timing(response)
+        self.assertIn(f'desc="{len(capturadas)} consultas"', timing['db'])
+        self.assertRegex(timing['tpl'], r'tpl;dur=\d+\.\d')
+        self.assertIn('total', timing)
+        self.assertNotIn('fallos=0', timing['cache'])
+        # La segunda visita sale entera del cache.
+        self.assertIn('fallos=0', self.server_timing(self.client.get(reverse('catalogo')))['cache'])
+
+    def test_histogramas_por_vista_y_endpoint_staff(self):
+        for _ in range(3):
+            self.client.get(reverse('catalogo'))
+        self.client.get(reverse('detalle_producto', args=[self.productos[0].pk]))
+        self.assertEqual(self.client.get(reverse('metricas_rendimiento')).status_code, 302)
+        self.client.force_login(self.staff)
+        datos = self.client.get(reverse('metricas_rendimiento')).json()
+        self.assertTrue(datos['activa'])
+        self.assertEqual(datos['vistas']['catalogo']['peticiones'], 3)
+        self.assertEqual(datos['vistas']['detalle_producto']['peticiones'], 1)
+        self.assertEqual(sum(datos['vistas']['catalogo']['buckets_ms'].values()), 3)
+
+    def test_ventana_descarta_minutos_viejos(self):
+        registro = instrumentacion.Registro(ventana=2)
+        medicion = instrumentacion.Medicion()
+        registro.registrar('catalogo', 10, medicion, ahora=0)
+        registro.registrar('catalogo', 30, medicion, ahora=60)
+        self.assertEqual(registro.volcar(ahora=60)['catalogo']['peticiones'], 2)
+        registro.registrar('catalogo', 30, medicion, ahora=120)
+        self.assertEqual(registro.volcar(ahora=120)['catalogo']['peticiones'], 2)
+
+    def test_comando_lee_lo_publicado(self):
+        self.client.get(reverse('catalogo'))
+        instrumentacion.publicar()
+        salida = StringIO()
+        call_command('metricas_rendimiento', '--json', stdout=salida)
+        self.assertEqual(json.loads(salida.getvalue())['vistas']['catalogo']['peticiones'], 1)
+
+    @override_settings(INSTRUMENTACION=False)
+    def test_desactivada_no_hay_cabecera(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('catalogo')))
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _, cls.productos = crear_tienda_con_productos('tallador', *range(7))
+        # Precios repetidos para forzar el desempate por id.
+        for i, producto in enumerate(cls.productos):
+            producto.precio = 1000 * (i // 3)
+            producto.save()
+
+    def recorrer(self, paginator):
+        paginas, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            paginas.append([p.pk for p in page])
+            if not page.has_next:
+                return paginas, page
+            cursor = page.next_cursor
+
+    def test_recorre_todo_sin_repetir_y_en_orden(self):
+        for orden in (('precio', 'id'), ('-precio', '-id'), ('-precio', 'id')):
+            paginator = CursorPaginator(Producto.objects.all(), 3, orden)
+            paginas, _ = self.recorrer(paginator)
+            vistos = [pk for pagina in paginas for pk in pagina]
+            esperado = list(Producto.objects.order_by(*orden).values_list('pk', flat=True))
+            self.assertEqual(vistos, esperado, orden)
+
+    def test_cursor_previo_vuelve_a_la_pagina_anterior(self):
+        paginator = CursorPaginator(Producto.objects.all(), 3, ('precio', 'id'))
+        primera = paginator.page()
+        segunda = paginator.page(primera.next_cursor)
+        self.assertTrue(segunda.has_previous)
+        volver = paginator.page(segunda.previous_cursor)
+        self.assertEqual(list(volver), list(primera))
+        self.assertFalse(volver.has_previous)
+
+    def test_cursor_invalido_devuelve_la_primera_pagina(self):
+        paginator = CursorPaginator(Producto.objects.all(), 3, ('precio', 'id'))
+        self.assertEqual(list(paginator.page('basura')), list(paginator.page()))
+
+    def test_contar_con_limite(self):
+        paginator = CursorPaginator(Producto.objects.all(), 3, ('precio', 'id'))
+        self.assertEqual(paginator.contar(limite=5), (5, False))
+        self.assertEqual(paginator.contar(), (7, True))
+
+    def test_catalogo_avanza_con_cursor(self):
+        response = self.client.get(reverse('catalogo'), {'orden': 'precio_asc'})
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 7)
+        self.assertFalse(page.has_next)
+
+
+class CatalogoCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artesano, (cls.jarro, cls.cuenco) = crear_tienda_con_productos('alfarera', 3, 1)
+        cls.comprador = User.objects.create_user(username='visita', password='clave-segura-123')
+
+    def setUp(self):
+        cache.clear()
+
+    def catalogo(self):
+        return self.client.get(reverse('catalogo')).content.decode()
+
+    def test_segunda_visita_solo_consulta_versiones(self):
+        self.catalogo()
+        with self.assertNumQueries(1):
+            html = self.catalogo()
+        self.assertIn('Producto 0', html)
+
+    def test_editar_producto_invalida_su_tarjeta(self):
+        self.catalogo()
+        self.jarro.nombre = 'Jarro de greda'
+        self.jarro.save()
+        self.assertIn('Jarro de greda', self.catalogo())
+
+    def test_desactivar_producto_lo_quita_de_la_pagina(self):
+        self.catalogo()
+        self.cuenco.activo = False
+        self.cuenco.save()
+        self.assertNotIn('Producto 1', self.catalogo())
+
+    def test_compra_actualiza_el_stock_de_la_tarjeta(self):
+        self.catalogo()
+        self.client.force_login(self.comprador)
+        self.client.post(reverse('simular_pedido', args=[self.cuenco.pk]))
+        html = self.catalogo()
+        self.assertIn('<i class="bi bi-box-seam me-1"></i>0', html)
+
+    def test_renombrar_categoria_y_tienda(self):
+        categoria = Categoria.objects.create(nombre='Greda', slug='greda')
+        Producto.objects.filter(pk=self.jarro.pk).update(categoria=categoria)
+        self.catalogo()
+        categoria.nombre = 'Cerámica'
+        categoria.save()
+        tienda = self.jarro.tienda
+        tienda.nombre = 'Taller Pomaire'
+        tienda.save()
+        html = self.catalogo()
+        self.assertIn('Cerámica', html)
+        self.assertIn('Taller Pomaire', html)
+
+    def test_guardar_tienda_sin_cambiar_el_nombre_no_toca_las_tarjetas(self):
+        tienda = self.jarro.tienda
+        antes = Producto.objects.get(pk=self.jarro.pk).actualizado
+        tienda.ubicacion = 'Pomaire'
+        tienda.save()
+        tienda.save(update_fields=['descripcion'])
+        self.assertEqual(Producto.objects.get(pk=self.jarro.pk).actualizado, antes)
+
+
+class ProduccionTests(TestCase):
+    LOADERS_CACHE = [('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader',
+    ])]
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+
+    def collectstatic(self):
+        with override_settings(
+            STATIC_ROOT=self.static_root,
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'core.estaticos.EstaticosComprimidosStorage'}},
+        ):
+            call_command('collectstatic', '--noinput', verbosity=0)
+            return staticfiles_storage.hashed_files['css/style.css']
+
+    def test_precompila_las_plantillas(self):
+        motor = [dict(settings.TEMPLATES[0], APP_DIRS=False)]
+        motor[0]['OPTIONS'] = dict(motor[0]['OPTIONS'], loaders=self.LOADERS_CACHE)
+        with override_settings(TEMPLATES=motor):
+            from django.template import engines
+            cache_plantillas = engines['django'].engine.template_loaders[0].get_template_cache
+            self.assertGreater(plantillas.precompilar(), 0)
+            self.assertIn('mis_notificaciones.html', cache_plantillas)
+            self.assertIn('admin/base.html', cache_plantillas)
+            plantillas.reiniciar()
+            self.assertEqual(cache_plantillas, {})
+
+    def test_collectstatic_con_hash_y_comprimidos(self):
+        con_hash = self.collectstatic()
+        self.assertRegex(con_hash, r'^css/style\.[0-9a-f]{12}\.css$')
+        ruta = os.path.join(self.static_root, con_hash)
+        with open(ruta, 'rb') as original, gzip.open(ruta + '.gz') as comprimido:
+            self.assertEqual(comprimido.read(), original.read())
+        # Las imágenes ya vienen comprimidas.
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, 'img', 'taza.jpg.gz')))
+
+    def test_servidor_de_estaticos(self):
+        con_hash = self.collectstatic()
+        with override_settings(
+            SERVIR_ESTATICOS=True, STATIC_ROOT=self.static_root,
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'core.estaticos.EstaticosComprimidosStorage'}},
+        ):
+            response = self.client.get(f'/static/{con_hash}', HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+            self.assertEqual((response.status_code, response['Content-Encoding']), (200, 'gzip'))
+            self.assertEqual(response['Cache-Control'], f'public, max-age={estaticos.CACHE_LARGO}, immutable')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertNotIn('Content-Disposition', response)
+            cuerpo = gzip.decompress(b''.join(response.streaming_content))
+            self.assertIn(b'{', cuerpo)
+
+            response = self.client.get('/static/css/style.css', HTTP_IF_NONE_MATCH='"otro"')
+            self.assertEqual(response['Cache-Control'], f'public, max-age={estaticos.CACHE_CORTO}')
+            self.assertNotIn('Content-Encoding', response)
+            response = self.client.get('/static/css/style.css', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(self.client.get('/static/css/no-existe.css').status_code, 404)
+
+
+class ConexionesTests(TestCase):
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        self.addCleanup(vaciar_pools)
+        self.ajustes = connection.settings_dict | {
+            'NAME': os.path.join(directorio, 'pool.sqlite3'), 'CONN_MAX_AGE': 0,
+            'POOL': {'tamano': 1, 'espera': 0.05, 'verificar_tras': 0},
+        }
+
+    def conexion(self, alias):
+        return PoolSqlite(self.ajustes, alias)
+
+    def test_pool_reutiliza_y_limita_las_conexiones(self):
+        primera, segunda = self.conexion('pool-limite'), self.conexion('pool-limite')
+        primera.ensure_connection()
+        cruda = primera.connection
+        with self.assertRaises(OperationalError):
+            segunda.ensure_connection()
+        primera.close_if_unusable_or_obsolete()  # fin de petición con CONN_MAX_AGE=0
+        segunda.ensure_connection()
+        self.assertIs(segunda.connection, cruda)
+        self.assertEqual(segunda.pool.estado(), {'abiertas': 1, 'libres': 0, 'tamano': 1})
+        segunda.close()
+
+    def test_pool_descarta_conexiones_rotas_y_transacciones(self):
+        conexion = self.conexion('pool-rotas')
+        with conexion.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (x INTEGER)')
+        conexion.set_autocommit(False)
+        with conexion.cursor() as cursor:
+            cursor.execute('INSERT INTO t VALUES (1)')
+        cruda = conexion.connection
+        conexion.close()
+        conexion.set_autocommit(True)
+        with conexion.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM t')
+            self.assertEqual(cursor.fetchone(), (0,))
+        self.assertIs(conexion.connection, cruda)
+        conexion.close()
+
+        cruda.close()  # p. ej. cerrada por el servidor mientras estaba libre
+        conexion.ensure_connection()
+        self.assertIsNot(conexion.connection, cruda)
+        self.assertEqual(conexion.pool.estado()['abiertas'], 1)
+        conexion.close()
+
+    def test_medir_conexiones(self):
+        out = StringIO()
+        call_command('medir_conexiones', '--sqlite', '--peticiones', '5', '--hilo-por-peticion', stdout=out)
+        lineas = dict(linea.split(None, 1) for linea in out.getvalue().splitlines())
+        self.assertTrue(lineas['nueva'].endswith('conexiones abiertas 5'))
+        self.assertTrue(lineas['persistente'].endswith('conexiones abiertas 5'))
+        self.assertTrue(lineas['pool'].endswith('conexiones abiertas 1'))
+
+
+REPLICA = 'replica_prueba'
+
+
+@override_settings(REPLICAS_LECTURA=[REPLICA], REPLICAS_FIJAR_SEGUNDOS=5)
+class ReplicasTests(TransactionTestCase):
+    """Una segunda base SQLite hace de réplica; lo que no se copie a ella es "retraso"."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # La réplica se añade después de preparar la clase para que el runner no la bloquee.
+        cls.directorio = tempfile.mkdtemp()
+        connections.settings[REPLICA] = connections.configure_settings({
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.directorio, 'replica.sqlite3')},
+        })['default']
+        # allow_migrate no migra las réplicas: aquí hay que crear las tablas a mano.
+        with override_settings(REPLICAS_LECTURA=[]):
+            call_command('migrate', database=REPLICA, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections.settings[REPLICA]
+        delattr(connections._connections, REPLICA)
+        shutil.rmtree(cls.directorio, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        routers.selector.olvidar()
+        self.artesano, (self.producto,) = crear_tienda_con_productos('replicante', 3)
+        self.comprador = User.objects.create_user(username='lectora-replica', password='x')
+        Perfil.objects.create(user=self.comprador, rol='comprador')
+        self.replicar()
+        self.client.force_login(self.comprador)
+
+    def replicar(self):
+        for modelo in (User, Perfil, Categoria, Tienda, Producto):
+            modelo.objects.using(REPLICA).all().delete()
+            modelo.objects.using(REPLICA).bulk_create(list(modelo.objects.using('default').all()))
+
+    def test_lee_de_la_replica_y_luego_lo_propio_de_la_primaria(self):
+        response = self.client.post(reverse('simular_pedido', args=[self.producto.pk]), follow=True)
+        # La redirección lleva la cookie: mis_pedidos ve el pedido recién creado.
+        self.assertEqual(len(response.context['pedidos']), 1)
+        self.assertIn(routers.COOKIE, self.client.cookies)
+        self.assertFalse(Pedido.objects.using(REPLICA).exists())
+
+        # Sin la cookie, la misma lista sale de la réplica, que aún no tiene el pedido.
+        del self.client.cookies[routers.COOKIE]
+        response = self.client.get(reverse('mis_pedidos'))
+        self.assertEqual(len(response.context['pedidos']), 0)
+        self.assertNotIn(routers.COOKIE, response.cookies)
+
+    def test_lecturas_que_no_van_a_la_replica(self):
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Producto))  # fuera de una petición
+        token = routers._peticion.set(routers.EstadoPeticion())
+        try:
+            self.assertEqual(router.db_for_read(Producto), REPLICA)
+            self.assertIsNone(router.db_for_read(Session))
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(Producto))
+            self.assertEqual(router.db_for_write(Producto), 'default')
+            self.assertIsNone(router.db_for_read(Producto))  # fijada tras escribir
+        finally:
+            routers._peticion.reset(token)
+        self.assertFalse(router.allow_migrate(REPLICA, 'core'))
+
+    @override_settings(REPLICAS_RETRASO_MAXIMO=5)
+    def test_eleccion_por_turno_y_por_retraso(self):
+        retrasos = {'r1': 1.0, 'r2': 3.0, 'r3': 60.0, 'r4': None}
+        with mock.patch('core.routers.medir_retraso', side_effect=retrasos.get) as medir:
+            selector = routers.SelectorReplicas()
+            self.assertEqual([selector.elegir(list(retrasos)) for _ in range(4)], ['r1', 'r2', 'r1', 'r2'])
+            # El retraso se mide una vez por intervalo, no en cada petición.
+            self.assertEqual(medir.call_count, 4)
+            with override_settings(REPLICAS_ESTRATEGIA='menor_retraso'):
+                self.assertEqual(selector.elegir(['r2', 'r1']), 'r1')
+            self.assertIsNone(selector.elegir(['r3', 'r4']))
+
+
+class GetCondicionalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artesano, (cls.producto,) = crear_tienda_con_productos('orfebre', 5)
+        cls.comprador = User.objects.create_user(username='clienta', password='clave-segura-123')
+        Perfil.objects.create(user=cls.comprador, rol='comprador')
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('detalle_producto', args=[self.producto.pk])
+
+    def revalidar(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_detalle_sin_cambios_responde_304_sin_leer_resenas(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+        with self.assertNumQueries(1):
+            response = self.revalidar(self.url, response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_detalle_if_modified_since(self):
+        response = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_detalle_cambia_con_stock_y_resenas(self):
+        etag = self.client.get(self.url)['ETag']
+        Producto.objects.filter(pk=self.producto.pk).update(stock=4, actualizado=timezone.now())
+        response = self.revalidar(self.url, etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        ResenaDeProducto.objects.create(producto=self.producto, autor=self.comprador, calificacion=5)
+        self.assertEqual(self.revalidar(self.url, etag).status_code, 200)
+
+    def test_detalle_depende_del_usuario_y_sus_favoritos(self):
+        etag_anonimo = self.client.get(self.url)['ETag']
+        self.client.force_login(self.comprador)
+        response = self.revalidar(self.url, etag_anonimo)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('Cookie', response['Vary'])
+        etag = response['ETag']
+        self.assertEqual(self.revalidar(self.url, etag).status_code, 304)
+        Favorito.objects.create(usuario=self.comprador, producto=self.producto)
+        self.assertEqual(self.revalidar(self.url, etag).status_code, 200)
+
+    def test_mensajes_pendientes_desactivan_el_304(self):
+        self.client.force_login(self.artesano)
+        etag = self.client.get(self.url)['ETag']
+        # Reseñar el propio producto deja un mensaje de error sin tocar nada.
+        self.client.post(reverse('crear_resena', args=[self.producto.pk]), {'calificacion': 5, 'comentario': 'Bueno'})
+        response = self.revalidar(self.url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_catalogo_304_hasta_que_cambia_un_producto(self):
+        url = reverse('catalogo')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidar(url, etag).status_code, 304)
+        self.assertEqual(self.client.get(url, {'orden': 'precio_asc'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.producto.nombre = 'Anillo de plata'
+        self.producto.save()
+        self.assertEqual(self.revalidar(url, etag).status_code, 200)
+
+    def test_detalle_inexistente(self):
+        self.assertEqual(self.client.get(reverse('detalle_producto', args=[999])).status_code, 404)
+
+
+class DetalleProductoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.artesano, (cls.producto,) = crear_tienda_con_productos('cestera', 5)
+        cls.compradores = [User.objects.create_user(username=f'opina{i}', password='x') for i in range(25)]
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('detalle_producto', args=[self.producto.pk])
+
+    def consultas(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(capturadas), response
+
+    def test_consultas_constantes_con_cualquier_numero_de_resenas(self):
+        self.client.force_login(self.compradores[0])
+        sin_resenas, _ = self.consultas()
+        for comprador in self.compradores:
+            ResenaDeProducto.objects.create(producto=self.producto, autor=comprador, calificacion=4, comentario='Bien')
+        con_resenas, response = self.consultas()
+        # Sesión, usuario, estado personal, producto, reseñas, los dos de la
+        # barra y el perfil que lee base.html.
+        self.assertEqual((sin_resenas, con_resenas), (8, 8))
+        self.assertEqual(len(response.context['resenas']), 10)
+        self.assertTrue(response.context['user_has_reviewed'])
+
+    def test_anonimo(self):
+        self.assertEqual(self.consultas()[0], 3)
+
+    def test_resenas_paginadas(self):
+        for comprador in self.compradores:
+            ResenaDeProducto.objects.create(producto=self.producto, autor=comprador, calificacion=4)
+        vistas, cursor = [], None
+        while True:
+            response = self.client.get(self.url, {'resenas': cursor} if cursor else {})
+            pagina = response.context['resenas']
+            vistas += [resena.pk for resena in pagina]
+            if not pagina.has_next:
+                break
+            cursor = pagina.next_cursor
+        self.assertEqual(len(vistas), 25)
+        self.assertEqual(len(set(vistas)), 25)
+
+    def test_dueno_no_ve_el_formulario(self):
+        self.client.force_login(self.artesano)
+        _, response = self.consultas()
+        self.assertTrue(response.context['is_artisan_owner'])
+
+
+class ChatBandejaTests(TestCase):
+    def setUp(self):
+        self.ana = User.objects.create_user(username='ana', password='x')
+        self.beto = User.objects.create_user(username='beto', password='x')
+        self.conversacion = Conversacion.objects.create(participante_1=self.ana, participante_2=self.beto)
+
+    def test_enviar_actualiza_ultimo_mensaje(self):
+        MensajeChat.objects.create(conversacion=self.conversacion, remitente=self.ana, texto='Hola')
+        segundo = MensajeChat.objects.create(conversacion=self.conversacion, remitente=self.beto, texto='¿Qué tal?')
+        self.conversacion.refresh_from_db()
+        self.assertEqual(self.conversacion.ultimo_mensaje, segundo)
+        self.assertEqual(self.conversacion.fecha_actualizacion, segundo.fecha_envio)
+
+    def test_borrar_ultimo_mensaje_apunta_al_anterior(self):
+        primero = MensajeChat.objects.create(conversacion=self.conversacion, remitente=self.ana, texto='Hola')
+        MensajeChat.objects.create(conversacion=self.conversacion, remitente=self.beto, texto='Chao').delete()
+        self.conversacion.refresh_from_db()
+        self.assertEqual(self.conversacion.ultimo_mensaje, primero)
+
+    def test_bandeja_muestra_pareja_y_no_leidos(self):
+        for texto in ('Uno', 'Dos'):
+            MensajeChat.objects.create(conversacion=self.conversacion, remitente=self.beto, texto=texto)
+        MensajeChat.objects.create(conversacion=self.conversacion, remitente=self.ana, texto='Leído')
+        self.client.force_login(self.ana)
+        response = self.client.get(reverse('chat_inbox'))
+        conv = response.context['conversaciones'][0]
+        self.assertEqual(conv.otro, self.beto)
+        self.assertEqual(conv.no_leidos, 2)
+        self.assertContains(response, 'Tú: ')
+
+        # Abrir el hilo adelanta el marcador de Ana; para Beto nada cambia.
+        self.client.get(reverse('chat_thread', args=[self.beto.pk]))
+        self.assertEqual(self.client.get(reverse('chat_inbox')).context['conversaciones'][0].no_leidos, 0)
+        self.client.force_login(self.beto)
+        self.assertEqual(self.client.get(reverse('chat_inbox')).context['conversaciones'][0].no_leidos, 1)
+
+
+class ConversacionCanonicaTests(TestCase):
+    def setUp(self):
+        self.ana = User.objects.create_user(username='ana', password='x')
+        self.beto = User.objects.create_user(username='beto', password='x')
+        self.caro = User.objects.create_user(username='caro', password='x')
+
+    def test_pareja_en_orden_canonico(self):
+        conversacion = Conversacion.objects.create(participante_1=self.beto, participante_2=self.ana)
+        self.assertEqual((conversacion.participante_1, conversacion.participante_2), (self.ana, self.beto))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Conversacion.objects.bulk_create([Conversacion(participante_1=self.caro, participante_2=self.ana)])
+
+    def test_ambos_lados_abren_la_misma_conversacion(self):
+        self.client.force_login(self.beto)
+        self.client.get(reverse('chat_thread', args=[self.ana.pk]))
+        self.client.force_login(self.ana)
+        with CaptureQueriesContext(connection) as capturadas:
+            self.client.get(reverse('chat_thread', args=[self.beto.pk]))
+        self.assertEqual(Conversacion.objects.count(), 1)
+        busqueda = next(
+            q['sql'] for q in capturadas.captured_queries
+            if f"FROM {connection.ops.quote_name('core_conversacion')}" in q['sql']
+        )
+        self.assertNotIn(' OR ', busqueda)
+
+    def test_carrera_al_crear(self):
+        existente = Conversacion.objects.create(participante_1=self.ana, participante_2=self.beto)
+        self.client.force_login(self.beto)
+        # Otra petición la creó entre la búsqueda y la inserción de esta.
+        with mock.patch('django.db.models.query.QuerySet.first', return_value=None):
+            response = self.client.get(reverse('chat_thread', args=[self.ana.pk]))
+        self.assertEqual(response.context['conversacion'], existente)
+        self.assertEqual(Conversacion.objects.count(), 1)
+
+    def test_bandeja_une_las_dos_columnas(self):
+        con_beto = Conversacion.objects.create(participante_1=self.ana, participante_2=self.beto)
+        con_caro = Conversacion.objects.create(participante_1=self.caro, participante_2=self.beto)
+        MensajeChat.objects.create(conversacion=con_beto, remitente=self.ana, texto='Hola')
+        MensajeChat.objects.create(conversacion=con_caro, remitente=self.caro, texto='Hola')
+        self.client.force_login(self.beto)
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.get(reverse('chat_inbox'))
+        self.assertEqual([c.pk for c in response.context['conversaciones']], [con_caro.pk, con_beto.pk])
+        self.assertEqual([c.no_leidos for c in response.context['conversaciones']], [1, 1])
+        self.assertTrue(any('UNION ALL' in q['sql'] for q in capturadas.captured_queries))
+
+
+class ConversacionesDuplicadasMigracionTests(TransactionTestCase):
+    antes = [('core', '0016_chat_leido_hasta_archivo')]
+    despues = [('core', '0017_conversacion_pareja_ordenada')]
+
+    def tearDown(self):
+        call_command('migrate', 'core', verbosity=0)
+
+    def test_fusiona_a_b_con_b_a(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.antes)
+        apps = executor.loader.project_state(self.antes).apps
+        Usuario = apps.get_model('auth', 'User')
+        Conversacion = apps.get_model('core', 'Conversacion')
+        MensajeChat = apps.get_model('core', 'MensajeChat')
+        ana, beto, caro = (Usuario.objects.create(username=nombre) for nombre in ('ana', 'beto', 'caro'))
+        directa = Conversacion.objects.create(participante_1=ana, participante_2=beto)
+        invertida = Conversacion.objects.create(participante_1=beto, participante_2=ana)
+        sola = Conversacion.objects.create(participante_1=caro, participante_2=ana, leido_hasta_1=7)
+        m1, m2 = (MensajeChat.objects.create(conversacion=directa, remitente=r, texto='d') for r in (ana, beto))
+        m3, m4 = (MensajeChat.objects.create(conversacion=invertida, remitente=r, texto='i') for r in (beto, ana))
+        # Ana leyó lo de la directa pero no m3; Beto lo leyó todo.
+        Conversacion.objects.filter(pk=directa.pk).update(leido_hasta_1=m2.pk, leido_hasta_2=m1.pk)
+        Conversacion.objects.filter(pk=invertida.pk).update(leido_hasta_1=m4.pk)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.despues)
+
+        from .models import Conversacion as ConversacionActual
+        fusionada = ConversacionActual.objects.get(pk=directa.pk)
+        self.assertFalse(ConversacionActual.objects.filter(pk=invertida.pk).exists())
+        self.assertEqual(set(fusionada.mensajes.values_list('pk', flat=True)), {m1.pk, m2.pk, m3.pk, m4.pk})
+        self.assertEqual(fusionada.ultimo_mensaje_id, m4.pk)
+        self.assertEqual((fusionada.leido_hasta_1, fusionada.leido_hasta_2), (m3.pk - 1, m4.pk))
+        sola = ConversacionActual.objects.get(pk=sola.pk)
+        self.assertEqual((sola.participante_1_id, sola.participante_2_id), (ana.pk, caro.pk))
+        self.assertEqual((sola.leido_hasta_1, sola.leido_hasta_2), (0, 7))
+
+
+class ChatHistorialTests(TestCase):
+    def setUp(self):
+        self.ana = User.objects.create_user(username='ana', password='x')
+        self.beto = User.objects.create_user(username='beto', password='x')
+        self.conversacion = Conversacion.objects.create(participante_1=self.ana, participante_2=self.beto)
+        hace_un_ano = timezone.now() - timezone.timedelta(days=365)
+        for i in range(12):
+            mensaje = MensajeChat.objects.create(
+                conversacion=self.conversacion, remitente=self.ana if i % 2 else self.beto, texto=f'Mensaje {i}',
+            )
+            if i < 8:
+                MensajeChat.objects.filter(pk=mensaje.pk).update(fecha_envio=hace_un_ano)
+        self.ids = list(MensajeChat.objects.order_by('id').values_list('id', flat=True))
+        self.client.force_login(self.ana)
+
+    @mock.patch('core.chat.VENTANA_MENSAJES', 5)
+    def test_ventana_y_anteriores(self):
+        response = self.client.get(reverse('chat_thread', args=[self.beto.pk]))
+        self.assertEqual([m.pk for m in response.context['mensajes']], self.ids[-5:])
+        self.assertContains(response, f'?antes={self.ids[-5]}')
+        url = reverse('chat_historial', args=[self.conversacion.pk])
+        datos = self.client.get(url, {'antes': self.ids[-5]}).json()
+        self.assertEqual([m['id'] for m in datos['mensajes']], self.ids[2:7])
+        self.assertTrue(datos['hay_mas'])
+        datos = self.client.get(url, {'antes': self.ids[2]}).json()
+        self.assertEqual([m['id'] for m in datos['mensajes']], self.ids[:2])
+        self.assertFalse(datos['hay_mas'])
+
+    @mock.patch('core.chat.VENTANA_MENSAJES', 5)
+    def test_archivar_y_seguir_leyendo_el_historial(self):
+        out = StringIO()
+        call_command('archivar_mensajes', dias=30, batch_size=3, stdout=out)
+        self.assertIn('8 mensajes', out.getvalue())
+        self.assertEqual(list(MensajeArchivado.objects.order_by('id').values_list('id', flat=True)), self.ids[:8])
+        self.assertEqual(list(MensajeChat.objects.order_by('id').values_list('id', flat=True)), self.ids[8:])
+        self.conversacion.refresh_from_db()
+        self.assertEqual(self.conversacion.archivado_hasta, self.ids[7])
+
+        # El hilo cruza de la tabla viva al archivo sin cambiar de cursor.
+        url = reverse('chat_historial', args=[self.conversacion.pk])
+        datos = self.client.get(url, {'antes': self.ids[-4]}).json()
+        self.assertEqual([m['id'] for m in datos['mensajes']], self.ids[3:8])
+        self.assertEqual(datos['mensajes'][0]['texto'], 'Mensaje 3')
+
+    def test_no_archiva_el_ultimo_mensaje(self):
+        MensajeChat.objects.update(fecha_envio=timezone.now() - timezone.timedelta(days=365))
+        call_command('archivar_mensajes', dias=30, stdout=StringIO())
+        self.conversacion.refresh_from_db()
+        self.assertEqual(self.conversacion.ultimo_mensaje_id, self.ids[-1])
+        self.assertEqual(MensajeArchivado.objects.count(), 11)
+
+
+def imagen_subida(nombre='foto.JPG', tamano=(1000, 500)):
+    exif = Image.Exif()
+    exif[0x010e] = 'Taller de la abuela, -18.47, -70.31'
+    buffer = io.BytesIO()
+    Image.new('RGB', tamano, (180, 90, 40)).save(buffer, format='JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile(nombre, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(IMAGENES_EJECUTOR='inmediato')
+class ImagenesTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        _, (self.producto,) = crear_tienda_con_productos('alfarera', 1)
+
+    def subir(self, **kwargs):
+        self.producto.imagen = imagen_subida(**kwargs)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.save()
+        self.producto.refresh_from_db()
+        return self.producto
+
+    def etiqueta(self, producto):
+        return Template('{% load core_extras %}{% imagen_producto producto sizes="50vw" %}').render(
+            Context({'producto': producto})
+        )
+
+    def test_subida_genera_derivadas_sin_metadatos(self):
+        producto = self.subir()
+        self.assertRegex(producto.imagen.name, r'^productos/[0-9a-f]{16}\.jpg$')
+        datos = producto.imagen_derivadas
+        self.assertEqual((datos['ancho'], datos['alto']), (1000, 500))
+        self.assertEqual([ancho for ancho, _ in datos['variantes']['webp']], [320, 640, 960, 1000])
+        with default_storage.open(datos['variantes']['webp'][0][1]) as archivo, Image.open(archivo) as derivada:
+            self.assertEqual((derivada.format, derivada.size), ('WEBP', (320, 160)))
+            self.assertFalse(derivada.getexif())
+
+    def test_cambiar_imagen_borra_derivadas_huerfanas(self):
+        anteriores = self.subir().imagen_derivadas
+        self.subir(tamano=(400, 400))
+        self.assertNotEqual(self.producto.imagen_derivadas['hash'], anteriores['hash'])
+        self.assertFalse(default_storage.exists(anteriores['variantes']['webp'][0][1]))
+
+    def test_etiqueta_emite_srcset_y_dimensiones(self):
+        producto = self.subir()
+        html = self.etiqueta(producto)
+        self.assertIn('320w', html)
+        self.assertIn('width="1000" height="500"', html)
+        self.assertNotIn(producto.imagen.url, html)
+
+    def test_comando_rellena_derivadas(self):
+        self.subir()
+        Producto.objects.update(imagen_derivadas={})
+        call_command('generar_derivadas_imagenes', '--procesos', '1', stdout=StringIO())
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.imagen_derivadas['origen'], self.producto.imagen.name)
+
+    @override_settings(IMAGENES_EJECUTOR='worker')
+    def test_guardar_no_genera_derivadas_en_la_peticion(self):
+        anteriores = self.producto.imagen_derivadas
+        producto = self.subir()
+        self.assertEqual(producto.imagen_derivadas, anteriores)
+        self.assertIn(f'src="{producto.imagen.url}"', self.etiqueta(producto))
+        call_command('generar_derivadas_imagenes', '--procesos', '1', stdout=StringIO())
+        producto.refresh_from_db()
+        self.assertIn('320w', self.etiqueta(producto))
+
+    def test_etiqueta_no_usa_las_derivadas_de_la_imagen_anterior(self):
+        producto = self.subir()
+        with override_settings(IMAGENES_EJECUTOR='worker'):
+            producto = self.subir(tamano=(400, 400))
+        self.assertNotIn('320w', self.etiqueta(producto))
+        self.assertIn(f'src="{producto.imagen.url}"', self.etiqueta(producto))
+
+
+def leer_stream(response):
+    if not response.is_async:
+        return b''.join(response.streaming_content)
+
+    async def leer():
+        return b''.join([parte async for parte in response.streaming_content])
+    return async_to_sync(leer)()
+
+
+class ChatTiempoRealTests(TestCase):
+    def setUp(self):
+        self.ana = User.objects.create_user(username='ana', password='x')
+        self.beto = User.objects.create_user(username='beto', password='x')
+        self.intrusa = User.objects.create_user(username='intrusa', password='x')
+        self.conversacion = Conversacion.objects.create(participante_1=self.ana, participante_2=self.beto)
+        self.primero = MensajeChat.objects.create(conversacion=self.conversacion, remitente=self.beto, texto='Hola')
+
+    def url(self, nombre):
+        return reverse(nombre, args=[self.conversacion.pk])
+
+    def test_broker_entrega_entre_hilos(self):
+        broker = MemoryBroker()
+
+        async def escenario():
+            async with broker.suscribir('chat:1') as suscripcion:
+                threading.Thread(target=broker.publicar, args=('chat:1', {'tipo': 'mensaje'})).start()
+                return await suscripcion.esperar(5)
+
+        self.assertEqual(async_to_sync(escenario)(), {'tipo': 'mensaje'})
+
+    def test_mensajes_desde_id(self):
+        segundo = MensajeChat.objects.create(conversacion=self.conversacion, remitente=self.ana, texto='Chao')
+        self.client.force_login(self.ana)
+        datos = self.client.get(self.url('chat_mensajes'), {'desde': self.primero.pk}).json()
+        self.assertEqual([m['id'] for m in datos['mensajes']], [segundo.pk])
+        self.assertTrue(datos['mensajes'][0]['propio'])
+
+    def test_solo_participantes(self):
+        self.client.force_login(self.intrusa)
+        self.assertEqual(self.client.get(self.url('chat_mensajes')).status_code, 403)
+        self.assertEqual(self.client.post(self.url('chat_enviar'), {'texto': 'Hola'}).status_code, 403)
+
+    def test_anonimo_va_al_login(self):
+        for nombre in ('chat_mensajes', 'chat_stream'):
+            with self.subTest(nombre=nombre):
+                url = self.url(nombre) + '?desde=1'
+                response = self.client.get(url)
+                self.assertRedirects(
+                    response, f"{resolve_url(settings.LOGIN_URL)}?{urlencode({'next': url})}",
+                    fetch_redirect_response=False,
+                )
+
+    def test_enviar_publica_tras_commit(self):
+        self.client.force_login(self.ana)
+        with mock.patch('core.chat.publicar') as publicar, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url('chat_enviar'), {'texto': '¿Sigue disponible?'})
+        self.assertEqual(response.status_code, 201)
+        publicar.assert_called_once_with(self.conversacion.pk, 'mensaje', id=response.json()['id'])
+
+    def test_leidos_por_tandas(self):
+        segundo = MensajeChat.objects.create(conversacion=self.conversacion, remitente=self.beto, texto='¿Estás?')
+        self.client.force_login(self.ana)
+        with self.assertNumQueries(4):  # sesión, usuario, conversación y el UPDATE de su marcador
+            datos = self.client.post(self.url('chat_leidos'), {'hasta': segundo.pk}).json()
+        self.assertTrue(datos['actualizado'])
+        self.conversacion.refresh_from_db()
+        self.assertEqual(self.conversacion.leido_hasta_1, segundo.pk)
+        # El marcador no retrocede ni se adelanta a mensajes que no existen.
+        self.assertFalse(self.client.post(self.url('chat_leidos'), {'hasta': self.primero.pk}).json()['actualizado'])
+        self.assertFalse(self.client.post(self.url('chat_leidos'), {'hasta': segundo.pk + 100}).json()['actualizado'])
+        self.client.force_login(self.beto)
+        datos = self.client.get(self.url('chat_mensajes'), {'desde': segundo.pk}).json()
+        self.assertEqual(datos['leido_hasta'], segundo.pk)
+
+    @mock.patch('core.chat.get_broker')
+    def test_con_wsgi_no_espera_en_el_servidor(self, get_broker):
+        self.client.force_login(self.ana)
+        response = self.client.get(self.url('chat_mensajes'), {'esperar': 1, 'desde': self.primero.pk})
+        self.assertEqual(response.json()['mensajes'], [])
+        get_broker.assert_not_called()
+        config = self.client.get(reverse('chat_thread', args=[self.beto.pk])).context['chat_config']
+        self.assertEqual((config['transporte'], config['intervalo']), ('sondeo', 3000))
+
+    @mock.patch('core.chat.get_broker')
+    def test_long_poll_despierta_con_mensaje_nuevo(self, get_broker):
+        broker = get_broker.return_value = MemoryBroker()
+        self.async_client.force_login(self.ana)
+
+        async def escenario():
+            peticion = asyncio.ensure_future(
+                self.async_client.get(self.url('chat_mensajes'), {'esperar': 1, 'desde': self.primero.pk})
+            )
+            while not broker._suscripciones:
+                await asyncio.sleep(0.01)
+            nuevo = await sync_to_async(MensajeChat.objects.create)(
+                conversacion=self.conversacion, remitente=self.beto, texto='¿Sigues ahí?',
+            )
+            broker.publicar(f'chat:{self.conversacion.pk}', {'tipo': 'mensaje', 'id': nuevo.pk})
+            return nuevo, await asyncio.wait_for(peticion, 5)
+
+        nuevo, response = async_to_sync(escenario)()
+        self.assertEqual([m['id'] for m in response.json()['mensajes']], [nuevo.pk])
+
+    @mock.patch('core.chat.DURACION_STREAM', 0)
+    def test_stream_reanuda_desde_last_event_id(self):
+        segundo = MensajeChat.objects.create(conversacion=self.conversacion, remitente=self.beto, texto='Otro')
+        self.client.force_login(self.ana)
+        response = self.client.get(self.url('chat_stream'), HTTP_LAST_EVENT_ID=str(self.primero.pk))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        cuerpo = leer_stream(response).decode()
+        evento = next(linea for linea in cuerpo.splitlines() if linea.startswith('data: '))
+        self.assertEqual([m['id'] for m in json.loads(evento[6:])['mensajes']], [segundo.pk])
+        self.assertIn(f'id: {segundo.pk}', cuerpo)
+
+
+def tablas_con_scan_completo(sql):
+    """Tablas de core recorridas enteras según el plan de `sql`."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            tablas = []
+            for fila in cursor.fetchall():
+                detalle = fila[-1]
+                partes = detalle.split()
+                # "SCAN tabla" sin "USING ... INDEX" es un recorrido completo.
+                if partes[:1] == ['SCAN'] and 'USING' not in partes and 'VIRTUAL' not in partes:
+                    tablas.append(partes[1])
+            return tablas
+        if connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql)
+            columnas = [c[0] for c in cursor.description]
+            filas = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+            return [f['table'] for f in filas if f['type'] == 'ALL']
+    return []
+
+
+class IndicesTests(TestCase):
+    # Tablas que se listan completas a propósito.
+    SCAN_PERMITIDO = {'core_categoria'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.artesano, cls.productos = crear_tienda_con_productos('vidriero', *([3] * 30))
+        cls.comprador = User.objects.create_user(username='cliente', password='clave-segura-123')
+        Perfil.objects.create(user=cls.comprador, rol='comprador')
+        categoria = Categoria.objects.create(nombre='Vidrio', slug='vidrio')
+        Producto.objects.filter(pk__in=[p.pk for p in cls.productos[:10]]).update(categoria=categoria)
+        cls.categoria = categoria
+        for producto in cls.productos[:5]:
+            ResenaDeProducto.objects.create(producto=producto, autor=cls.comprador, calificacion=4)
+            Favorito.objects.create(usuario=cls.comprador, producto=producto)
+            Pedido.objects.create(producto=producto, comprador=cls.comprador)
+            Notificacion.objects.create(usuario=cls.artesano, mensaje='Pedido', tipo='pedido')
+        conversacion = Conversacion.objects.create(participante_1=cls.comprador, participante_2=cls.artesano)
+        for i in range(5):
+            MensajeChat.objects.create(conversacion=conversacion, remitente=cls.comprador, texto=f'Hola {i}')
+        SoporteTicket.objects.create(usuario=cls.comprador, asunto='Ayuda', mensaje='No carga')
+
+    def assertSinScanCompleto(self, usuario, url, datos=None):
+        cache.clear()
+        if usuario:
+            self.client.force_login(usuario)
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.get(url, datos or {})
+        self.assertEqual(response.status_code, 200, url)
+        for query in capturadas.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            tablas = [t for t in tablas_con_scan_completo(sql) if t.startswith('core_')]
+            tablas = [t for t in tablas if t not in self.SCAN_PERMITIDO]
+            self.assertEqual(tablas, [], f"{url}: {sql}")
+
+    def test_catalogo(self):
+        url = reverse('catalogo')
+        self.assertSinScanCompleto(None, url)
+        for orden in ('precio_asc', 'precio_desc', 'nombre', 'calificacion'):
+            self.assertSinScanCompleto(None, url, {'orden': orden})
+        self.assertSinScanCompleto(None, url, {'categoria': self.categoria.pk})
+        self.assertSinScanCompleto(None, url, {'q': 'producto'})
+
+    def test_detalle_producto(self):
+        self.assertSinScanCompleto(self.comprador, reverse('detalle_producto', args=[self.productos[0].pk]))
+
+    def test_vistas_del_comprador(self):
+        for nombre in ('mis_pedidos', 'mis_favoritos', 'mis_notificaciones', 'chat_inbox', 'soporte'):
+            self.assertSinScanCompleto(self.comprador, reverse(nombre))
+        self.assertSinScanCompleto(self.comprador, reverse('chat_thread', args=[self.artesano.pk]))
+
+    def test_vistas_del_artesano(self):
+        self.assertSinScanCompleto(self.artesano, reverse('mi_tienda'))
+        self.assertSinScanCompleto(self.artesano, reverse('mis_notificaciones'))
+
+
+class Mercado:
+    """
+    Marketplace de prueba en el que cada relación que una vista lista tiene
+    `n` filas: productos de la tienda, reseñas, seguidores, pedidos,
+    notificaciones, favoritos, conversaciones, mensajes y colas de moderación.
+    """
+
+    def __init__(self, prefijo, n):
+        self.n = n
+        self.staff = User.objects.create_user(username=f'{prefijo}-staff', password='x', is_staff=True)
+        self.artesano = User.objects.create_user(username=f'{prefijo}-artesano', password='x')
+        self.comprador = User.objects.create_user(username=f'{prefijo}-comprador', password='x')
+        perfil = Perfil.objects.create(user=self.artesano, rol='artesano')
+        Perfil.objects.create(user=self.comprador, rol='comprador')
+        self.categoria = Categoria.objects.create(nombre=f'{prefijo} cat', slug=f'{prefijo}-cat')
+        self.tienda = Tienda.objects.create(artesano=perfil, nombre=f'{prefijo} tienda', ubicacion='Arica')
+
+        self.productos = [
+            Producto.objects.create(
+                tienda=self.tienda, categoria=self.categoria, nombre=f'{prefijo} producto {i}',
+                descripcion='Hecho a mano', precio=1000 + i, stock=50,
+            )
+            for i in range(n)
+        ]
+        self.producto = self.productos[0]
+
+        otros = User.objects.bulk_create([User(username=f'{prefijo}-usuario-{i}') for i in range(n)])
+        Perfil.objects.bulk_create([Perfil(user=u, rol='comprador') for u in otros])
+        for usuario in otros:
+            ResenaDeProducto.objects.create(producto=self.producto, autor=usuario, calificacion=4, comentario='Bueno')
+        SeguirTienda.objects.bulk_create([SeguirTienda(usuario=u, tienda=self.tienda) for u in otros])
+        Pedido.objects.bulk_create([Pedido(producto=p, comprador=self.comprador) for p in self.productos])
+        Pedido.objects.bulk_create([Pedido(producto=self.producto, comprador=u) for u in otros])
+        self.pedido = Pedido.objects.filter(comprador=self.comprador).first()
+        Favorito.objects.bulk_create([Favorito(usuario=self.comprador, producto=p) for p in self.productos])
+        for usuario in (self.comprador, self.artesano):
+            Notificacion.objects.bulk_create([
+                Notificacion(usuario=usuario, mensaje=f'Aviso {i}', tipo='pedido' if i % 2 else 'general')
+                for i in range(n)
+            ])
+        Conversacion.objects.bulk_create([
+            Conversacion(**Conversacion.pareja(self.comprador.pk, u.pk)) for u in otros[1:]
+        ])
+        self.conversacion = conversacion = Conversacion.objects.create(
+            participante_1=self.comprador, participante_2=self.artesano,
+        )
+        for conv in Conversacion.objects.filter(Q(participante_1=self.comprador) | Q(participante_2=self.comprador)):
+            MensajeChat.objects.create(conversacion=conv, remitente=self.comprador, texto='Hola')
+        MensajeChat.objects.bulk_create([
+            MensajeChat(conversacion=conversacion, remitente=self.artesano, texto=f'Mensaje {i}')
+            for i in range(n)
+        ])
+        SoporteTicket.objects.bulk_create([
+            SoporteTicket(usuario=self.comprador, asunto=f'Ticket {i}', mensaje='Ayuda') for i in range(n)
+        ])
+        tipo_producto = ContentType.objects.get_for_model(Producto)
+        ReporteAbuso.objects.bulk_create([
+            ReporteAbuso(reportante=u, motivo='Spam', content_type=tipo_producto, object_id=self.producto.pk)
+            for u in otros
+        ])
+
+
+# (nombre de la URL, argumentos a partir del Mercado, roles que la visitan,
+#  máximo de queries por request)
+TODOS = ('anonimo', 'comprador', 'artesano', 'staff')
+URLS_PRESUPUESTO = [
+    ('home', lambda m: [], TODOS, 5),
+    ('catalogo', lambda m: [], TODOS, 9),
+    ('detalle_producto', lambda m: [m.producto.pk], TODOS, 8),
+    ('crear_resena', lambda m: [m.producto.pk], ('comprador',), 3),
+    ('login', lambda m: [], ('anonimo',), 0),
+    ('registro_artesano', lambda m: [], ('anonimo',), 0),
+    ('registro_comprador', lambda m: [], ('anonimo',), 0),
+    ('crear_tienda', lambda m: [], ('artesano',), 4),
+    ('mi_tienda', lambda m: [], ('artesano',), 10),
+    ('crear_producto', lambda m: [], ('artesano',), 6),
+    ('importar_productos', lambda m: [], ('artesano',), 5),
+    ('exportar_productos', lambda m: [], ('artesano',), 4),
+    ('editar_producto', lambda m: [m.producto.pk], ('artesano',), 6),
+    ('eliminar_producto', lambda m: [m.producto.pk], ('artesano',), 5),
+    ('simular_pedido', lambda m: [m.productos[-1].pk], ('comprador',), 8),
+    ('mis_pedidos', lambda m: [], ('comprador',), 7),
+    ('cancelar_pedido', lambda m: [m.pedido.pk], ('comprador',), 8),
+    ('exportar_pedidos', lambda m: [], ('artesano', 'staff'), 5),
+    ('actualizar_estado_pedido', lambda m: [m.pedido.pk, 'C'], ('artesano',), 11),
+    ('comprar_carrito', lambda m: [], ('comprador',), 2),
+    ('toggle_favorito', lambda m: [m.producto.pk], ('comprador',), 5),
+    ('mis_favoritos', lambda m: [], ('comprador',), 7),
+    # Antes que mis_notificaciones, que marca como leída su primera página.
+    ('marcar_notificaciones_leidas', lambda m: [], ('comprador', 'artesano'), 6),
+    ('mis_notificaciones', lambda m: [], ('comprador', 'artesano'), 7),
+    ('notificaciones_nuevas', lambda m: [], ('comprador', 'artesano'), 4),
+    ('admin_dashboard', lambda m: [], ('staff',), 8),
+    ('admin_moderacion', lambda m: ['reportes'], ('staff',), 4),
+    ('metricas_rendimiento', lambda m: [], ('staff',), 2),
+    ('soporte', lambda m: [], ('comprador',), 6),
+    ('chat_inbox', lambda m: [], ('comprador', 'artesano'), 6),
+    ('chat_thread', lambda m: [m.artesano.pk], ('comprador',), 9),
+    ('chat_mensajes', lambda m: [m.conversacion.pk], ('comprador', 'artesano'), 6),
+    ('chat_historial', lambda m: [m.conversacion.pk], ('comprador', 'artesano'), 4),
+    ('chat_stream', lambda m: [m.conversacion.pk], ('comprador',), 6),
+    ('chat_enviar', lambda m: [m.conversacion.pk], ('comprador', 'artesano'), 7),
+    ('chat_leidos', lambda m: [m.conversacion.pk], ('comprador',), 4),
+    ('reportar_abuso', lambda m: ['producto', m.producto.pk], ('comprador',), 6),
+    ('seguir_tienda', lambda m: [m.tienda.pk], ('comprador',), 8),
+    ('logout', lambda m: [], ('comprador',), 4),
+]
+
+# URLs que solo aceptan POST, con los datos a enviar.
+DATOS_POST = {
+    'chat_enviar': lambda m: {'texto': 'Nuevo mensaje'},
+    'chat_leidos': lambda m: {'hasta': m.conversacion.mensajes.latest('id').pk},
+    'marcar_notificaciones_leidas': lambda m: {'hasta': Notificacion.objects.latest('id').pk},
+    'actualizar_estado_pedido': lambda m: {},
+    'simular_pedido': lambda m: {},
+    'cancelar_pedido': lambda m: {},
+}
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+@mock.patch('core.chat.DURACION_STREAM', 0)
+class PresupuestoQueriesTests(TestCase):
+    """
+    Cada URL debe ejecutar el mismo número de queries con 1 fila que con
+    GRANDE filas por relación: si una plantilla empieza a cargar relaciones
+    de forma perezosa dentro de un bucle, el conteo crece y el test falla.
+    """
+    GRANDE = 100
+    # URL -> motivo por el que todavía no cumple el presupuesto.
+    PENDIENTES = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.chico = Mercado('chico', 1)
+        cls.grande = Mercado('grande', cls.GRANDE)
+
+    def contar_queries(self, mercado, rol, nombre, argumentos):
+        cache.clear()
+        self.client.logout()
+        usuario = getattr(mercado, rol, None)
+        if usuario is not None:
+            self.client.force_login(usuario)
+        url = reverse(nombre, args=argumentos(mercado))
+        datos = DATOS_POST[nombre](mercado) if nombre in DATOS_POST else None
+        with CaptureQueriesContext(connection) as capturadas:
+            if datos is not None:
+                response = self.client.post(url, datos)
+            else:
+                response = self.client.get(url)
+            if response.streaming:
+                leer_stream(response)
+        self.assertIn(response.status_code, (200, 201, 302), f"{nombre} ({rol})")
+        return len(capturadas), capturadas
+
+    def test_cubre_todas_las_urls(self):
+        from core.urls import urlpatterns
+        nombres = {patron.name for patron in urlpatterns}
+        self.assertEqual(nombres, {nombre for nombre, *_ in URLS_PRESUPUESTO})
+
+    def test_queries_no_dependen_del_volumen(self):
+        for nombre, argumentos, roles, presupuesto in URLS_PRESUPUESTO:
+            if nombre in self.PENDIENTES:
+                continue
+            for rol in roles:
+                with self.subTest(url=nombre, rol=rol):
+                    chico, _ = self.contar_queries(self.chico, rol, nombre, argumentos)
+                    grande, capturadas = self.contar_queries(self.grande, rol, nombre, argumentos)
+                    detalle = '\n'.join(q['sql'] for q in capturadas.captured_queries)
+                    self.assertEqual(chico, grande, f"{nombre} ({rol}) escala con los datos:\n{detalle}")
+                    self.assertLessEqual(grande, presupuesto, f"{nombre} ({rol}) excede su presupuesto:\n{detalle}")
@@ -21,11 +21,15 @@ urlpatterns = [
     path('tienda/crear/', views.crear_tienda, name='crear_tienda'),
     path('tienda/mi_tienda/', views.mi_tienda, name='mi_tienda'),
     path('tienda/producto/crear/', views.crear_producto, name='crear_producto'),
+    path('tienda/productos/importar/', views.importar_productos, name='importar_productos'),
+    path('tienda/productos/exportar/', views.exportar_productos, name='exportar_productos'),
     path('tienda/producto/<int:producto_id>/editar/', views.editar_producto, name='editar_producto'),
     path('tienda/producto/<int:producto_id>/eliminar/', views.eliminar_producto, name='eliminar_producto'),
+    path('pedidos/exportar/', views.exportar_pedidos, name='exportar_pedidos'),
     path('pedido/actualizar/<int:pedido_id>/<str:nuevo_estado>/', views.actualizar_estado_pedido, name='actualizar_estado_pedido'),
     
     # Pedidos
+    path('pedido/carrito/', views.comprar_carrito, name='comprar_carrito'),
     path('pedido/<int:producto_id>/', views.simular_pedido, name='simular_pedido'),
     path('mis-pedidos/', views.mis_pedidos, name='mis_pedidos'),
     path('pedido/cancelar/<int:pedido_id>/', views.cancelar_pedido, name='cancelar_pedido'),
@@ -36,14 +40,23 @@ urlpatterns = [
     
     # Notificaciones
     path('notificaciones/', views.mis_notificaciones, name='mis_notificaciones'),
+    path('notificaciones/nuevas/', views.notificaciones_nuevas, name='notificaciones_nuevas'),
+    path('notificaciones/leidas/', views.marcar_notificaciones_leidas, name='marcar_notificaciones_leidas'),
     
     # Admin
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('admin/moderacion/<str:cola>/', views.admin_moderacion, name='admin_moderacion'),
+    path('metricas/rendimiento/', views.metricas_rendimiento, name='metricas_rendimiento'),
 
     # Soporte y Comunicación
     path('soporte/', views.soporte_view, name='soporte'),
     path('chat/', views.chat_inbox, name='chat_inbox'),
     path('chat/<int:usuario_id>/', views.chat_thread, name='chat_thread'),
+    path('chat/conversacion/<int:conversacion_id>/mensajes/', views.chat_mensajes, name='chat_mensajes'),
+    path('chat/conversacion/<int:conversacion_id>/historial/', views.chat_historial, name='chat_historial'),
+    path('chat/conversacion/<int:conversacion_id>/stream/', views.chat_stream, name='chat_stream'),
+    path('chat/conversacion/<int:conversacion_id>/enviar/', views.chat_enviar, name='chat_enviar'),
+    path('chat/conversacion/<int:conversacion_id>/leidos/', views.chat_leidos, name='chat_leidos'),
     
     # Reportes y Moderación
     path('reportar/<str:content_type_str>/<int:object_id>/', views.reportar_abuso, name='reportar_abuso'),
@@ -1,99 +1,227 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.password_validation import validate_password
 from django.contrib import messages
 from django.core.exceptions import ValidationError
-from django.core.paginator import Paginator
-from django.db.models import Q, Avg, ProtectedError
+from django.db import transaction
+from django.db.models import Avg, Count, Exists, OuterRef, Subquery, ProtectedError
+from django.db.models.functions import Coalesce
 from django.contrib.admin.views.decorators import staff_member_required
+import asyncio
+import json
 import logging
+import os
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models.deletion import ProtectedError
-from django.utils import timezone
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
 from django.contrib.contenttypes.models import ContentType
 logger = logging.getLogger(__name__)
 
-from .models import Tienda, Perfil, Producto, Pedido, Categoria, ResenaDeProducto, Favorito, Notificacion, SoporteTicket, Conversacion, MensajeChat, ReporteAbuso, SeguirTienda
-from .forms import TiendaForm, ProductoForm, ResenaDeProductoForm, SoporteTicketForm, MensajeChatForm, ReporteAbusoForm
+from .models import Tienda, Perfil, Producto, Pedido, ResenaDeProducto, Favorito, Notificacion, NotificacionesNoLeidas, SoporteTicket, Conversacion, MensajeChat, ReporteAbuso, SeguirTienda
+from .forms import TiendaForm, ProductoForm, ResenaDeProductoForm, SoporteTicketForm, MensajeChatForm, ReporteAbusoForm, ImportarProductosForm, FiltroPedidosForm
+from .search import buscar_productos
+from .paginacion import CursorPaginator, CursorPage
+from . import cache_catalogo
+from .condicional import etag_debil, firma_usuario, hay_mensajes
+from . import metricas
+from .pedidos import realizar_pedido, devolver_stock, filtrar_pedidos, lineas_exportacion, PedidoError
+from .notificaciones import notificar, notificar_seguidores, marcar_leidas
+from . import chat
+from . import exportacion, importacion
+from . import instrumentacion
 
 
 
 def home(request):
     return render(request, 'home.html')
 
-def catalogo(request):
-    productos = Producto.objects.select_related('tienda', 'categoria').filter(activo=True)
+# Cada orden del catálogo termina en el id para que el cursor sea único.
+ORDENES_CATALOGO = {
+    'relevancia': ('-relevancia', '-id'),
+    '-fecha_creacion': ('-fecha_creacion', '-id'),
+    'precio_asc': ('precio', 'id'),
+    'precio_desc': ('-precio', '-id'),
+    'nombre': ('nombre', 'id'),
+    'calificacion': ('-calificacion_promedio', '-calificacion_conteo', '-id'),
+}
+
+def _parametros_catalogo(request):
     query = request.GET.get('q', '')
-    if query:
-        productos = productos.filter(
-            Q(nombre__icontains=query) |
-            Q(descripcion__icontains=query) |
-            Q(tienda__nombre__icontains=query)
-        )
     categoria_id = request.GET.get('categoria', '')
     if categoria_id:
-        productos = productos.filter(categoria_id=categoria_id)
         try:
             categoria_id = int(categoria_id)
         except ValueError:
             pass
-    orden = request.GET.get('orden', '-fecha_creacion')
-    if orden == 'precio_asc':
-        productos = productos.order_by('precio')
-    elif orden == 'precio_desc':
-        productos = productos.order_by('-precio')
-    elif orden == 'nombre':
-        productos = productos.order_by('nombre')
-    else:
-        productos = productos.order_by('-fecha_creacion')
-    paginator = Paginator(productos, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    categorias = Categoria.objects.all()
+    calificacion_min = request.GET.get('calificacion_min', '')
+    if calificacion_min:
+        try:
+            int(calificacion_min)
+        except ValueError:
+            calificacion_min = ''
+    orden = request.GET.get('orden', 'relevancia' if query else '-fecha_creacion')
+    if orden == 'relevancia' and not query:
+        orden = '-fecha_creacion'
+    if orden not in ORDENES_CATALOGO:
+        orden = '-fecha_creacion'
+    return {
+        'q': query, 'categoria': categoria_id, 'calificacion_min': calificacion_min,
+        'orden': orden, 'cursor': request.GET.get('cursor', ''),
+    }
+
+
+def _pagina_catalogo(request):
+    """Parámetros, página cacheada y versiones de sus tarjetas; una vez por request."""
+    if hasattr(request, '_pagina_catalogo'):
+        return request._pagina_catalogo
+    parametros = _parametros_catalogo(request)
+
+    def calcular_pagina():
+        productos = Producto.objects.select_related('tienda', 'categoria').filter(activo=True)
+        if parametros['q']:
+            productos = buscar_productos(productos, parametros['q'])
+        if parametros['categoria']:
+            productos = productos.filter(categoria_id=parametros['categoria'])
+        if parametros['calificacion_min']:
+            productos = productos.filter(calificacion_promedio__gte=int(parametros['calificacion_min']))
+        paginator = CursorPaginator(productos, 12, ORDENES_CATALOGO[parametros['orden']])
+        pagina = paginator.page(parametros['cursor'])
+        total, total_exacto = paginator.contar()
+        # Ya están cargados: se dejan listas las tarjetas de esta página.
+        cache_catalogo.renderizar_tarjetas(pagina)
+        return {
+            'ids': [producto.pk for producto in pagina],
+            'has_next': pagina.has_next,
+            'has_previous': pagina.has_previous,
+            'next_cursor': pagina.next_cursor,
+            'previous_cursor': pagina.previous_cursor,
+            'total': total,
+            'total_exacto': total_exacto,
+        }
+
+    # Los resultados no dependen del usuario: se cachean los ids de la página
+    # y el HTML de cada tarjeta por separado (ver core/cache_catalogo.py).
+    resultado = cache_catalogo.pagina(calcular_pagina, **parametros)
+    request._pagina_catalogo = (parametros, resultado, cache_catalogo.versiones(resultado['ids']))
+    return request._pagina_catalogo
+
+
+def _etag_catalogo(request):
+    if hay_mensajes(request):
+        return None
+    parametros, resultado, versiones = _pagina_catalogo(request)
+    return etag_debil(
+        cache_catalogo.generacion(), sorted(parametros.items()), resultado['ids'],
+        sorted(versiones.items()), firma_usuario(request),
+    )
+
+
+@condition(etag_func=_etag_catalogo)
+@cache_control(private=True, no_cache=True)
+def catalogo(request):
+    parametros, resultado, versiones = _pagina_catalogo(request)
+    page_obj = CursorPage(
+        cache_catalogo.tarjetas(resultado['ids'], versiones), None, resultado['has_next'],
+        resultado['has_previous'], resultado['next_cursor'], resultado['previous_cursor'],
+    )
     context = {
         'page_obj': page_obj,
-        'categorias': categorias,
-        'query': query,
-        'categoria_seleccionada': categoria_id,
-        'orden': orden,
+        'producto_ids': resultado['ids'],
+        'categorias': cache_catalogo.categorias(),
+        'query': parametros['q'],
+        'categoria_seleccionada': parametros['categoria'],
+        'calificacion_min': parametros['calificacion_min'],
+        'orden': parametros['orden'],
+        'total': resultado['total'],
+        'total_exacto': resultado['total_exacto'],
     }
     return render(request, 'catalogo_fixed.html', context)
 
-def detalle_producto(request, producto_id):
-    producto = get_object_or_404(Producto, id=producto_id)
-    resenas = producto.resenas.filter(activa=True).order_by('-fecha_creacion')
-    es_favorito = False
-    if request.user.is_authenticated:
-        es_favorito = Favorito.objects.filter(usuario=request.user, producto=producto).exists()
-    
-    resena_form = ResenaDeProductoForm()
-    user_has_reviewed = False
-    is_artisan_owner = False
-    siguiendo_tienda = False
-
-    if request.user.is_authenticated:
-        es_favorito = Favorito.objects.filter(usuario=request.user, producto=producto).exists()
-        user_has_reviewed = ResenaDeProducto.objects.filter(producto=producto, autor=request.user).exists()
-        siguiendo_tienda = SeguirTienda.objects.filter(usuario=request.user, tienda=producto.tienda).exists()
-        if hasattr(request.user, 'perfil') and request.user.perfil.rol == 'artesano':
-            is_artisan_owner = (producto.tienda.artesano.user == request.user)
+RESENAS_POR_PAGINA = 10
+PEDIDOS_POR_PAGINA = 20
+NOTIFICACIONES_POR_PAGINA = 30
+
+
+def _estado_detalle(request, producto_id):
+    """
+    Versión del producto y estado personal del usuario en una sola consulta,
+    compartida por los validadores y la vista. None si el producto no existe.
+    """
+    if not hasattr(request, '_estado_detalle'):
+        campos = ['actualizado', 'stock', 'calificacion_suma', 'calificacion_conteo']
+        fila = Producto.objects.filter(pk=producto_id)
+        if request.user.is_authenticated:
+            fila = fila.annotate(
+                es_favorito=Exists(Favorito.objects.filter(usuario=request.user, producto=OuterRef('pk'))),
+                siguiendo_tienda=Exists(SeguirTienda.objects.filter(usuario=request.user, tienda=OuterRef('tienda'))),
+                user_has_reviewed=Exists(ResenaDeProducto.objects.filter(autor=request.user, producto=OuterRef('pk'))),
+            )
+            campos += ['es_favorito', 'siguiendo_tienda', 'user_has_reviewed']
+        request._estado_detalle = fila.values(*campos).first()
+    return request._estado_detalle
+
+
+def _etag_detalle(request, producto_id):
+    estado = _estado_detalle(request, producto_id)
+    if estado is None or hay_mensajes(request):
+        return None
+    return etag_debil(
+        producto_id, sorted(estado.items()), request.GET.get('resenas', ''), firma_usuario(request),
+    )
 
-    context = {
+
+def _ultima_modificacion_detalle(request, producto_id):
+    # Solo para anónimos: el estado personal (favorito, seguimiento) no tiene
+    # fecha, así que con sesión solo vale el ETag.
+    estado = _estado_detalle(request, producto_id)
+    if estado is None or request.user.is_authenticated or hay_mensajes(request):
+        return None
+    return estado['actualizado']
+
+
+def _contexto_detalle(request, producto, resena_form):
+    """
+    Contexto de la ficha con un número fijo de consultas: el producto ya
+    viene con tienda, artesano y categoría; los indicadores del usuario salen
+    de _estado_detalle y las reseñas se paginan con su autor.
+    """
+    estado = _estado_detalle(request, producto.pk) or {}
+    resenas = producto.resenas.filter(activa=True).select_related('autor')
+    pagina_resenas = CursorPaginator(resenas, RESENAS_POR_PAGINA, ('-fecha_creacion', '-id')).page(
+        request.GET.get('resenas')
+    )
+    return {
         'producto': producto,
-        'resenas': resenas,
-        'es_favorito': es_favorito,
+        'resenas': pagina_resenas,
+        'es_favorito': estado.get('es_favorito', False),
         'resena_form': resena_form,
-        'user_has_reviewed': user_has_reviewed,
-        'is_artisan_owner': is_artisan_owner,
-        'siguiendo_tienda': siguiendo_tienda,
+        'user_has_reviewed': estado.get('user_has_reviewed', False),
+        # Solo el dueño de la tienda puede serlo; no hace falta leer su perfil.
+        'is_artisan_owner': producto.tienda.artesano.user_id == request.user.pk,
+        'siguiendo_tienda': estado.get('siguiendo_tienda', False),
     }
-    return render(request, 'detalle_producto.html', context)
+
+
+@condition(etag_func=_etag_detalle, last_modified_func=_ultima_modificacion_detalle)
+@cache_control(private=True, no_cache=True)
+def detalle_producto(request, producto_id):
+    producto = get_object_or_404(
+        Producto.objects.select_related('categoria', 'tienda__artesano__user'), id=producto_id
+    )
+    return render(request, 'detalle_producto.html', _contexto_detalle(request, producto, ResenaDeProductoForm()))
 
 @login_required
 def crear_resena(request, producto_id):
-    producto = get_object_or_404(Producto, id=producto_id)
+    producto = get_object_or_404(Producto.objects.select_related('categoria', 'tienda__artesano__user'), id=producto_id)
     if request.method == 'POST':
         if producto.tienda.artesano.user == request.user:
             messages.error(request, "No puedes reseñar tu propio producto.")
@@ -112,24 +240,7 @@ def crear_resena(request, producto_id):
             messages.success(request, "Tu reseña ha sido enviada con éxito.")
             return redirect('detalle_producto', producto_id=producto_id)
         else:
-            resenas = producto.resenas.filter(activa=True).order_by('-fecha_creacion')
-            es_favorito = False
-            user_has_reviewed = False
-            is_artisan_owner = False
-            if request.user.is_authenticated:
-                es_favorito = Favorito.objects.filter(usuario=request.user, producto=producto).exists()
-                user_has_reviewed = ResenaDeProducto.objects.filter(producto=producto, autor=request.user).exists()
-                if hasattr(request.user, 'perfil') and request.user.perfil.rol == 'artesano':
-                    is_artisan_owner = (producto.tienda.artesano.user == request.user)
-
-            context = {
-                'producto': producto,
-                'resenas': resenas,
-                'es_favorito': es_favorito,
-                'resena_form': form,
-                'user_has_reviewed': user_has_reviewed,
-                'is_artisan_owner': is_artisan_owner,
-            }
+            context = _contexto_detalle(request, producto, form)
             messages.error(request, "Hubo un error con tu reseña. Por favor, verifica los datos.")
             return render(request, 'detalle_producto.html', context)
 
@@ -247,12 +358,21 @@ def mi_tienda(request):
     if not tienda:
         return redirect('crear_tienda')
     productos_list = tienda.productos.filter(activo=True).order_by('nombre')
-    paginator = Paginator(productos_list, 6)  # 6 productos por página
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(productos_list, 6, ('nombre', 'id'))  # 6 productos por página
+    page_obj = paginator.page(request.GET.get('cursor'))
+    total_productos, _ = paginator.contar()
 
-    pedidos = Pedido.objects.filter(producto__in=productos_list).order_by('-fecha_creacion')
-    context = {'tienda': tienda, 'productos': page_obj, 'pedidos': pedidos}
+    pedidos_paginator = CursorPaginator(
+        Pedido.objects.filter(producto__tienda=tienda).select_related('producto', 'comprador'),
+        PEDIDOS_POR_PAGINA, ('-fecha_creacion', '-id'),
+    )
+    pedidos = pedidos_paginator.page(request.GET.get('pedidos'))
+    total_pedidos, total_pedidos_exacto = pedidos_paginator.contar()
+    context = {
+        'tienda': tienda, 'productos': page_obj, 'total_productos': total_productos,
+        'pedidos': pedidos, 'total_pedidos': total_pedidos, 'total_pedidos_exacto': total_pedidos_exacto,
+        'filtro_pedidos': FiltroPedidosForm(),
+    }
     return render(request, 'mi_tienda.html', context)
 
 @login_required
@@ -265,18 +385,12 @@ def crear_producto(request):
             producto.tienda = tienda
             producto.save()
             
-            # Notificar a los seguidores
-            seguidores = SeguirTienda.objects.filter(tienda=tienda)
-            notificaciones = []
-            for seguimiento in seguidores:
-                notificaciones.append(Notificacion(
-                    usuario=seguimiento.usuario,
-                    mensaje=f"¡Nuevo en {tienda.nombre}! Han publicado: {producto.nombre}",
-                    tipo='general',
-                    url=reverse('detalle_producto', args=[producto.id])
-                ))
-            if notificaciones:
-                Notificacion.objects.bulk_create(notificaciones)
+            # Notificar a los seguidores (en segundo plano)
+            notificar_seguidores(
+                tienda,
+                f"¡Nuevo en {tienda.nombre}! Han publicado: {producto.nombre}",
+                url=reverse('detalle_producto', args=[producto.id]),
+            )
 
             messages.success(request, "Producto agregado correctamente 🎉")
             return redirect('mi_tienda')
@@ -284,6 +398,48 @@ def crear_producto(request):
         form = ProductoForm()
     return render(request, 'crear_producto.html', {'form': form})
 
+@login_required
+def importar_productos(request):
+    tienda = get_object_or_404(Tienda, artesano__user=request.user)
+    errores, total_errores = [], 0
+    if request.method == 'POST':
+        form = ImportarProductosForm(request.POST, request.FILES)
+        if form.is_valid():
+            archivo = form.cleaned_data['archivo']
+            simular = form.cleaned_data['simular']
+            filas = importacion.leer_filas(archivo.file, importacion.formato_de(archivo.name))
+            try:
+                creados = importacion.importar_productos(tienda, filas, simular=simular)
+            except importacion.ImportacionInvalida as e:
+                errores, total_errores = e.errores, e.total_errores
+            else:
+                if simular:
+                    messages.info(request, f"Archivo válido: se importarían {creados} productos.")
+                else:
+                    messages.success(
+                        request,
+                        f"{creados} productos importados 🎉 Las miniaturas se generan con "
+                        "'manage.py generar_derivadas_imagenes'.",
+                    )
+                return redirect('mi_tienda')
+    else:
+        form = ImportarProductosForm()
+    context = {
+        'form': form, 'tienda': tienda, 'columnas': importacion.COLUMNAS,
+        'errores': errores, 'total_errores': total_errores,
+    }
+    return render(request, 'importar_productos.html', context)
+
+@login_required
+def exportar_productos(request):
+    tienda = get_object_or_404(Tienda, artesano__user=request.user)
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportacion.FORMATOS:
+        formato = 'csv'
+    return exportacion.respuesta(
+        importacion.exportar_productos(tienda, formato), f'productos-{tienda.pk}', formato,
+    )
+
 @login_required
 def editar_producto(request, producto_id):
     producto = get_object_or_404(Producto, id=producto_id, tienda__artesano__user=request.user)
@@ -318,89 +474,132 @@ def eliminar_producto(request, producto_id):
     return render(request, 'confirmar_eliminar_producto.html', {'producto': producto})
 
 @login_required
+def exportar_pedidos(request):
+    pedidos = Pedido.objects.all()
+    if request.user.is_staff:
+        nombre, volver = 'pedidos', 'admin_dashboard'
+    else:
+        tienda = get_object_or_404(Tienda, artesano__user=request.user)
+        pedidos = pedidos.filter(producto__tienda=tienda)
+        nombre, volver = f'pedidos-{tienda.pk}', 'mi_tienda'
+
+    form = FiltroPedidosForm(request.GET)
+    if not form.is_valid():
+        for errores in form.errors.values():
+            messages.error(request, ' '.join(errores))
+        return redirect(volver)
+    filtros = form.cleaned_data
+    if request.user.is_staff and filtros['tienda']:
+        pedidos = pedidos.filter(producto__tienda_id=filtros['tienda'])
+        nombre = f"pedidos-{filtros['tienda']}"
+    pedidos = filtrar_pedidos(pedidos, filtros['desde'], filtros['hasta'], filtros['estado'])
+    formato = filtros['formato'] or 'csv'
+    return exportacion.respuesta(lineas_exportacion(pedidos, formato), nombre, formato)
+
+@login_required
+@require_POST
 def actualizar_estado_pedido(request, pedido_id, nuevo_estado):
     if not hasattr(request.user, 'perfil') or request.user.perfil.rol != 'artesano':
         messages.error(request, "No tienes permiso para realizar esta acción.")
         return redirect('home')
 
-    pedido = get_object_or_404(Pedido, id=pedido_id)
+    pedido = get_object_or_404(Pedido.objects.select_related('producto__tienda__artesano'), id=pedido_id)
 
     if pedido.producto.tienda.artesano != request.user.perfil:
         messages.error(request, "No puedes modificar un pedido que no te pertenece.")
         return redirect('mi_tienda')
 
-    estados_validos = [estado[0] for estado in Pedido.ESTADOS]
+    estados_validos = [estado[0] for estado in Pedido.ESTADOS if estado[0] != 'P']
     if nuevo_estado not in estados_validos:
         messages.error(request, f"Estado '{nuevo_estado}' no es válido.")
         return redirect('mi_tienda')
 
-    pedido.estado = nuevo_estado
-    pedido.save()
+    # Como en cancelar_pedido: solo un pedido pendiente cambia de estado, así
+    # que repetir la petición o rechazar uno ya cancelado no repone stock otra vez.
+    with transaction.atomic():
+        actualizado = Pedido.objects.filter(pk=pedido.pk, estado='P').update(estado=nuevo_estado)
+        if actualizado and nuevo_estado in ('R', 'CA'):
+            devolver_stock(pedido)
+
+    if not actualizado:
+        messages.error(request, f"El pedido #{pedido.id} ya no está pendiente.")
+        return redirect('mi_tienda')
 
+    pedido.estado = nuevo_estado
     if nuevo_estado == 'R':
-        producto = pedido.producto
-        producto.stock += pedido.cantidad
-        producto.save()
         mensaje_notificacion = f"Tu pedido de {pedido.producto.nombre} ha sido rechazado por el artesano."
     elif nuevo_estado == 'C':
         mensaje_notificacion = f"¡Tu pedido de {pedido.producto.nombre} ha sido completado!"
     else:
         mensaje_notificacion = f"El estado de tu pedido de {pedido.producto.nombre} ha cambiado a {pedido.get_estado_display()}."
 
-    if pedido.comprador != pedido.producto.tienda.artesano.user:
-        Notificacion.objects.create(
-            usuario=pedido.comprador,
-            mensaje=mensaje_notificacion,
-            tipo='pedido'
-        )
+    if pedido.comprador_id != pedido.producto.tienda.artesano.user_id:
+        notificar(pedido.comprador_id, mensaje_notificacion, tipo='pedido')
 
     messages.success(request, f"El pedido #{pedido.id} ha sido actualizado a '{pedido.get_estado_display()}'.")
     return redirect('mi_tienda')
     
 @login_required
+@require_POST
 def simular_pedido(request, producto_id):
     """Crea un pedido verificando stock disponible."""
-    producto = get_object_or_404(Producto, id=producto_id)
-    if request.user.is_authenticated and hasattr(request.user, 'perfil') and request.user.perfil.rol == 'artesano':
-        if producto.tienda.artesano.user == request.user:
-            messages.error(request, "No puedes comprar tu propio producto.")
-            return redirect('detalle_producto', producto_id=producto.id)
-
-    if producto.stock < 1:
-        messages.error(request, f"❌ Lo sentimos, {producto.nombre} está agotado.")
-        return redirect('detalle_producto', producto_id=producto_id)
-    Pedido.objects.create(producto=producto, comprador=request.user, cantidad=1)
-    producto.stock -= 1
-    producto.save()
-    Notificacion.objects.create(
-        usuario=producto.tienda.artesano.user,
-        mensaje=f"Nuevo pedido de {producto.nombre} por {request.user.username}",
-        tipo='pedido'
-    )
+    producto = get_object_or_404(Producto.objects.select_related('tienda__artesano__user'), id=producto_id)
+    try:
+        realizar_pedido(request.user, [(producto, 1)])
+    except PedidoError as e:
+        messages.error(request, str(e))
+        return redirect('detalle_producto', producto_id=producto.id)
     messages.success(request, f"✅ Pedido de {producto.nombre} realizado exitosamente.")
     return redirect('mis_pedidos')
 
+@login_required
+def comprar_carrito(request):
+    """Confirma varios productos en un solo pedido atómico."""
+    if request.method != 'POST':
+        return redirect('mis_favoritos')
+    cantidades = {}
+    for producto_id, cantidad in zip(request.POST.getlist('producto'), request.POST.getlist('cantidad')):
+        try:
+            producto_id, cantidad = int(producto_id), int(cantidad)
+        except ValueError:
+            continue
+        if cantidad > 0:
+            cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    productos = Producto.objects.select_related('tienda__artesano__user').filter(id__in=cantidades, activo=True)
+    items = [(producto, cantidades[producto.id]) for producto in productos]
+    if not items:
+        messages.error(request, "Selecciona al menos un producto.")
+        return redirect('mis_favoritos')
+    try:
+        pedidos = realizar_pedido(request.user, items)
+    except PedidoError as e:
+        messages.error(request, str(e))
+        return redirect('mis_favoritos')
+    messages.success(request, f"✅ {len(pedidos)} pedidos realizados exitosamente.")
+    return redirect('mis_pedidos')
+
 @login_required
 def mis_pedidos(request):
     pedidos = Pedido.objects.filter(comprador=request.user).select_related('producto__tienda').order_by('-fecha_creacion')
     return render(request, 'mis_pedidos.html', {'pedidos': pedidos})
 
 @login_required
+@require_POST
 def cancelar_pedido(request, pedido_id):
-    pedido = get_object_or_404(Pedido, id=pedido_id, comprador=request.user)
-    
-    if pedido.estado == 'P':
+    pedido = get_object_or_404(Pedido.objects.select_related('producto__tienda__artesano'), id=pedido_id, comprador=request.user)
+
+    # La transición P -> CA es condicional para no reponer stock dos veces.
+    with transaction.atomic():
+        cancelado = Pedido.objects.filter(pk=pedido.pk, estado='P').update(estado='CA')
+        if cancelado:
+            devolver_stock(pedido)
+
+    if cancelado:
         producto = pedido.producto
-        producto.stock += pedido.cantidad
-        producto.save()
-        
-        pedido.estado = 'CA'
-        pedido.save()
-        
-        Notificacion.objects.create(
-            usuario=producto.tienda.artesano.user,
-            mensaje=f"El pedido #{pedido.id} de {producto.nombre} fue cancelado por el comprador.",
-            tipo='pedido'
+        notificar(
+            producto.tienda.artesano.user_id,
+            f"El pedido #{pedido.id} de {producto.nombre} fue cancelado por el comprador.",
+            tipo='pedido',
         )
         
         messages.success(request, f"El pedido #{pedido.id} ha sido cancelado correctamente.")
@@ -433,58 +632,142 @@ def mis_favoritos(request):
 @login_required
 @login_required
 def mis_notificaciones(request):
-    notificaciones = Notificacion.objects.filter(usuario=request.user).order_by('-fecha_creacion')
-    
-    # Filtrar notificaciones
-    notificaciones_pedido = notificaciones.filter(tipo='pedido')
-    notificaciones_otras = notificaciones.exclude(tipo='pedido')
-    
-    # Marcar como leídas
-    notificaciones.filter(leida=False).update(leida=True)
-    
+    tipo = _tipo_notificacion(request.GET.get('tipo'))
+    notificaciones = Notificacion.objects.filter(usuario=request.user)
+    if tipo:
+        notificaciones = notificaciones.filter(tipo=tipo)
+    page_obj = CursorPaginator(notificaciones, NOTIFICACIONES_POR_PAGINA, ('-fecha_creacion', '-id')).page(
+        request.GET.get('cursor')
+    )
+
+    # Se marcan como leídas las de esta página, no todas las del usuario. La
+    # plantilla las sigue mostrando como nuevas en esta visita.
+    no_leidas = [n.pk for n in page_obj if not n.leida]
+    if no_leidas:
+        marcar_leidas(request.user.pk, ids=no_leidas)
+
     context = {
-        'notificaciones': notificaciones,
-        'notificaciones_pedido': notificaciones_pedido,
-        'notificaciones_otras': notificaciones_otras,
+        'notificaciones': page_obj,
+        'tipos': Notificacion.TIPO_CHOICES,
+        'tipo': tipo,
+        'ultimo_id': max((n.pk for n in page_obj), default=0),
     }
     return render(request, 'mis_notificaciones.html', context)
 
 
+def _notificacion_json(notificacion):
+    return {
+        'id': notificacion.pk,
+        'mensaje': notificacion.mensaje,
+        'tipo': notificacion.tipo,
+        'url': notificacion.url,
+        'leida': notificacion.leida,
+        'fecha_creacion': notificacion.fecha_creacion.isoformat(),
+    }
+
+
+@login_required
+def notificaciones_nuevas(request):
+    """Notificaciones con id mayor que ?desde=<id> (sin `desde`, las más recientes) y el total sin leer."""
+    desde = _entero(request.GET.get('desde'))
+    tipo = _tipo_notificacion(request.GET.get('tipo'))
+    notificaciones = Notificacion.objects.filter(usuario=request.user)
+    if tipo:
+        notificaciones = notificaciones.filter(tipo=tipo)
+    if desde:
+        nuevas = list(notificaciones.filter(pk__gt=desde).order_by('pk')[:NOTIFICACIONES_POR_PAGINA])
+    else:
+        nuevas = list(notificaciones.order_by('-pk')[:NOTIFICACIONES_POR_PAGINA])[::-1]
+    return JsonResponse({
+        'notificaciones': [_notificacion_json(n) for n in nuevas],
+        'ultimo_id': nuevas[-1].pk if nuevas else desde,
+        'no_leidas': NotificacionesNoLeidas.de(request.user.pk),
+    })
+
+
+@login_required
+@require_POST
+def marcar_notificaciones_leidas(request):
+    """Marca como leídas las sin leer con id <= `hasta` (y >= `desde`, y del `tipo`, si se indican)."""
+    tipo = _tipo_notificacion(request.POST.get('tipo'))
+    marcadas = marcar_leidas(
+        request.user.pk, hasta=_entero(request.POST.get('hasta')) or None,
+        desde=_entero(request.POST.get('desde')) or None, tipo=tipo,
+    )
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse({'marcadas': marcadas, 'no_leidas': NotificacionesNoLeidas.de(request.user.pk)})
+    url = reverse('mis_notificaciones')
+    return redirect(f'{url}?{urlencode({"tipo": tipo})}' if tipo else url)
+
 
 @login_required
 @staff_member_required
 def admin_dashboard(request):
-    total_usuarios = User.objects.count()
-    total_productos = Producto.objects.count()
-    total_tiendas = Tienda.objects.count()
-    
-    # Pendientes de moderación/atención
-    tiendas_pendientes = Tienda.objects.filter(aprobada=False)
-    resenas_pendientes = ResenaDeProducto.objects.filter(aprobada=False, activa=True)
-    tickets_pendientes = SoporteTicket.objects.filter(estado='abierto')
-    reportes_pendientes = ReporteAbuso.objects.filter(estado='pendiente')
-
-    ultimos_pedidos = Pedido.objects.order_by('-fecha_creacion')[:5]
-    ultimos_usuarios = User.objects.order_by('-date_joined')[:5]
-    
+    # Totales mantenidos por señales y ventas consolidadas (core/metricas.py):
+    # ninguna consulta recorre tablas enteras. Las colas se cargan aparte.
+    contadores = metricas.valores()
     context = {
-        'total_usuarios': total_usuarios,
-        'total_productos': total_productos,
-        'total_tiendas': total_tiendas,
-        'tiendas_pendientes_count': tiendas_pendientes.count(),
-        'resenas_pendientes_count': resenas_pendientes.count(),
-        'tickets_pendientes_count': tickets_pendientes.count(),
-        'reportes_pendientes_count': reportes_pendientes.count(),
-        'tiendas_pendientes': tiendas_pendientes, # List
-        'resenas': resenas_pendientes,            # List (renamed to match template expectation if any, usually 'resenas_pendientes' is improved name but template had 'resenas')
-        'tickets': tickets_pendientes,            # List
-        'reportes': reportes_pendientes,          # List
-        'ultimos_pedidos': ultimos_pedidos,
-        'ultimos_usuarios': ultimos_usuarios,
+        'contadores': contadores,
+        'ventas': metricas.resumen_ventas(),
+        'colas': [(cola, titulo, contadores[contador]) for cola, (titulo, contador, *_) in COLAS_MODERACION.items()],
+        'ultimos_pedidos': Pedido.objects.select_related('producto', 'comprador').order_by('-fecha_creacion')[:5],
+        'ultimos_usuarios': User.objects.order_by('-date_joined')[:5],
+        'filtro_pedidos': FiltroPedidosForm(),
     }
     return render(request, 'admin.html', context)
 
 
+# cola -> (título, contador de core/metricas.py, queryset, orden)
+COLAS_MODERACION = {
+    'tiendas': (
+        'Tiendas por aprobar', 'tiendas_pendientes',
+        lambda: Tienda.objects.filter(aprobada=False).select_related('artesano__user'),
+        ('-fecha_creacion', '-id'),
+    ),
+    'resenas': (
+        'Reseñas por aprobar', 'resenas_pendientes',
+        lambda: ResenaDeProducto.objects.filter(aprobada=False, activa=True).select_related('producto', 'autor'),
+        ('-fecha_creacion', '-id'),
+    ),
+    'tickets': (
+        'Tickets de soporte abiertos', 'tickets_abiertos',
+        lambda: SoporteTicket.objects.filter(estado='abierto').select_related('usuario'),
+        ('-fecha_creacion', '-id'),
+    ),
+    'reportes': (
+        'Reportes de abuso pendientes', 'reportes_pendientes',
+        lambda: ReporteAbuso.objects.filter(estado='pendiente').select_related(
+            'reportante', 'content_type',
+        ).prefetch_related('content_object'),
+        ('-fecha_creacion', '-id'),
+    ),
+}
+POR_PAGINA_MODERACION = 20
+
+
+@login_required
+@staff_member_required
+def admin_moderacion(request, cola):
+    """Fragmento HTML con una página de una cola de moderación (lo pide admin.html)."""
+    if cola not in COLAS_MODERACION:
+        raise Http404
+    titulo, _, queryset, orden = COLAS_MODERACION[cola]
+    pagina = CursorPaginator(queryset(), POR_PAGINA_MODERACION, orden).page(request.GET.get('cursor'))
+    return render(request, 'admin_moderacion.html', {'cola': cola, 'titulo': titulo, 'pagina': pagina})
+
+
+@login_required
+@staff_member_required
+def metricas_rendimiento(request):
+    # Solo el proceso que atiende la petición; manage.py metricas_rendimiento los junta todos.
+    return JsonResponse({
+        'activa': getattr(settings, 'INSTRUMENTACION', False),
+        'proceso': os.getpid(),
+        'ventana_minutos': instrumentacion.VENTANA_MINUTOS,
+        'vistas': instrumentacion.combinar([instrumentacion.registro.volcar()]),
+    })
+
+
 # --- VISTAS DEL MÓDULO ADMINISTRATIVO Y COMUNICACIÓN ---
 
 @login_required
@@ -506,10 +789,22 @@ def soporte_view(request):
 @login_required
 def chat_inbox(request):
     """HU-18: Chat Interno (Bandeja)"""
-    conversaciones = Conversacion.objects.filter(
-        Q(participante_1=request.user) | Q(participante_2=request.user)
-    ).order_by('-fecha_actualizacion')
-    return render(request, 'chat_inbox.html', {'conversaciones': conversaciones})
+    def rama(columna, leido_hasta):
+        # No leídos: los mensajes del otro posteriores al marcador de lectura propio.
+        no_leidos = MensajeChat.objects.filter(
+            conversacion=OuterRef('pk'), id__gt=OuterRef(leido_hasta),
+        ).exclude(remitente=request.user).order_by().values('conversacion').annotate(total=Count('*')).values('total')
+        return Conversacion.objects.filter(**{columna: request.user}).select_related(
+            'participante_1', 'participante_2', 'ultimo_mensaje'
+        ).annotate(no_leidos=Coalesce(Subquery(no_leidos), 0))
+
+    # Una rama por columna, cada una con su índice (conv_p1_fecha_idx y
+    # conv_p2_fecha_idx), en vez de un OR entre las dos.
+    ramas = [rama('participante_1', 'leido_hasta_1'), rama('participante_2', 'leido_hasta_2')]
+    page_obj = CursorPaginator(ramas, 30, ('-fecha_actualizacion', '-id')).page(request.GET.get('cursor'))
+    for conv in page_obj:
+        conv.otro = conv.otro_participante(request.user)
+    return render(request, 'chat_inbox.html', {'conversaciones': page_obj})
 
 @login_required
 def chat_thread(request, usuario_id):
@@ -519,10 +814,8 @@ def chat_thread(request, usuario_id):
         return redirect('home')
 
     # Buscar o crear conversación
-    conversacion = Conversacion.objects.filter(
-        (Q(participante_1=request.user) & Q(participante_2=otro_usuario)) |
-        (Q(participante_1=otro_usuario) & Q(participante_2=request.user))
-    ).first()
+    pareja = Conversacion.pareja(request.user.pk, otro_usuario.pk)
+    conversacion = Conversacion.objects.filter(**pareja).first()
 
     if not conversacion:
         # Restriccion: Artesano no puede iniciar chat con Comprador
@@ -531,7 +824,9 @@ def chat_thread(request, usuario_id):
                  messages.error(request, "Los vendedores no pueden iniciar conversaciones con clientes. Debes esperar a que ellos te contacten.")
                  return redirect('home')
 
-        conversacion = Conversacion.objects.create(participante_1=request.user, participante_2=otro_usuario)
+        # Si otra petición la crea a la vez, el índice único hace fallar esta
+        # inserción y get_or_create devuelve la que ganó.
+        conversacion, _ = Conversacion.objects.get_or_create(**pareja)
 
     if request.method == 'POST':
         form = MensajeChatForm(request.POST)
@@ -540,23 +835,171 @@ def chat_thread(request, usuario_id):
             mensaje.conversacion = conversacion
             mensaje.remitente = request.user
             mensaje.save()
-            conversacion.fecha_actualizacion = timezone.now()
-            conversacion.save()
             return redirect('chat_thread', usuario_id=usuario_id)
     else:
         form = MensajeChatForm()
 
-    mensajes = conversacion.mensajes.order_by('fecha_envio')
-    # Marcar leídos
-    mensajes.filter(leido=False).exclude(remitente=request.user).update(leido=True)
+    # Ventana con los mensajes más recientes; ?antes=<id> retrocede por keyset.
+    antes = _entero(request.GET.get('antes')) or None
+    mensajes, hay_anteriores = chat.historial(conversacion, antes)
+    if mensajes and not antes:
+        chat.marcar_leidos(conversacion, request.user.pk, mensajes[-1].pk)
+
+    chat_config = None
+    if not antes:
+        # Solo la ventana más reciente recibe mensajes nuevos en vivo. Con ASGI,
+        # SSE; con WSGI cualquier petición que espere ocupa un worker mientras
+        # dura, así que se sondea cada chat.INTERVALO_SONDEO segundos.
+        asgi = isinstance(request, ASGIRequest)
+        chat_config = {
+            'ultimo_id': mensajes[-1].pk if mensajes else 0,
+            'primero_id': mensajes[0].pk if mensajes else 0,
+            'transporte': 'sse' if asgi else 'sondeo',
+            'intervalo': 0 if asgi else chat.INTERVALO_SONDEO * 1000,
+            'mensajes': reverse('chat_mensajes', args=[conversacion.pk]),
+            'historial': reverse('chat_historial', args=[conversacion.pk]),
+            'stream': reverse('chat_stream', args=[conversacion.pk]),
+            'enviar': reverse('chat_enviar', args=[conversacion.pk]),
+            'leidos': reverse('chat_leidos', args=[conversacion.pk]),
+        }
 
     return render(request, 'chat_thread.html', {
         'conversacion': conversacion,
         'mensajes': mensajes,
+        'hay_anteriores': hay_anteriores,
+        'antes': antes,
+        'leido_hasta': conversacion.leido_por_otro(request.user.pk),
         'form': form,
-        'otro_usuario': otro_usuario
+        'otro_usuario': otro_usuario,
+        'chat_config': chat_config,
+    })
+
+
+def _tipo_notificacion(valor):
+    """`valor` si es uno de Notificacion.TIPO_CHOICES; si no, None (sin filtro)."""
+    return valor if valor in dict(Notificacion.TIPO_CHOICES) else None
+
+
+def _entero(valor):
+    try:
+        return max(int(valor), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+async def _autenticado(request):
+    # login_required no admite vistas async en Django 4.2, y request.user consulta la base.
+    return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+def _participante(request, conversacion_id):
+    return request.user.pk, chat.conversacion_de(request.user, conversacion_id)
+
+
+def _sin_acceso():
+    return JsonResponse({'error': 'No participas en esta conversación.'}, status=403)
+
+
+async def chat_mensajes(request, conversacion_id):
+    """
+    Mensajes posteriores a ?desde=<id>. Con ?esperar=1 y ASGI hace long-poll;
+    con WSGI responde enseguida, porque la espera retendría un worker.
+    """
+    if not await _autenticado(request):
+        return redirect_to_login(request.get_full_path())
+    usuario_id, conversacion = await sync_to_async(_participante)(request, conversacion_id)
+    if conversacion is None:
+        return _sin_acceso()
+    desde = _entero(request.GET.get('desde'))
+    consultar = sync_to_async(chat.mensajes_desde)
+    if not request.GET.get('esperar') or not isinstance(request, ASGIRequest):
+        return JsonResponse(await consultar(conversacion, usuario_id, desde))
+
+    # Suscribirse antes de consultar: un mensaje que llegue entre la consulta
+    # y la espera no se pierde.
+    async with chat.get_broker().suscribir(chat.canal_conversacion(conversacion.pk)) as suscripcion:
+        datos = await consultar(conversacion, usuario_id, desde)
+        if not datos['mensajes'] and await suscripcion.esperar(chat.ESPERA_MAXIMA) is not None:
+            datos = await consultar(conversacion, usuario_id, desde)
+    return JsonResponse(datos)
+
+
+@login_required
+def chat_historial(request, conversacion_id):
+    """Mensajes anteriores a ?antes=<id>, para el botón "Cargar mensajes anteriores"."""
+    conversacion = chat.conversacion_de(request.user, conversacion_id)
+    if conversacion is None:
+        return _sin_acceso()
+    mensajes, hay_mas = chat.historial(conversacion, _entero(request.GET.get('antes')) or None)
+    leido_hasta = conversacion.leido_por_otro(request.user.pk)
+    return JsonResponse({
+        'mensajes': [chat.serializar_mensaje(mensaje, request.user.pk, leido_hasta) for mensaje in mensajes],
+        'hay_mas': hay_mas,
     })
 
+
+async def _eventos_chat(conversacion, usuario_id, desde):
+    consultar = sync_to_async(chat.mensajes_desde)
+    loop = asyncio.get_running_loop()
+    fin = loop.time() + chat.DURACION_STREAM
+    leido_hasta = None
+    async with chat.get_broker().suscribir(chat.canal_conversacion(conversacion.pk)) as suscripcion:
+        yield 'retry: 2000\n\n'
+        while True:
+            datos = await consultar(conversacion, usuario_id, desde)
+            if datos['mensajes']:
+                desde = datos['mensajes'][-1]['id']
+            if datos['mensajes'] or datos['leido_hasta'] != leido_hasta:
+                leido_hasta = datos['leido_hasta']
+                yield f"id: {desde}\ndata: {json.dumps(datos)}\n\n"
+            restante = fin - loop.time()
+            if restante <= 0:
+                break
+            if await suscripcion.esperar(min(restante, chat.LATIDO_STREAM)) is None:
+                yield ': latido\n\n'
+
+
+async def chat_stream(request, conversacion_id):
+    """Server-Sent Events con los mensajes nuevos y los acuses de lectura."""
+    if not await _autenticado(request):
+        return redirect_to_login(request.get_full_path())
+    usuario_id, conversacion = await sync_to_async(_participante)(request, conversacion_id)
+    if conversacion is None:
+        return _sin_acceso()
+    desde = _entero(request.headers.get('Last-Event-ID') or request.GET.get('desde'))
+    response = StreamingHttpResponse(
+        _eventos_chat(conversacion, usuario_id, desde), content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@require_POST
+def chat_enviar(request, conversacion_id):
+    conversacion = chat.conversacion_de(request.user, conversacion_id)
+    if conversacion is None:
+        return _sin_acceso()
+    form = MensajeChatForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errores': form.errors}, status=400)
+    mensaje = form.save(commit=False)
+    mensaje.conversacion = conversacion
+    mensaje.remitente = request.user
+    mensaje.save()
+    return JsonResponse(chat.serializar_mensaje(mensaje, request.user.pk), status=201)
+
+
+@login_required
+@require_POST
+def chat_leidos(request, conversacion_id):
+    conversacion = chat.conversacion_de(request.user, conversacion_id)
+    if conversacion is None:
+        return _sin_acceso()
+    actualizado = chat.marcar_leidos(conversacion, request.user.pk, _entero(request.POST.get('hasta')))
+    return JsonResponse({'actualizado': actualizado})
+
 @login_required
 def reportar_abuso(request, content_type_str, object_id):
     """HU-22: Reportar Producto o Tienda"""
@@ -594,7 +1037,7 @@ def reportar_abuso(request, content_type_str, object_id):
 @login_required
 def seguir_tienda(request, tienda_id):
     """HU-23: Seguir Tienda"""
-    tienda = get_object_or_404(Tienda, id=tienda_id)
+    tienda = get_object_or_404(Tienda.objects.select_related('artesano'), id=tienda_id)
     seguimiento = SeguirTienda.objects.filter(usuario=request.user, tienda=tienda).first()
     
     if seguimiento:
@@ -605,11 +1048,7 @@ def seguir_tienda(request, tienda_id):
         messages.success(request, f"Ahora sigues a {tienda.nombre} 🎉")
         
         # Notificar al artesano
-        Notificacion.objects.create(
-            usuario=tienda.artesano.user,
-            mensaje=f"{request.user.username} comenzó a seguir tu tienda.",
-            tipo='general'
-        )
+        notificar(tienda.artesano.user_id, f"{request.user.username} comenzó a seguir tu tienda.")
     
     # Redirigir a la página desde la que vino si es posible, o a mi_tienda como fallback
     referer = request.META.get('HTTP_REFERER')